@@ -0,0 +1,398 @@
+""" Benchmarks for the heap, the solvers, the distance computations and
+	the SF map loader.
+
+	python benchmarks.py                              run everything
+	python benchmarks.py --only heap sf_map           run matching benchmarks
+	python benchmarks.py --grid-sizes 100 200         smaller grids
+	python benchmarks.py --save-baseline base.json    record a baseline
+	python benchmarks.py --compare base.json          flag regressions
+
+	Every benchmark runs in a fresh child process, so that its peak
+	memory can be read from getrusage.  Setup (building graphs, costs)
+	is done in the child before the clock starts and is not timed;
+	`peak_memory_kb` is how far the child's resident set grew past its
+	high-water mark at the end of setup.  The fastest of --repeat runs
+	is reported.  All random inputs are seeded.  A benchmark that
+	fails is reported and skipped, and the run then exits with 1.
+"""
+from __future__ import print_function
+from collections import OrderedDict
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import sys
+from timeit import default_timer
+
+import numpy as np
+import networkx as nx
+
+import graph_utilities
+import random_termination
+from compiled_graph import ORDERINGS, compile_graph, compiled_grid_graph, node_ordering
+from contraction_hierarchy import build_contraction_hierarchy
+from labeled_heap import LabeledHeap
+from parallel_solver import random_termination_parallel
+
+GRID_SIZES = [100, 200, 500, 1000, 2000]
+CALLER_COUNTS = [10, 100, 1000]
+SCENARIO_COUNTS = [10, 100]
+# the parallel_grid_<n>_<processes> times give the speedup against core count
+PROCESS_COUNTS = [1, 2, 4, 8]
+# the grid the node orderings are compared on, shuffled to start with
+ORDERING_GRID_SIZE = 500
+HEAP_SIZE = 100000
+P = 0.06
+P_CALL_PER_UNIT_TIME = 1.0/360.0
+ALLOWED_DISTANCE = 350.0
+
+def _seed():
+	random.seed(0)
+	np.random.seed(0)
+
+def _grid_costs(n):
+	""" two smooth costs on an n by n grid_graph: the mean distance to,
+		and the fraction beyond n/4 of, eight random points """
+	_seed()
+	callers = np.random.uniform(0, n, size=(8, 2))
+	columns, rows = np.meshgrid(np.arange(n), np.arange(n), indexing='ij')
+	distances = np.sqrt((columns[:,:,None] - callers[:,0])**2 + (rows[:,:,None] - callers[:,1])**2)
+	expected = distances.mean(axis=2)
+	exceeding = (distances > n/4.0).mean(axis=2)
+	cost = { (i, j): expected[i, j] for i in xrange(n) for j in xrange(n) }
+	cost2 = { (i, j): exceeding[i, j] for i in xrange(n) for j in xrange(n) }
+	return cost, cost2
+
+_sf = []
+def _sf_map():
+	""" the largest strongly connected component of the SF map, as the
+		notebooks use: the whole map falls apart into 93 of them, and no
+		node reaches every other, so callers drawn from it leave nodes
+		without a distance """
+	if not _sf:
+		sf = graph_utilities.sf_map()
+		_sf.append(sf.subgraph(max(nx.strongly_connected_components(sf), key=len)).copy())
+	return _sf[0]
+
+def _sf_costs(n_callers=10):
+	sf = _sf_map()
+	_seed()
+	caller_locations = random.sample(sorted(sf.nodes()), n_callers)
+	caller_relative_probabilities = np.ones(n_callers)/n_callers
+	cost = graph_utilities.graph_cost(sf, caller_locations,
+		caller_relative_probabilities, graph_utilities.expected_value)
+	cost2 = graph_utilities.graph_cost(sf, caller_locations,
+		caller_relative_probabilities, graph_utilities.make_exceeding_distance_cost(ALLOWED_DISTANCE))
+	return sf, caller_locations, caller_relative_probabilities, cost, cost2
+
+def heap_push_pop():
+	_seed()
+	values = np.random.random(HEAP_SIZE).tolist()
+	def run():
+		heap = LabeledHeap(xrange(HEAP_SIZE), is_less_than=lambda a,b: values[a] < values[b])
+		while heap:
+			heap.pop()
+	return run
+
+def heap_decrease():
+	_seed()
+	decreases = np.random.randint(0, HEAP_SIZE, size=HEAP_SIZE).tolist()
+	def run():
+		values = np.random.random(HEAP_SIZE).tolist()
+		heap = LabeledHeap(xrange(HEAP_SIZE), is_less_than=lambda a,b: values[a] < values[b])
+		for item in decreases:
+			values[item] *= 0.5
+			heap.reheap_from_decrease_at_item(item)
+	return run
+
+def _solver_setup(solver_name, graph, cost, cost2):
+	if solver_name == 'rt_double':
+		return lambda: random_termination.rt_double(graph, cost2, cost, P)
+	elif solver_name == 'single':
+		return lambda: random_termination.random_termination_single_cost_edgelist(graph, cost, P)
+	elif solver_name == 'double':
+		return lambda: random_termination.random_termination_double_cost_edgelist(graph, cost2, cost, P)
+	elif solver_name == 'continuous':
+		return lambda: random_termination.random_termination_single_cost_edgelist_continuous_call_probability(
+			graph, cost, P_CALL_PER_UNIT_TIME)
+	raise ValueError(solver_name)
+
+def grid_solver(solver_name, n):
+	def setup():
+		graph = graph_utilities.grid_graph(n, n)
+		cost, cost2 = _grid_costs(n)
+		return _solver_setup(solver_name, graph, cost, cost2)
+	return setup
+
+def grid_array_solver(n):
+	def setup():
+		cost, _ = _grid_costs(n)
+		cost = np.array([ [ cost[(i_columns, i_rows)] for i_columns in xrange(n) ] for i_rows in xrange(n) ])
+		return lambda: random_termination.random_termination_grid(cost, P)
+	return setup
+
+def sf_continuous_arrays():
+	sf, _, _, cost, _ = _sf_costs()
+	compiled = compile_graph(sf)
+	cost = compiled.cost_array(cost)
+	p = random_termination.edge_termination_probabilities(compiled, P_CALL_PER_UNIT_TIME)
+	return lambda: random_termination.random_termination_arrays(compiled, cost, p)
+
+def sf_scenario_batch(engine, n_scenarios):
+	""" n_scenarios expected_value scenarios of ten callers on the compiled
+		SF map, solved in lockstep or one heap sweep at a time """
+	def setup():
+		compiled = compile_graph(_sf_map())
+		_seed()
+		callers = np.random.randint(0, compiled.n_nodes, size=(n_scenarios, 10))
+		distances = compiled.distances_from(np.unique(callers))
+		columns = np.searchsorted(np.unique(callers), callers)
+		costs = np.column_stack([ distances[:,scenario_columns].mean(axis=1) for scenario_columns in columns ])
+		if engine == 'lockstep':
+			return lambda: random_termination.random_termination_lockstep(compiled, costs, P)
+		return lambda: [ random_termination.random_termination_arrays(compiled, costs[:,i].copy(), P)
+			for i in xrange(n_scenarios) ]
+	return setup
+
+def sf_probability_drift(engine):
+	""" three of fifty callers' probabilities change on the compiled SF map,
+		for the exceeding_distance cost: re-solved in full or incrementally """
+	def setup():
+		compiled = compile_graph(_sf_map())
+		_seed()
+		callers = np.random.randint(0, compiled.n_nodes, size=50)
+		caller_relative_probabilities = np.random.random(50)
+		caller_relative_probabilities /= caller_relative_probabilities.sum()
+		spec = { 'cost': 'exceeding_distance', 'allowed_distance': ALLOWED_DISTANCE }
+		caller_cost = graph_utilities.CallerCost(compiled.distances_from(callers), caller_relative_probabilities, spec)
+		expected_cost, next_node = random_termination.random_termination_arrays(compiled, caller_cost.cost, P)
+		drifting = np.random.randint(0, 50, size=3)
+		changed_nodes = caller_cost.update(drifting, caller_relative_probabilities[drifting]*1.5)
+		if engine == 'incremental':
+			return lambda: random_termination.random_termination_incremental(compiled, caller_cost.cost, P,
+				expected_cost, next_node, changed_nodes)
+		return lambda: random_termination.random_termination_arrays(compiled, caller_cost.cost, P)
+	return setup
+
+def parallel_grid_solver(n, processes):
+	def setup():
+		cost, _ = _grid_costs(n)
+		compiled = compiled_grid_graph(n, n)
+		cost = np.array([ cost[compiled.node_id(i)] for i in xrange(compiled.n_nodes) ])
+		return lambda: random_termination_parallel(compiled, cost, P, processes)
+	return setup
+
+def node_order(task, graph_name, ordering):
+	""" the array solver, or Dijkstra from 20 sources, on the SF map or on
+		a shuffled grid, with the nodes numbered as they come ('original')
+		or by a compiled_graph.node_ordering method """
+	def setup():
+		if graph_name == 'sf':
+			_, _, _, cost, _ = _sf_costs()
+			compiled = compile_graph(_sf_map(), ordering=None if ordering == 'original' else ordering)
+		else:
+			cost, _ = _grid_costs(ORDERING_GRID_SIZE)
+			compiled = compiled_grid_graph(ORDERING_GRID_SIZE, ORDERING_GRID_SIZE)
+			compiled = compiled.reordered(np.random.permutation(compiled.n_nodes))
+			if ordering != 'original':
+				compiled = compiled.reordered(node_ordering(compiled, ordering))
+		cost = np.array([ cost[compiled.node_id(i)] for i in xrange(compiled.n_nodes) ])
+		if task == 'solver':
+			return lambda: random_termination.random_termination_arrays(compiled, cost, P)
+		_seed()
+		sources = compiled.indices_of(random.sample(sorted(compiled.node_index), 20))
+		return lambda: compiled.distances_from(sources)
+	return setup
+
+def build_grid(n):
+	def setup():
+		return lambda: graph_utilities.grid_graph(n, n)
+	return setup
+
+def build_compiled_grid(n):
+	def setup():
+		return lambda: compiled_grid_graph(n, n)
+	return setup
+
+def sf_solver(solver_name):
+	def setup():
+		sf, _, _, cost, cost2 = _sf_costs()
+		return _solver_setup(solver_name, sf, cost, cost2)
+	return setup
+
+def distances_by_location(n_callers):
+	def setup():
+		sf = _sf_map()
+		_seed()
+		caller_locations = [ random.choice(sorted(sf.nodes())) for _ in xrange(n_callers) ]
+		return lambda: graph_utilities.distances_by_location(sf, caller_locations)
+	return setup
+
+def compiled_distances(engine, n_callers):
+	""" distance columns from n_callers callers on the compiled SF map,
+		by Dijkstra or from its contraction hierarchy """
+	def setup():
+		compiled = compile_graph(_sf_map())
+		source = compiled if engine == 'dijkstra' else build_contraction_hierarchy(compiled)
+		_seed()
+		callers = np.random.randint(0, compiled.n_nodes, size=n_callers)
+		return lambda: source.distances_from(callers)
+	return setup
+
+def summed_pdf():
+	sf, caller_locations, caller_relative_probabilities, cost, _ = _sf_costs()
+	_, edgelist = random_termination.random_termination_single_cost_edgelist(sf, cost, P)
+	direction_subgraph = graph_utilities.make_direction_subgraph(sf, edgelist)
+	# the longest policy path on the map
+	paths = [ graph_utilities.make_path(direction_subgraph, node) for node in sf.nodes() ]
+	path = max(paths, key=len)
+	return lambda: graph_utilities.summed_pdf(sf, path, caller_locations, caller_relative_probabilities, P)
+
+def sf_map():
+	return graph_utilities.sf_map
+
+def collect_benchmarks(grid_sizes, caller_counts):
+	""" RETURNS
+		an ordered dict of benchmark name to setup function.  A setup
+			function prepares the inputs and returns the function to time.
+	"""
+	benchmarks = OrderedDict()
+	benchmarks['heap_push_pop'] = heap_push_pop
+	benchmarks['heap_decrease'] = heap_decrease
+	for solver_name in ['rt_double', 'single', 'double', 'continuous']:
+		for n in grid_sizes:
+			benchmarks['%s_grid_%d' % (solver_name, n)] = grid_solver(solver_name, n)
+		benchmarks['%s_sf' % solver_name] = sf_solver(solver_name)
+	benchmarks['continuous_arrays_sf'] = sf_continuous_arrays
+	for n in grid_sizes:
+		benchmarks['grid_solver_%d' % n] = grid_array_solver(n)
+		for processes in PROCESS_COUNTS:
+			benchmarks['parallel_grid_%d_%d' % (n, processes)] = parallel_grid_solver(n, processes)
+		benchmarks['grid_graph_%d' % n] = build_grid(n)
+		benchmarks['compiled_grid_graph_%d' % n] = build_compiled_grid(n)
+	for n_callers in caller_counts:
+		benchmarks['distances_by_location_%d' % n_callers] = distances_by_location(n_callers)
+		for engine in ['dijkstra', 'hierarchy']:
+			benchmarks['%s_distances_%d' % (engine, n_callers)] = compiled_distances(engine, n_callers)
+	for n_scenarios in SCENARIO_COUNTS:
+		for engine in ['heap', 'lockstep']:
+			benchmarks['%s_sf_scenarios_%d' % (engine, n_scenarios)] = sf_scenario_batch(engine, n_scenarios)
+	for task in ['solver', 'dijkstra']:
+		for graph_name in ['sf', 'grid']:
+			for ordering in ['original'] + ORDERINGS:
+				benchmarks['%s_%s_%s_order' % (task, graph_name, ordering)] = node_order(task, graph_name, ordering)
+	for engine in ['full', 'incremental']:
+		benchmarks['%s_sf_probability_drift' % engine] = sf_probability_drift(engine)
+	benchmarks['summed_pdf'] = summed_pdf
+	benchmarks['sf_map'] = sf_map
+	return benchmarks
+
+def _peak_memory_kb():
+	# ru_maxrss is in kilobytes on linux, and in bytes on os x
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return peak // 1024 if sys.platform == 'darwin' else peak
+
+def _run_in_child(setup, repeat, results):
+	run = setup()
+	memory_before = _peak_memory_kb()
+	times = []
+	for _ in xrange(repeat):
+		start = default_timer()
+		run()
+		times.append(default_timer() - start)
+	results.put({ 'seconds': min(times),
+		'peak_memory_kb': _peak_memory_kb() - memory_before })
+
+def run_benchmark(setup, repeat=1):
+	""" run a benchmark in a child process
+
+		RETURNS
+		a dict with the fastest time in 'seconds', and 'peak_memory_kb',
+			or if the child failed (its traceback goes to stderr) a dict
+			with just its 'error'
+	"""
+	results = multiprocessing.Queue()
+	child = multiprocessing.Process(target=_run_in_child, args=(setup, repeat, results))
+	child.start()
+	child.join()
+	if child.exitcode != 0:
+		return { 'error': "benchmark failed with exit code %d" % child.exitcode }
+	return results.get()
+
+# differences smaller than these are never reported as regressions
+_noise_floor = { 'seconds': 0.01, 'peak_memory_kb': 1024 }
+
+def find_regressions(results, baseline, threshold):
+	""" RETURNS
+		a list of (benchmark name, measure, baseline value, new value) for
+			every time or peak memory more than threshold (a fraction)
+			above its baseline
+	"""
+	regressions = []
+	for name, result in results.items():
+		baseline_result = baseline.get('results', {}).get(name)
+		if baseline_result is None or 'error' in baseline_result or 'error' in result:
+			continue
+		for measure in ['seconds', 'peak_memory_kb']:
+			old = baseline_result[measure]
+			new = result[measure]
+			if new > old*(1 + threshold) and new - old > _noise_floor[measure]:
+				regressions.append((name, measure, old, new))
+	return regressions
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+	parser.add_argument('--only', nargs='+', default=None,
+		help="run only the benchmarks whose names contain one of these strings")
+	parser.add_argument('--grid-sizes', nargs='+', type=int, default=GRID_SIZES)
+	parser.add_argument('--caller-counts', nargs='+', type=int, default=CALLER_COUNTS)
+	parser.add_argument('--repeat', type=int, default=3)
+	parser.add_argument('--save-baseline', metavar='PATH')
+	parser.add_argument('--compare', metavar='PATH')
+	parser.add_argument('--threshold', type=float, default=0.2,
+		help="fractional slowdown or memory growth reported as a regression")
+	args = parser.parse_args(argv)
+
+	benchmarks = collect_benchmarks(args.grid_sizes, args.caller_counts)
+	if args.only:
+		benchmarks = OrderedDict((name, setup) for name, setup in benchmarks.items()
+			if any(pattern in name for pattern in args.only))
+
+	results = OrderedDict()
+	print("%-32s %12s %16s" % ("benchmark", "seconds", "peak memory kb"))
+	failed = []
+	for name, setup in benchmarks.items():
+		results[name] = run_benchmark(setup, args.repeat)
+		if 'error' in results[name]:
+			# recorded and skipped, so one broken benchmark costs only itself
+			failed.append(name)
+			print("%-32s %s" % (name, results[name]['error']))
+		else:
+			print("%-32s %12.4f %16d" % (name, results[name]['seconds'], results[name]['peak_memory_kb']))
+		sys.stdout.flush()
+
+	if args.save_baseline:
+		with open(args.save_baseline, 'w') as baseline_file:
+			json.dump({ 'python': platform.python_version(),
+				'machine': platform.machine(),
+				'numpy': np.__version__,
+				'networkx': nx.__version__,
+				'results': results }, baseline_file, indent=1)
+
+	if args.compare:
+		with open(args.compare) as baseline_file:
+			baseline = json.load(baseline_file)
+		regressions = find_regressions(results, baseline, args.threshold)
+		for name, measure, old, new in regressions:
+			print("REGRESSION %s %s: %g -> %g (%+.0f%%)" % (name, measure, old, new, 100.0*(new - old)/old))
+		if regressions:
+			return 1
+	if failed:
+		print("FAILED %s" % ' '.join(failed))
+		return 1
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
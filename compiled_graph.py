@@ -0,0 +1,673 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+import numpy as np
+import networkx as nx
+
+class CompiledGraph(object):
+	"""
+Holds a directed graph as flat numpy arrays in compressed sparse row (CSR)
+	form, so that the solvers can run on graphs whose arrays live on disk
+	as `np.memmap`s.
+
+Nodes are numbered 0 ... n_nodes-1.  The original node labels are kept
+	in `node_ids`, a 1-d array for scalar labels such as the OSM-style ids
+	of `sf_map`, or a 2-d array with one row per node for tuple labels
+	such as the (column, row) labels of `grid_graph`.
+
+The outgoing edges of node i are
+
+	successor_indices[successor_offsets[i]:successor_offsets[i+1]]
+
+	with weights taken from the same slice of `successor_weights`.
+	The incoming edges are held the same way in `predecessor_offsets`,
+	`predecessor_indices` and `predecessor_weights`, and
+	`predecessor_edges` gives the position of every incoming edge within
+	the successor arrays.
+
+`pos` is an (n_nodes, 2) array of node coordinates, or None.
+
+`profile_weights` is an optional (n_edges, n_profiles) table of further
+	edge weights in successor order, one column per weight profile (the
+	travel times at each hour of the day, say).  `with_profile(k)` is the
+	graph with the weights of profile k, sharing every other array.
+"""
+	array_names = ['node_ids',
+		'successor_offsets', 'successor_indices', 'successor_weights',
+		'predecessor_offsets', 'predecessor_indices', 'predecessor_weights',
+		'predecessor_edges', 'pos', 'profile_weights']
+
+	def __init__(self, node_ids,
+		successor_offsets, successor_indices, successor_weights,
+		predecessor_offsets, predecessor_indices, predecessor_weights,
+		predecessor_edges, pos=None, profile_weights=None):
+
+		self.node_ids = node_ids
+		self.successor_offsets = successor_offsets
+		self.successor_indices = successor_indices
+		self.successor_weights = successor_weights
+		self.predecessor_offsets = predecessor_offsets
+		self.predecessor_indices = predecessor_indices
+		self.predecessor_weights = predecessor_weights
+		self.predecessor_edges = predecessor_edges
+		self.pos = pos
+		self.profile_weights = profile_weights
+		self._node_index = None
+		self._profiles = {}
+
+	@property
+	def n_nodes(self):
+		return len(self.successor_offsets) - 1
+
+	@property
+	def n_edges(self):
+		return len(self.successor_indices)
+
+	@property
+	def n_profiles(self):
+		return 0 if self.profile_weights is None else self.profile_weights.shape[1]
+
+	@property
+	def node_index(self):
+		""" a dict from node label to node index, built on first use """
+		if self._node_index is None:
+			self._node_index = { self.node_id(i): i for i in xrange(self.n_nodes) }
+		return self._node_index
+
+	def node_id(self, index):
+		""" the original label of the node at index """
+		return node_label(self.node_ids, index)
+
+	def indices_of(self, nodes):
+		""" an array of the indices of a list of node labels """
+		return np.array([ self.node_index[node] for node in nodes ], dtype=np.int64)
+
+	def successors(self, index):
+		return self.successor_indices[self.successor_offsets[index]:self.successor_offsets[index+1]]
+
+	def predecessors(self, index):
+		return self.predecessor_indices[self.predecessor_offsets[index]:self.predecessor_offsets[index+1]]
+
+	def cost_array(self, cost, dtype=np.float64):
+		""" turn a dict of node costs, as made by graph_utilities.graph_cost,
+			into an array in node index order """
+		return np.array([ cost[self.node_id(i)] for i in xrange(self.n_nodes) ], dtype=dtype)
+
+	def to_node_dict(self, values):
+		""" turn an array in node index order into a dict keyed by node label """
+		return { self.node_id(i): values[i].tolist() for i in xrange(self.n_nodes) }
+
+	def edgelist(self, next_node):
+		""" turn a next node array, as returned by
+			random_termination.random_termination_arrays, into a list of
+			(node, next node) label pairs """
+		moving_nodes = np.flatnonzero(np.asarray(next_node) >= 0)
+		return [ (self.node_id(i), self.node_id(next_node[i])) for i in moving_nodes ]
+
+	def profile_edge_weights(self, profile, predecessor_order=False):
+		""" profile is a profile number, or 'all'
+
+			RETURNS
+			the edge weights of profile, or the (n_edges, n_profiles) table of
+				all of them, in successor order or, if predecessor_order, in
+				the order of predecessor_indices
+		"""
+		if self.profile_weights is None:
+			raise ValueError("the graph has no weight profiles")
+		weights = self.profile_weights if profile == 'all' else self.profile_weights[:,profile]
+		if predecessor_order:
+			return np.asarray(weights)[np.asarray(self.predecessor_edges)]
+		return weights
+
+	def with_profile(self, profile):
+		""" RETURNS
+			this graph with the edge weights of profile, sharing the node,
+				topology and position arrays.  It is made once per profile and
+				kept, so that whatever is hung on it, a DistanceColumnCache
+				or its node_index, lasts between calls.
+		"""
+		if profile not in self._profiles:
+			graph = CompiledGraph(self.node_ids,
+				self.successor_offsets, self.successor_indices, self.profile_edge_weights(profile),
+				self.predecessor_offsets, self.predecessor_indices, self.profile_edge_weights(profile, True),
+				self.predecessor_edges, self.pos)
+			graph._node_index = self._node_index
+			self._profiles[profile] = graph
+		return self._profiles[profile]
+
+	def distances_from(self, sources, limit=np.inf, profile=None):
+		""" sources is a list or array of node indices
+
+			RETURNS
+			an (n_nodes, len(sources)) array whose column i holds the shortest
+				distance from sources[i] to every node, or inf where a node
+				cannot be reached.  This is graph_utilities.distances_by_location
+				as an array, computed with scipy's Dijkstra on the CSR arrays.
+				Searches stop at distance limit, beyond which nodes are left at inf.
+			profile, if given, is a weight profile to search with, or 'all'
+				for an (n_nodes, len(sources), n_profiles) array of the
+				distances under every profile
+		"""
+		if profile == 'all':
+			return np.dstack([ self.with_profile(k).distances_from(sources, limit) for k in xrange(self.n_profiles) ])
+		if profile is not None:
+			return self.with_profile(profile).distances_from(sources, limit)
+
+		from scipy.sparse import csr_matrix
+		from scipy.sparse.csgraph import dijkstra
+
+		adjacency = csr_matrix(
+			(np.asarray(self.successor_weights), np.asarray(self.successor_indices), np.asarray(self.successor_offsets)),
+			shape=(self.n_nodes, self.n_nodes))
+		return dijkstra(adjacency, directed=True, indices=np.asarray(sources, dtype=np.int64), limit=limit).T
+
+	def distances_to(self, targets, profile=None):
+		""" as distances_from, but column i holds the shortest distance from
+			every node to targets[i], found by searching the reversed graph """
+		if profile == 'all':
+			return np.dstack([ self.with_profile(k).distances_to(targets) for k in xrange(self.n_profiles) ])
+		if profile is not None:
+			return self.with_profile(profile).distances_to(targets)
+
+		from scipy.sparse import csr_matrix
+		from scipy.sparse.csgraph import dijkstra
+
+		reverse_adjacency = csr_matrix(
+			(np.asarray(self.predecessor_weights), np.asarray(self.predecessor_indices), np.asarray(self.predecessor_offsets)),
+			shape=(self.n_nodes, self.n_nodes))
+		return dijkstra(reverse_adjacency, directed=True, indices=np.asarray(targets, dtype=np.int64)).T
+
+	def local_minima(self, cost, chunk_size=1<<20):
+		""" cost is an array of node costs in node index order
+
+			RETURNS
+			an array of the indices of the nodes whose cost is no larger than
+				the cost of any of their successors, including every node
+				without successors.
+
+			The nodes are scanned chunk_size at a time and in index order, so
+				memory-mapped arrays are read sequentially.
+		"""
+		cost = np.asarray(cost)
+		local_minima = []
+		for start in xrange(0, self.n_nodes, chunk_size):
+			stop = min(start + chunk_size, self.n_nodes)
+			offsets = np.asarray(self.successor_offsets[start:stop+1])
+			successor_cost = cost[self.successor_indices[offsets[0]:offsets[-1]]]
+
+			min_successor_cost = np.empty(stop - start)
+			min_successor_cost.fill(np.inf)
+			has_successors = offsets[1:] > offsets[:-1]
+			if has_successors.any():
+				min_successor_cost[has_successors] = np.minimum.reduceat(
+					successor_cost, offsets[:-1][has_successors] - offsets[0])
+
+			local_minima.append(start + np.flatnonzero(cost[start:stop] <= min_successor_cost))
+
+		if not local_minima:
+			return np.zeros(0, dtype=np.int64)
+		return np.concatenate(local_minima)
+
+	def fingerprint(self):
+		""" a sha1 hex digest of the node labels, the edges and their
+			weights, for checking that saved results belong to this graph """
+		digest = hashlib.sha1()
+		for name in ['node_ids', 'successor_offsets', 'successor_indices', 'successor_weights']:
+			array = getattr(self, name)
+			digest.update(str(array.dtype).encode('ascii'))
+			for start in xrange(0, len(array), 1<<20):
+				chunk = array[start:start + (1<<20)]
+				if chunk.dtype == object:
+					# the bytes of an object array are pointers, so hash the labels
+					digest.update(json.dumps(chunk.tolist()).encode('utf-8'))
+				else:
+					digest.update(np.ascontiguousarray(chunk).tobytes())
+		return digest.hexdigest()
+
+	def reordered(self, order):
+		""" order is a permutation of the node indices, as made by
+				node_ordering: order[i] is the index of the node to number i
+
+			RETURNS
+			the same graph with its nodes renumbered.  The node labels and
+				positions move with the nodes, so results turned into labels
+				(to_node_dict, edgelist, node_index) are unchanged; arrays of
+				node indices are translated with order, and back with
+				np.argsort(order).
+		"""
+		order = np.asarray(order, dtype=np.int64)
+		new_index = np.empty(self.n_nodes, dtype=np.int64)
+		new_index[order] = np.arange(self.n_nodes)
+		tails = np.repeat(np.arange(self.n_nodes), np.diff(np.asarray(self.successor_offsets)))
+		return compiled_graph_from_edges(np.asarray(self.node_ids)[order], new_index[tails],
+			new_index[np.asarray(self.successor_indices)], self.successor_weights,
+			None if self.pos is None else np.asarray(self.pos)[order], self.profile_weights)
+
+	def induced_subgraph(self, nodes):
+		""" nodes is a boolean mask over the nodes, or an array of node
+				indices, as made by nodes_in_box, nodes_in_polygon or from
+				strongly_connected_components
+
+			RETURNS
+			the CompiledGraph of those nodes and the edges between them,
+				numbered in the order of their index here, with their labels,
+				positions and profile weights, and the array of the index
+				here of each of its nodes
+		"""
+		keep = np.zeros(self.n_nodes, dtype=bool)
+		keep[nodes] = True
+		parent_indices = np.flatnonzero(keep)
+		new_index = np.cumsum(keep) - 1
+
+		tails = np.repeat(np.arange(self.n_nodes), np.diff(np.asarray(self.successor_offsets)))
+		heads = np.asarray(self.successor_indices)
+		edges = np.flatnonzero(keep[tails] & keep[heads])
+		return compiled_graph_from_edges(np.asarray(self.node_ids)[parent_indices],
+			new_index[tails[edges]], new_index[heads[edges]], np.asarray(self.successor_weights)[edges],
+			None if self.pos is None else np.asarray(self.pos)[parent_indices],
+			None if self.profile_weights is None else np.asarray(self.profile_weights)[edges]), parent_indices
+
+	def nodes_in_box(self, x_min, y_min, x_max, y_max):
+		""" RETURNS
+			a boolean mask of the nodes whose pos lies in the box, (lon, lat)
+				bounds for a geographic graph such as sf_map """
+		pos = self._require_pos()
+		return (pos[:,0] >= x_min) & (pos[:,0] <= x_max) & (pos[:,1] >= y_min) & (pos[:,1] <= y_max)
+
+	def nodes_in_polygon(self, polygon):
+		""" polygon is an (n_vertices, 2) array of the polygon's corners, in
+				the coordinates of pos, a district's outline say
+
+			RETURNS
+			a boolean mask of the nodes whose pos lies inside polygon, by the
+				even-odd rule
+		"""
+		pos = self._require_pos()
+		x, y = pos[:,0], pos[:,1]
+		polygon = np.asarray(polygon, dtype=np.float64)
+		inside = np.zeros(self.n_nodes, dtype=bool)
+		for (x1, y1), (x2, y2) in zip(polygon.tolist(), np.roll(polygon, -1, axis=0).tolist()):
+			if y1 == y2:
+				continue
+			# flip the nodes whose rightward ray crosses this side
+			straddles = (y1 > y) != (y2 > y)
+			inside ^= straddles & (x < x1 + (x2 - x1)*(y - y1)/(y2 - y1))
+		return inside
+
+	def strongly_connected_components(self):
+		""" RETURNS
+			an array of the strongly connected component of every node,
+				numbered from the largest component, 0, down """
+		from scipy.sparse import csr_matrix
+		from scipy.sparse.csgraph import connected_components
+
+		adjacency = csr_matrix((np.ones(self.n_edges), np.asarray(self.successor_indices),
+			np.asarray(self.successor_offsets)), shape=(self.n_nodes, self.n_nodes))
+		_, labels = connected_components(adjacency, directed=True, connection='strong')
+		sizes = np.bincount(labels)
+		rank = np.empty(len(sizes), dtype=np.int64)
+		rank[np.argsort(-sizes, kind='mergesort')] = np.arange(len(sizes))
+		return rank[labels]
+
+	def _require_pos(self):
+		if self.pos is None:
+			raise ValueError("the graph has no node positions")
+		return np.asarray(self.pos, dtype=np.float64)
+
+	def save(self, directory):
+		""" write the graph into directory, one .npy file per array, so that
+			it can be opened again with load_compiled_graph """
+		save_array_directory(directory,
+			{ name: getattr(self, name) for name in self.array_names
+				if getattr(self, name) is not None })
+
+class DistanceColumnCache(object):
+	"""
+Keeps the distance columns of a CompiledGraph warm between scenarios.
+	`columns(caller_indices)` returns the (n_nodes, len(caller_indices))
+	array of distances from each caller, running Dijkstra only for the
+	callers that are not already cached, all in one batch.  At most
+	`max_columns` columns are kept, dropping the least recently used.
+	`warm(caller_indices)` computes columns ahead of asking for them.
+	`misses` counts the columns computed and `hits` the columns that
+	`columns` found already cached.
+	With a `hierarchy` (a contraction_hierarchy.ContractionHierarchy of
+	the same graph) the missing columns are queried from it instead;
+	those distances may differ from Dijkstra's in the last bits.
+	The columns are kept and returned as `dtype`; np.float32 halves their
+	memory, rounding each distance to about 7 significant digits.
+"""
+	def __init__(self, compiled_graph, max_columns=None, hierarchy=None, dtype=np.float64):
+		self.compiled_graph = compiled_graph
+		self.max_columns = max_columns
+		self.hierarchy = hierarchy
+		self.dtype = np.dtype(dtype)
+		self.cache = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def warm(self, caller_indices):
+		""" compute the columns of any of caller_indices not yet cached,
+			ahead of asking for them with columns.  With max_columns, only
+			the last max_columns distinct callers are kept. """
+		caller_indices = list(OrderedDict.fromkeys(int(caller) for caller in caller_indices))
+		if self.max_columns is not None:
+			caller_indices = caller_indices[max(0, len(caller_indices) - self.max_columns):]
+		self._compute(caller_indices)
+		for caller in caller_indices:
+			self._use(caller)
+		self._evict()
+
+	def columns(self, caller_indices):
+		caller_indices = [ int(caller) for caller in caller_indices ]
+		self.hits += sum(1 for caller in caller_indices if caller in self.cache)
+		self._compute(caller_indices)
+		distances = np.empty((self.compiled_graph.n_nodes, len(caller_indices)), dtype=self.dtype)
+		for i, caller in enumerate(caller_indices):
+			distances[:,i] = self._use(caller)
+		self._evict()
+		return distances
+
+	def _compute(self, caller_indices):
+		# misses are counted here, where the columns are computed, and hits
+		#    only in columns, so a column warmed ahead is one miss and then
+		#    a hit each time it is asked for
+		missing = sorted(set(caller for caller in caller_indices if caller not in self.cache))
+		self.misses += len(missing)
+		if missing:
+			source = self.compiled_graph if self.hierarchy is None else self.hierarchy
+			distances = source.distances_from(missing)
+			for i, caller in enumerate(missing):
+				self.cache[caller] = np.ascontiguousarray(distances[:,i], dtype=self.dtype)
+
+	def _use(self, caller):
+		# move to the most recently used end
+		column = self.cache.pop(caller)
+		self.cache[caller] = column
+		return column
+
+	def _evict(self):
+		if self.max_columns is not None:
+			while len(self.cache) > self.max_columns:
+				self.cache.popitem(last=False)
+
+def node_label(node_ids, index):
+	""" the label of the node at index in a node_ids array, as a tuple for
+		2-d node_ids and as a python scalar otherwise """
+	node = node_ids[index]
+	if isinstance(node, tuple):
+		return node
+	if np.ndim(node):
+		return tuple(node.tolist())
+	return node.item() if hasattr(node, 'item') else node
+
+def node_id_array(node_ids):
+	""" node_ids as an array: 2-d for tuple labels all of one length, and
+		a 1-d object array for labels numpy makes no regular array of, such
+		as strings mixed with tuples """
+	try:
+		array = np.asarray(node_ids)
+	except ValueError:
+		array = None
+	if array is None or (array.dtype == object and array.ndim != 1):
+		array = np.empty(len(node_ids), dtype=object)
+		for i, node in enumerate(node_ids):
+			array[i] = node
+	return array
+
+def compiled_graph_from_edges(node_ids, tails, heads, weights, pos=None, profile_weights=None):
+	""" node_ids is a list or array of node labels
+		tails, heads and weights are arrays describing the edges
+			tails[k] -> heads[k] with weight weights[k], as node indices
+		profile_weights is an optional (n_edges, n_profiles) array of the
+			weights of every edge under each weight profile
+
+		RETURNS
+		a CompiledGraph
+	"""
+	n_nodes = len(node_ids)
+	tails = np.asarray(tails, dtype=np.int64)
+	heads = np.asarray(heads, dtype=np.int64)
+	weights = np.asarray(weights, dtype=np.float64)
+
+	successor_order = np.lexsort((heads, tails))
+	successor_offsets = np.zeros(n_nodes + 1, dtype=np.int64)
+	np.cumsum(np.bincount(tails, minlength=n_nodes), out=successor_offsets[1:])
+
+	# the predecessor arrays refer back to the edges in successor order
+	sorted_tails = tails[successor_order]
+	sorted_heads = heads[successor_order]
+	predecessor_edges = np.lexsort((sorted_tails, sorted_heads))
+	predecessor_offsets = np.zeros(n_nodes + 1, dtype=np.int64)
+	np.cumsum(np.bincount(heads, minlength=n_nodes), out=predecessor_offsets[1:])
+
+	return CompiledGraph(
+		node_id_array(node_ids),
+		successor_offsets, sorted_heads, weights[successor_order],
+		predecessor_offsets, sorted_tails[predecessor_edges],
+		weights[successor_order][predecessor_edges],
+		predecessor_edges,
+		None if pos is None else np.asarray(pos, dtype=np.float64),
+		None if profile_weights is None else np.asarray(profile_weights, dtype=np.float64)[successor_order])
+
+# the eight neighbours of a grid cell as (row, column) offsets, in increasing
+#    order of the flat index row*n_columns + column they point to
+GRID_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+def compiled_grid_graph(n_columns, n_rows):
+	""" the graph_utilities.grid_graph(n_columns, n_rows) 8-neighbour grid,
+		written straight into CSR arrays without going through networkx.
+
+		The node (i_columns, i_rows) has index i_rows*n_columns + i_columns,
+			so a cost held as an (n_rows, n_columns) array can be passed to the
+			solvers with cost.ravel().
+	"""
+	s2 = 1.4142135623730951
+	n_nodes = n_columns*n_rows
+	rows, columns = np.divmod(np.arange(n_nodes, dtype=np.int64), n_columns)
+
+	offsets = np.array(GRID_OFFSETS, dtype=np.int64)
+	neighbor_rows = rows[:,None] + offsets[:,0]
+	neighbor_columns = columns[:,None] + offsets[:,1]
+	valid = (neighbor_rows >= 0) & (neighbor_rows < n_rows) & \
+		(neighbor_columns >= 0) & (neighbor_columns < n_columns)
+	del neighbor_rows, neighbor_columns
+
+	offset_steps = offsets[:,0]*n_columns + offsets[:,1]
+	offset_weights = np.where((offsets[:,0] != 0) & (offsets[:,1] != 0), s2, 1.0)
+
+	successor_offsets = np.zeros(n_nodes + 1, dtype=np.int64)
+	np.cumsum(valid.sum(axis=1), out=successor_offsets[1:])
+	valid_nodes, valid_offsets = np.nonzero(valid)
+	successor_indices = valid_nodes + offset_steps[valid_offsets]
+	successor_weights = offset_weights[valid_offsets]
+
+	# every edge has a reverse edge of the same weight, so the predecessor
+	#    arrays are the successor arrays, and the edge into node i from its
+	#    k-th neighbour sits in that neighbour's row at the opposite offset
+	edge_positions = np.cumsum(valid, axis=1) - 1 + successor_offsets[:-1,None]
+	opposite_offsets = len(GRID_OFFSETS) - 1 - valid_offsets
+	predecessor_edges = edge_positions[successor_indices, opposite_offsets]
+	del edge_positions
+
+	node_ids = np.empty((n_nodes, 2), dtype=np.int64)
+	node_ids[:,0] = columns
+	node_ids[:,1] = rows
+
+	return CompiledGraph(node_ids,
+		successor_offsets, successor_indices, successor_weights,
+		successor_offsets, successor_indices, successor_weights,
+		predecessor_edges, node_ids.astype(np.float64))
+
+# the methods of node_ordering
+ORDERINGS = ['hilbert', 'rcm', 'bfs']
+
+def hilbert_index(x, y, bits=16):
+	""" x and y are arrays of coordinates
+
+		RETURNS
+		an array of the distance along a Hilbert curve of 2**bits by 2**bits
+			cells, spread over the bounding box of the points, of the cell
+			holding each point
+	"""
+	side = 1 << bits
+	cells = []
+	for coordinate in (x, y):
+		coordinate = np.asarray(coordinate, dtype=np.float64)
+		low, high = coordinate.min(), coordinate.max()
+		scale = (side - 1)/(high - low) if high > low else 0.0
+		cells.append(((coordinate - low)*scale).astype(np.int64))
+	x, y = cells
+
+	index = np.zeros(len(x), dtype=np.int64)
+	s = side >> 1
+	while s > 0:
+		rx = (x & s) > 0
+		ry = (y & s) > 0
+		index += s*s*((3*rx) ^ ry)
+		# rotate the quadrant so the curve continues in the next one
+		flip = ~ry & rx
+		x = np.where(flip, side - 1 - x, x)
+		y = np.where(flip, side - 1 - y, y)
+		x, y = np.where(ry, x, y), np.where(ry, y, x)
+		s >>= 1
+	return index
+
+def node_ordering(compiled_graph, method):
+	""" method is one of ORDERINGS:
+			'hilbert', nodes in order along a Hilbert curve over pos
+			'rcm', the reverse Cuthill-McKee order of the edges, ignoring
+				their direction
+			'bfs', breadth first from node 0, ignoring edge directions,
+				then from the lowest unreached node and so on
+
+		Numbering nodes that are near each other in the graph closely puts
+			their entries in the CSR and value arrays close together in
+			memory, so a sweep or a Dijkstra search touches fewer cache
+			lines and pages.  Labels such as the OSM ids of sf_map say
+			nothing about where nodes are, so the order networkx hands them
+			out in has no such locality.
+
+		RETURNS
+		an array order for CompiledGraph.reordered
+	"""
+	from scipy.sparse import csr_matrix
+	from scipy.sparse.csgraph import reverse_cuthill_mckee, breadth_first_order
+
+	if method == 'hilbert':
+		if compiled_graph.pos is None:
+			raise ValueError("the graph has no node positions to order by")
+		pos = np.asarray(compiled_graph.pos)
+		return np.argsort(hilbert_index(pos[:,0], pos[:,1]), kind='mergesort')
+
+	n_nodes = compiled_graph.n_nodes
+	adjacency = csr_matrix((np.ones(compiled_graph.n_edges), np.asarray(compiled_graph.successor_indices),
+		np.asarray(compiled_graph.successor_offsets)), shape=(n_nodes, n_nodes))
+	adjacency = (adjacency + adjacency.T).tocsr()
+	if method == 'rcm':
+		return np.asarray(reverse_cuthill_mckee(adjacency, symmetric_mode=True), dtype=np.int64)
+	if method == 'bfs':
+		reached = np.zeros(n_nodes, dtype=bool)
+		order = []
+		for start in xrange(n_nodes):
+			if not reached[start]:
+				component = breadth_first_order(adjacency, start, directed=False, return_predecessors=False)
+				reached[component] = True
+				order.append(component)
+		return np.concatenate(order).astype(np.int64) if order else np.zeros(0, dtype=np.int64)
+	raise ValueError("unknown ordering %r" % method)
+
+def compile_graph(graph, weight='weight', ordering=None, profiles=None):
+	""" graph is a networkx DiGraph
+		weight is the name of the edge attribute holding the edge weight
+		profiles, if given, is a list of the names of further edge
+			attributes to keep as weight profiles, in profile order
+		ordering, if given, is a node_ordering method to number the nodes by,
+			rather than in the order graph lists them
+
+		RETURNS
+		a CompiledGraph with the same nodes and edges as graph, keeping
+			the 'pos' node attribute when every node has one
+	"""
+	node_ids = list(graph.nodes())
+	node_index = { node: i for i, node in enumerate(node_ids) }
+
+	edges = list(graph.edges(data=True))
+	tails = np.array([ node_index[u] for u, _, _ in edges ], dtype=np.int64)
+	heads = np.array([ node_index[v] for _, v, _ in edges ], dtype=np.int64)
+	weights = np.array([ data.get(weight, 1.0) for _, _, data in edges ], dtype=np.float64)
+	profile_weights = None
+	if profiles is not None:
+		profile_weights = np.array([ [ data[profile] for profile in profiles ] for _, _, data in edges ],
+			dtype=np.float64).reshape(len(edges), len(profiles))
+
+	pos = nx.get_node_attributes(graph, 'pos')
+	if len(pos) == len(node_ids):
+		pos = [ pos[node] for node in node_ids ]
+	else:
+		pos = None
+
+	compiled_graph = compiled_graph_from_edges(node_ids, tails, heads, weights, pos, profile_weights)
+	if ordering is not None:
+		order = node_ordering(compiled_graph, ordering)
+		compiled_graph = compiled_graph.reordered(order)
+		node_index = { node_ids[old_index]: i for i, old_index in enumerate(order.tolist()) }
+	compiled_graph._node_index = node_index
+	return compiled_graph
+
+def load_compiled_graph(directory, mmap_mode='r'):
+	""" open a graph written by CompiledGraph.save.  By default every
+		array is memory-mapped rather than read into memory. """
+	arrays, _ = load_array_directory(directory, mmap_mode)
+	return CompiledGraph(**{ name: arrays.get(name) for name in CompiledGraph.array_names })
+
+def save_array_directory(directory, arrays, metadata=None):
+	""" write a dict of arrays into directory as name.npy files, with
+		metadata (a json-able dict) in metadata.json
+
+		An object array, such as the node_ids of a graph with labels of
+			mixed types, can be neither memory-mapped nor loaded without
+			pickle, so it is written as a json list in name.json instead.
+	"""
+	if not os.path.isdir(directory):
+		os.makedirs(directory)
+	json_arrays = []
+	for name, array in arrays.items():
+		array = np.asarray(array)
+		if array.dtype == object:
+			with open(os.path.join(directory, name + '.json'), 'w') as array_file:
+				json.dump(array.tolist(), array_file)
+			json_arrays.append(name)
+		else:
+			np.save(os.path.join(directory, name + '.npy'), array)
+	with open(os.path.join(directory, 'metadata.json'), 'w') as metadata_file:
+		json.dump(dict(metadata or {}, arrays=sorted(arrays.keys()), json_arrays=sorted(json_arrays)),
+			metadata_file)
+
+def load_array_directory(directory, mmap_mode='r'):
+	""" RETURNS
+		the arrays and metadata written by save_array_directory.  The
+			arrays written as json are read into memory as object arrays.
+	"""
+	with open(os.path.join(directory, 'metadata.json')) as metadata_file:
+		metadata = json.load(metadata_file)
+	json_arrays = set(metadata.get('json_arrays', []))
+	arrays = {}
+	for name in metadata['arrays']:
+		if name in json_arrays:
+			with open(os.path.join(directory, name + '.json')) as array_file:
+				values = json.load(array_file)
+			array = np.empty(len(values), dtype=object)
+			for i, value in enumerate(values):
+				# json has no tuples, so tuple labels come back as lists
+				array[i] = tuple(value) if isinstance(value, list) else value
+			arrays[name] = array
+		else:
+			arrays[name] = np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode)
+	return arrays, metadata
+
+def open_memmap(path, shape, dtype=np.float64):
+	""" create a new .npy file at path and return it as a writable memmap,
+		for use as a solver output array """
+	return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
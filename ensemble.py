@@ -0,0 +1,203 @@
+import numpy as np
+
+import graph_utilities
+from compiled_graph import DistanceColumnCache
+from random_termination import random_termination_arrays
+
+class StreamingQuantile(object):
+	"""
+Estimates the q-quantile of a stream of arrays elementwise, with the P^2
+	algorithm of Jain and Chlamtac: five markers per element, adjusted by
+	piecewise-parabolic interpolation as observations arrive, so the
+	memory used does not grow with the number of observations.
+	The estimate is exact for the first five observations.
+"""
+	def __init__(self, shape, q):
+		self.q = q
+		self.count = 0
+		self.first = []
+		self.heights = np.empty(shape + (5,))
+		self.positions = np.tile(np.arange(1.0, 6.0), shape + (1,))
+		self.desired = np.array([1.0, 1 + 2*q, 1 + 4*q, 3 + 2*q, 5.0])
+		self.increments = np.array([0.0, q/2.0, q, (1 + q)/2.0, 1.0])
+
+	def update(self, x):
+		x = np.asarray(x, dtype=np.float64)
+		self.count += 1
+		if self.count <= 5:
+			self.first.append(x.copy())
+			if self.count == 5:
+				self.heights[...] = np.sort(np.stack(self.first, axis=-1), axis=-1)
+				self.first = []
+			return
+
+		h = self.heights
+		n = self.positions
+
+		# find the cell k holding x, widening the outer markers if needed
+		h[...,0] = np.minimum(h[...,0], x)
+		h[...,4] = np.maximum(h[...,4], x)
+		k = np.clip((x[...,None] >= h[...,1:4]).sum(axis=-1), 0, 3)
+		n += np.arange(5) > k[...,None]
+		self.desired = self.desired + self.increments
+
+		for i in (1, 2, 3):
+			delta = self.desired[i] - n[...,i]
+			move = ((delta >= 1) & (n[...,i+1] - n[...,i] > 1)) | ((delta <= -1) & (n[...,i-1] - n[...,i] < -1))
+			if not move.any():
+				continue
+			s = np.where(delta >= 0, 1.0, -1.0)
+
+			with np.errstate(divide='ignore', invalid='ignore'):
+				parabolic = h[...,i] + s/(n[...,i+1] - n[...,i-1])*(
+					(n[...,i] - n[...,i-1] + s)*(h[...,i+1] - h[...,i])/(n[...,i+1] - n[...,i]) +
+					(n[...,i+1] - n[...,i] - s)*(h[...,i] - h[...,i-1])/(n[...,i] - n[...,i-1]))
+				h_neighbor = np.where(s > 0, h[...,i+1], h[...,i-1])
+				n_neighbor = np.where(s > 0, n[...,i+1], n[...,i-1])
+				linear = h[...,i] + s*(h_neighbor - h[...,i])/(n_neighbor - n[...,i])
+
+			use_parabolic = (h[...,i-1] < parabolic) & (parabolic < h[...,i+1])
+			h[...,i] = np.where(move, np.where(use_parabolic, parabolic, linear), h[...,i])
+			n[...,i] = np.where(move, n[...,i] + s, n[...,i])
+
+	def estimate(self):
+		if self.count == 0:
+			return np.full(self.heights.shape[:-1], np.nan)
+		if self.count < 5:
+			return np.percentile(np.stack(self.first, axis=-1), 100*self.q, axis=-1)
+		if self.count == 5:
+			return np.percentile(self.heights, 100*self.q, axis=-1)
+		return self.heights[...,2].copy()
+
+class EnsembleStatistics(object):
+	"""
+Aggregates the solutions of many scenarios on one compiled graph without
+	keeping them:
+
+	* `mean_expected_cost()` and `std_expected_cost()` of every node,
+		kept with Welford's running update.
+	* `quantiles()`, a dict from q to the estimated q-quantile of the
+		expected cost of every node, from a StreamingQuantile each.
+	* `policy_agreement()`, for every node the fraction of scenarios in
+		which it made its most common choice (to move along one of its
+		edges, or to stay), and `modal_next_node()`, that choice.
+"""
+	def __init__(self, compiled_graph, quantiles=(0.05, 0.5, 0.95)):
+		self.compiled_graph = compiled_graph
+		n_nodes = compiled_graph.n_nodes
+		self.count = 0
+		self.mean = np.zeros(n_nodes)
+		self.m2 = np.zeros(n_nodes)
+		self.quantile_estimators = [ StreamingQuantile((n_nodes,), q) for q in quantiles ]
+
+		offsets = np.asarray(compiled_graph.successor_offsets)
+		self._tails = np.repeat(np.arange(n_nodes, dtype=np.int64), np.diff(offsets))
+		# edges are sorted by tail and then head, so these keys are sorted too
+		self._edge_keys = self._tails*n_nodes + np.asarray(compiled_graph.successor_indices)
+		self.edge_counts = np.zeros(compiled_graph.n_edges, dtype=np.int64)
+		self.stay_counts = np.zeros(n_nodes, dtype=np.int64)
+
+	def update(self, expected_cost, next_node):
+		self.count += 1
+		delta = expected_cost - self.mean
+		self.mean += delta/self.count
+		self.m2 += delta*(expected_cost - self.mean)
+		for estimator in self.quantile_estimators:
+			estimator.update(expected_cost)
+
+		next_node = np.asarray(next_node)
+		moving = np.flatnonzero(next_node >= 0)
+		edges = np.searchsorted(self._edge_keys, moving*self.compiled_graph.n_nodes + next_node[moving])
+		np.add.at(self.edge_counts, edges, 1)
+		self.stay_counts[next_node < 0] += 1
+
+	def mean_expected_cost(self):
+		return self.mean.copy()
+
+	def std_expected_cost(self):
+		if self.count < 2:
+			return np.zeros_like(self.mean)
+		return np.sqrt(self.m2/(self.count - 1))
+
+	def quantiles(self):
+		return { estimator.q: estimator.estimate() for estimator in self.quantile_estimators }
+
+	def _most_common_edge(self):
+		offsets = np.asarray(self.compiled_graph.successor_offsets)
+		has_edges = offsets[1:] > offsets[:-1]
+		# within each node's run of edges, the most used edge sorts last
+		edge_order = np.lexsort((self.edge_counts, self._tails))
+		edge_argmax = np.full(self.compiled_graph.n_nodes, -1, dtype=np.int64)
+		edge_argmax[has_edges] = edge_order[offsets[1:][has_edges] - 1]
+		edge_max = np.zeros(self.compiled_graph.n_nodes, dtype=np.int64)
+		edge_max[has_edges] = self.edge_counts[edge_argmax[has_edges]]
+		return edge_max, edge_argmax
+
+	def policy_agreement(self):
+		edge_max, _ = self._most_common_edge()
+		return np.maximum(edge_max, self.stay_counts)/float(max(self.count, 1))
+
+	def modal_next_node(self):
+		""" the node each node most often moved to, or -1 where staying put
+			was the most common choice """
+		edge_max, edge_argmax = self._most_common_edge()
+		modal = np.full(self.compiled_graph.n_nodes, -1, dtype=np.int64)
+		moves = edge_max > self.stay_counts
+		modal[moves] = np.asarray(self.compiled_graph.successor_indices)[edge_argmax[moves]]
+		return modal
+
+def draw_caller_sets(node_weights, n_callers, n_scenarios, seed=None):
+	""" node_weights is an array of the relative rate of calls at each node
+
+		RETURNS
+		an (n_scenarios, n_callers) array of caller node indices, drawn with
+			replacement in proportion to node_weights, like the
+			np.random.choice draws of the notebooks
+	"""
+	node_weights = np.asarray(node_weights, dtype=np.float64)
+	random_state = np.random.RandomState(seed)
+	return random_state.choice(len(node_weights), size=(n_scenarios, n_callers),
+		p=node_weights/node_weights.sum())
+
+def scenario_ensemble(compiled_graph, node_weights, n_callers, n_scenarios, cost_spec, p,
+	quantiles=(0.05, 0.5, 0.95), seed=None, distance_cache=None, callback=None, dtype=np.float64):
+	""" compiled_graph is a compiled_graph.CompiledGraph
+		node_weights is an array of the relative rate of calls at each node
+		n_callers callers are drawn for each of n_scenarios scenarios, and
+			given equal caller_relative_probabilities
+		cost_spec is as for graph_utilities.distance_matrix_cost
+		p is the probability that the call arrives after each move
+		distance_cache is an optional compiled_graph.DistanceColumnCache,
+			to share distance columns with other ensembles on the same graph
+		callback, if given, is called as callback(scenario_index, callers,
+			statistics) after every scenario, and may stop the ensemble early
+			by returning False
+		dtype is the storage type of the distance columns and of each
+			scenario's cost and expected cost when no distance_cache is
+			given; np.float32 fits twice as many columns in memory, while the
+			running statistics stay float64
+
+		Dijkstra is run once for every distinct caller in the ensemble, in
+			one batch up front; each scenario's cost is then assembled from
+			those shared columns, solved with random_termination_arrays and
+			folded into the running statistics.
+
+		RETURNS
+		an EnsembleStatistics
+	"""
+	caller_sets = draw_caller_sets(node_weights, n_callers, n_scenarios, seed)
+	if distance_cache is None:
+		distance_cache = DistanceColumnCache(compiled_graph, dtype=dtype)
+	distance_cache.warm(np.unique(caller_sets))
+
+	caller_relative_probabilities = np.ones(n_callers)/n_callers
+	statistics = EnsembleStatistics(compiled_graph, quantiles)
+	for scenario_index, callers in enumerate(caller_sets):
+		distances = distance_cache.columns(callers)
+		cost = graph_utilities.distance_matrix_cost(distances, caller_relative_probabilities, cost_spec)
+		expected_cost, next_node = random_termination_arrays(compiled_graph, cost, p)
+		statistics.update(expected_cost, next_node)
+
+		if callback is not None and callback(scenario_index, callers, statistics) is False:
+			break
+	return statistics
@@ -0,0 +1,176 @@
+import numpy as np
+
+# bounds within this relative distance of a threshold are not trusted to
+#    decide it, since they are differences of rounded distances
+_RELATIVE_SLACK = 1e-9
+
+class LandmarkDistances(object):
+	"""
+Distances between every node and a few landmark nodes of a CompiledGraph,
+	used to bound node-to-caller distances with the triangle inequality
+	instead of running Dijkstra from every caller (the ALT bounds).
+
+	* `from_landmarks[v, l]` is the distance from landmark l to node v.
+	* `to_landmarks[v, l]` is the distance from node v to landmark l.
+
+For a caller c and a node v, every landmark l gives
+
+	d(c, v) >= d(l, v) - d(l, c)
+	d(c, v) >= d(c, l) - d(v, l)
+	d(c, v) <= d(c, l) + d(l, v)
+"""
+	def __init__(self, compiled_graph, landmarks, from_landmarks, to_landmarks):
+		self.compiled_graph = compiled_graph
+		self.landmarks = landmarks
+		self.from_landmarks = from_landmarks
+		self.to_landmarks = to_landmarks
+
+	def bounds(self, caller_indices):
+		""" RETURNS
+			lower, upper: (n_nodes, len(caller_indices)) arrays bounding the
+				distance from each caller to every node, as
+				distances_by_location would compute it
+		"""
+		caller_indices = np.asarray(caller_indices, dtype=np.int64)
+		shape = (self.compiled_graph.n_nodes, len(caller_indices))
+		lower = np.zeros(shape)
+		upper = np.empty(shape)
+		upper.fill(np.inf)
+
+		with np.errstate(invalid='ignore'):
+			for l in xrange(len(self.landmarks)):
+				from_landmark = self.from_landmarks[:,l]
+				to_landmark = self.to_landmarks[:,l]
+				# inf - inf gives nan, which fmax and fmin ignore
+				np.fmax(lower, from_landmark[:,None] - from_landmark[caller_indices], out=lower)
+				np.fmax(lower, to_landmark[caller_indices] - to_landmark[:,None], out=lower)
+				np.fmin(upper, to_landmark[caller_indices] + from_landmark[:,None], out=upper)
+		return lower, upper
+
+def build_landmarks(compiled_graph, n_landmarks, seed=None):
+	""" choose n_landmarks landmarks by farthest-point selection, starting
+		from a random node: each new landmark is the reachable node farthest
+		from the landmarks already chosen
+
+		RETURNS
+		a LandmarkDistances
+	"""
+	random_state = np.random.RandomState(seed)
+	landmarks = [ int(random_state.randint(compiled_graph.n_nodes)) ]
+	from_landmarks = compiled_graph.distances_from(landmarks)
+	while len(landmarks) < n_landmarks:
+		nearest = from_landmarks.min(axis=1)
+		nearest[~np.isfinite(nearest)] = -1
+		landmarks.append(int(np.argmax(nearest)))
+		from_landmarks = np.hstack([from_landmarks, compiled_graph.distances_from(landmarks[-1:])])
+	to_landmarks = compiled_graph.distances_to(landmarks)
+	return LandmarkDistances(compiled_graph, np.array(landmarks), from_landmarks, to_landmarks)
+
+def _pairs_to_search(estimate, half_width, probabilities, tolerance):
+	""" RETURNS
+		a boolean array marking the (node, caller) pairs whose distances
+			must be searched for, so that the error left at every node,
+			the sum of probabilities*half_width over the pairs not
+			searched, is at most tolerance times its estimated cost.  The
+			pairs with the largest errors are searched first.
+	"""
+	error = half_width*probabilities
+	# a pair with no upper bound has no estimate, and is always searched
+	bounded = np.isfinite(error)
+	error[~bounded | (probabilities == 0)] = 0.0
+	budget = tolerance*np.dot(np.where(bounded, estimate, 0.0), probabilities)
+	order = np.argsort(error, axis=1)
+	kept_error = np.cumsum(np.take_along_axis(error, order, axis=1), axis=1)
+	search = np.empty(error.shape, dtype=bool)
+	np.put_along_axis(search, order, kept_error > budget[:,None], axis=1)
+	return search | ~bounded
+
+def landmark_cost(landmark_distances, caller_indices, caller_relative_probabilities, cost_spec,
+	tolerance=0.05, chunk_size=64):
+	""" landmark_distances is a LandmarkDistances
+		caller_indices is an array of caller node indices
+		caller_relative_probabilities is an array of their probabilities
+		cost_spec is as for graph_utilities.distance_matrix_cost
+		tolerance is the error allowed in the 'expected_value' cost of a
+			node, as a fraction of that cost
+		chunk_size is the number of callers whose bounds are held at once
+
+		An approximate graph_utilities.distance_matrix_cost, which decides
+			every (node, caller) pair from the landmark bounds where it can
+			and runs Dijkstra only for the callers with pairs left over,
+			and then no farther than those pairs:
+		* for 'exceeding_distance', a pair is decided when its bounds lie
+			on one side of the allowed distance.  Callers with undecided
+			pairs are searched out to the allowed distance, so the cost
+			returned is exact.
+		* for 'expected_value', a distance is estimated by the midpoint of
+			its bounds.  At every node the pairs with the widest bounds
+			are searched until the error left is within tolerance of the
+			node's cost (0.05 gives costs good to 5%), so that the pairs
+			near a caller, whose bounds are relatively wide but whose
+			error is small, are rarely searched.  Callers with pairs to
+			search are searched out to the largest upper bound among them,
+			which is far enough to reach them all, and every node the
+			search reaches gets its exact distance.
+
+		Callers are taken chunk_size at a time, so the bounds take
+			n_nodes*chunk_size floats however many callers there are.
+
+		RETURNS
+		cost, an array of the (approximate) cost of every node
+		cost_error, an array bounding |cost - exact cost| at every node
+		exact_callers, the positions in caller_indices that were searched
+	"""
+	compiled_graph = landmark_distances.compiled_graph
+	caller_indices = np.asarray(caller_indices, dtype=np.int64)
+	caller_relative_probabilities = np.asarray(caller_relative_probabilities, dtype=np.float64)
+	if cost_spec['cost'] not in ('exceeding_distance', 'expected_value'):
+		raise ValueError("unknown cost %r" % cost_spec['cost'])
+
+	cost = np.zeros(compiled_graph.n_nodes)
+	cost_error = np.zeros(compiled_graph.n_nodes)
+	exact_callers = []
+	for start in xrange(0, len(caller_indices), chunk_size):
+		chunk = slice(start, start + chunk_size)
+		lower, upper = landmark_distances.bounds(caller_indices[chunk])
+		probabilities = caller_relative_probabilities[chunk]
+
+		if cost_spec['cost'] == 'exceeding_distance':
+			allowed_distance = cost_spec['allowed_distance']
+			slack = _RELATIVE_SLACK*max(1.0, abs(allowed_distance))
+			exceeds = lower > allowed_distance + slack
+			undecided = ~exceeds & ~(upper <= allowed_distance - slack)
+			searched = np.flatnonzero(undecided.any(axis=0))
+			if len(searched):
+				distances = compiled_graph.distances_from(caller_indices[chunk][searched], limit=allowed_distance)
+				undecided = undecided[:,searched]
+				column_exceeds = exceeds[:,searched]
+				column_exceeds[undecided] = distances[undecided] > allowed_distance
+				exceeds[:,searched] = column_exceeds
+			cost += np.dot(exceeds, probabilities)
+
+		else:
+			with np.errstate(invalid='ignore'):
+				estimate = 0.5*(lower + upper)
+				half_width = 0.5*(upper - lower)
+			undecided = _pairs_to_search(estimate, half_width, np.abs(probabilities), tolerance)
+			searched = np.flatnonzero(undecided.any(axis=0))
+			if len(searched):
+				undecided = undecided[:,searched]
+				# the upper bounds are sums of rounded distances, so leave some
+				#    slack for a distance rounded the other way
+				limit = upper[:,searched][undecided].max()*(1 + _RELATIVE_SLACK)
+				distances = compiled_graph.distances_from(caller_indices[chunk][searched], limit=limit)
+				# an undecided pair the search did not reach has no path
+				reached = np.isfinite(distances) | undecided
+				column_estimate = estimate[:,searched]
+				column_half_width = half_width[:,searched]
+				column_estimate[reached] = distances[reached]
+				column_half_width[reached] = 0.0
+				estimate[:,searched] = column_estimate
+				half_width[:,searched] = column_half_width
+			cost += np.dot(estimate, probabilities)
+			cost_error += np.dot(half_width, np.abs(probabilities))
+		exact_callers.append(start + searched)
+
+	return cost, cost_error, np.concatenate(exact_callers) if exact_callers else np.zeros(0, dtype=np.int64)
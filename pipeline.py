@@ -0,0 +1,220 @@
+import numpy as np
+
+import graph_utilities
+from compiled_graph import DistanceColumnCache
+from random_termination import random_termination_arrays, random_termination_anytime, random_termination_incremental
+from solver_results import solver_result_from_arrays
+
+class PipelineResult(object):
+	"""
+Everything random_termination_pipeline computed for one scenario, kept as
+	arrays in node index order:
+
+	* `distances`, the (n_nodes, n_callers) distances from the callers,
+	* `cost`, the cost of every node,
+	* `expected_cost` and `next_node`, as returned by
+		random_termination.random_termination_arrays,
+	* `solve_report`, the report of random_termination_anytime when the
+		scenario was solved approximately, or None.
+
+The dict forms used by the networkx code (`expected_cost_dict`,
+	`edgelist`) and node labels are only built when asked for.
+"""
+	def __init__(self, compiled_graph, caller_indices, caller_relative_probabilities,
+		cost_spec, p, distances, cost, expected_cost, next_node):
+
+		self.compiled_graph = compiled_graph
+		self.caller_indices = caller_indices
+		self.caller_relative_probabilities = caller_relative_probabilities
+		self.cost_spec = cost_spec
+		self.p = p
+		self.distances = distances
+		self.cost = cost
+		self.expected_cost = expected_cost
+		self.next_node = next_node
+		self.solve_report = None
+
+	def best_node(self):
+		""" the index of the node with the lowest expected cost """
+		return int(np.argmin(self.expected_cost))
+
+	def path(self, start):
+		""" the array of node indices start's policy moves through, ending
+			at the node it stays at """
+		return policy_path(self.next_node, start)
+
+	def path_distance_pdf(self, path):
+		""" as graph_utilities.make_pdf(graph_utilities.summed_pdf(...)) for
+			a path of node indices, from the distances already computed """
+		return path_distance_pdf(self.distances, self.caller_relative_probabilities, path, self.p)
+
+	def expected_cost_dict(self):
+		return self.compiled_graph.to_node_dict(self.expected_cost)
+
+	def edgelist(self):
+		return self.compiled_graph.edgelist(self.next_node)
+
+	def reweight(self, callers, caller_relative_probabilities, stats=None):
+		""" callers is an array of caller positions, indices into
+				caller_indices
+			caller_relative_probabilities is an array of their new
+				probabilities
+
+			The same scenario with a few callers' probabilities changed: the
+				cost is updated with graph_utilities.CallerCost and only the
+				nodes it changed are re-solved, with
+				random_termination.random_termination_incremental.
+
+			RETURNS
+			a new PipelineResult
+		"""
+		caller_cost = graph_utilities.CallerCost(self.distances, self.caller_relative_probabilities,
+			self.cost_spec, self.cost)
+		changed_nodes = caller_cost.update(callers, caller_relative_probabilities)
+		cost = caller_cost.cost
+		expected_cost, next_node, _ = random_termination_incremental(self.compiled_graph, cost, self.p,
+			self.expected_cost, self.next_node, changed_nodes, stats)
+		return PipelineResult(self.compiled_graph, self.caller_indices, caller_cost.caller_relative_probabilities,
+			self.cost_spec, self.p, self.distances, cost, expected_cost, next_node)
+
+	def solver_result(self, **metadata):
+		""" RETURNS
+			a solver_results.SolverResult, to save """
+		return solver_result_from_arrays(self.compiled_graph, self.expected_cost, self.next_node,
+			self.p, self.cost_spec, **metadata)
+
+def policy_path(next_node, start):
+	""" next_node is an array as returned by
+			random_termination.random_termination_arrays
+		start is a node index
+
+		RETURNS
+		an array of the node indices start's policy moves through, the
+			array counterpart of graph_utilities.make_path
+	"""
+	path = [int(start)]
+	# a policy never revisits a node, so this bound is only a safeguard
+	while next_node[path[-1]] >= 0 and len(path) <= len(next_node):
+		path.append(int(next_node[path[-1]]))
+	return np.array(path, dtype=np.int64)
+
+def path_distance_pdf(distances, caller_relative_probabilities, path, p):
+	""" distances is an (n_nodes, n_callers) array of the distances from the
+			callers
+		caller_relative_probabilities is an array of n_callers probabilities
+		path is an array of node indices, as returned by policy_path
+		p is the probability that the call arrives after each move
+
+		RETURNS
+		the distinct distances to a call, sorted, and the probability of
+			each, as graph_utilities.make_pdf of graph_utilities.summed_pdf
+	"""
+	path = np.asarray(path, dtype=np.int64)
+	caller_relative_probabilities = np.asarray(caller_relative_probabilities, dtype=np.float64)
+	n = len(path)
+	if n <= 2:
+		path = path[-1:]
+		ending_probabilities = np.ones(1)
+	else:
+		ending_probabilities = p*(1-p)**(np.arange(n) - 1.0)
+		ending_probabilities[0] = 0.0
+		ending_probabilities[-1] = (1-p)**(n-2)
+
+	path_distances = distances[path].ravel()
+	weights = np.outer(ending_probabilities, caller_relative_probabilities).ravel()
+	distance_values, inverse = np.unique(path_distances, return_inverse=True)
+	return distance_values, np.bincount(inverse.ravel(), weights=weights, minlength=len(distance_values))
+
+def random_termination_pipeline(compiled_graph, caller_indices, caller_relative_probabilities,
+	cost_spec, p, distance_cache=None, stats=None, dtype=np.float64, epsilon=None, relative=False,
+	time_budget=None):
+	""" compiled_graph is a compiled_graph.CompiledGraph
+		caller_indices is an array of the node indices calls come from
+		caller_relative_probabilities is an array of the probability of a
+			call coming from each of them
+		cost_spec is as for graph_utilities.distance_matrix_cost
+		p is the probability that the call arrives after each move
+		distance_cache is an optional compiled_graph.DistanceColumnCache to
+			take the distance columns from
+		stats is an optional solver_stats.SolverStats to fill in
+		dtype is the storage type of the distances, cost and expected cost
+			when no distance_cache is given (which otherwise decides it):
+			np.float32 halves their memory, see precision_report
+		epsilon, relative and time_budget, if epsilon is given, solve with
+			random_termination.random_termination_anytime instead, for a
+			bounded error in less time; its report is kept as solve_report
+
+		distances_by_location, graph_cost, the solver and make_path in one
+			pass over contiguous arrays, with no per-node dicts.
+
+		RETURNS
+		a PipelineResult
+	"""
+	if distance_cache is None:
+		distance_cache = DistanceColumnCache(compiled_graph, dtype=dtype)
+	caller_relative_probabilities = np.asarray(caller_relative_probabilities, dtype=np.float64)
+	distances = distance_cache.columns(caller_indices)
+	cost = graph_utilities.distance_matrix_cost(distances, caller_relative_probabilities, cost_spec)
+	solve_report = None
+	if epsilon is None:
+		expected_cost, next_node = random_termination_arrays(compiled_graph, cost, p, stats=stats)
+	else:
+		expected_cost, next_node, solve_report = random_termination_anytime(compiled_graph, cost, p,
+			epsilon, relative, time_budget, stats)
+	result = PipelineResult(compiled_graph, np.asarray(caller_indices, dtype=np.int64),
+		caller_relative_probabilities, cost_spec, p, distances, cost, expected_cost, next_node)
+	result.solve_report = solve_report
+	return result
+
+def value_distribution_errors(result, nodes=None):
+	""" result is a PipelineResult
+		nodes is an optional array of the node indices to check, all of them
+			if left out
+
+		The check of the "Check Value Function" notebook: follow each node's
+			policy path, build the distribution of the distance to the call
+			along it, and compare the expected cost the solver found with
+			the one the distribution gives, the mean distance for
+			expected_value and the probability beyond the allowed distance
+			for exceeding_distance.
+
+		RETURNS
+		an array of the absolute error at each of nodes
+	"""
+	if nodes is None:
+		nodes = np.arange(result.compiled_graph.n_nodes)
+	errors = np.empty(len(nodes))
+	for i, node in enumerate(nodes):
+		distance_values, probabilities = result.path_distance_pdf(result.path(node))
+		if result.cost_spec['cost'] == 'expected_value':
+			value_from_distribution = np.dot(distance_values.astype(np.float64), probabilities)
+		else:
+			value_from_distribution = probabilities[distance_values > result.cost_spec['allowed_distance']].sum()
+		errors[i] = abs(float(result.expected_cost[node]) - value_from_distribution)
+	return errors
+
+def precision_report(compiled_graph, caller_indices, caller_relative_probabilities, cost_spec, p,
+	nodes=None):
+	""" solve one scenario both with float64 and with float32 storage
+
+		RETURNS
+		a dict comparing the two: the largest absolute and relative
+			differences in expected cost, the fraction of nodes making the
+			same choice, and the largest value_distribution_errors of each
+			(over nodes, as for value_distribution_errors), which shows how
+			much of the difference is float32 rounding rather than a worse
+			policy
+	"""
+	results = [ random_termination_pipeline(compiled_graph, caller_indices, caller_relative_probabilities,
+		cost_spec, p, dtype=dtype) for dtype in (np.float64, np.float32) ]
+	difference = np.abs(results[0].expected_cost - results[1].expected_cost.astype(np.float64))
+	finite = np.isfinite(results[0].expected_cost)
+	scale = np.maximum(np.abs(results[0].expected_cost[finite]), np.finfo(np.float64).tiny)
+	errors = [ value_distribution_errors(result, nodes) for result in results ]
+	return { 'max_abs_difference': float(difference[finite].max()),
+		'max_relative_difference': float((difference[finite]/scale).max()),
+		'policy_agreement': float(np.mean(results[0].next_node == results[1].next_node)),
+		'float64_max_distribution_error': float(errors[0][np.isfinite(errors[0])].max()),
+		'float32_max_distribution_error': float(errors[1][np.isfinite(errors[1])].max()),
+		'float64_bytes': results[0].distances.nbytes + results[0].expected_cost.nbytes + results[0].cost.nbytes,
+		'float32_bytes': results[1].distances.nbytes + results[1].expected_cost.nbytes + results[1].cost.nbytes }
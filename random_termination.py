@@ -1,11 +1,31 @@
-from labeled_heap import LabeledHeap
+import heapq
+import itertools
+import math
+import multiprocessing
+from timeit import default_timer
+from solver_stats import SolverStats, make_heap, start_phase, stops_phases
+import numpy as np
 import networkx as nx
 import graph_utilities
+from compiled_graph import GRID_OFFSETS
 
-def rt_double(graph, cost1, cost2, p, edgelist=False):
+# node states used by the array solvers
+FAR = 0
+CONSIDERED = 1
+ACCEPTED = 2
+# a node random_termination_incremental has not re-solved, holding the value
+# of the previous solve
+KEPT = 3
+# a local minimum waiting in its plateau, which is in the heap as one node
+PLATEAU = 4
+
+@stops_phases
+def rt_double(graph, cost1, cost2, p, edgelist=False, stats=None):
+	start_phase(stats, 'predecessor_sets')
 	node_incoming_neighbor_sets = { node: set(graph.predecessors(node)) for node in graph.nodes() }
 	
 	multicosts = { node: [cost1[node], cost2[node]] for node in graph.nodes() }
+	start_phase(stats, 'local_minima')
 	local_minima = graph_utilities.find_local_minima(graph, multicosts, multiple_costs=True)
 	far_nodes = set(filter(lambda node: node not in local_minima, graph.nodes()))
 	considered_nodes = set(local_minima)
@@ -16,7 +36,9 @@ def rt_double(graph, cost1, cost2, p, edgelist=False):
 	stationary_node_list = []
 
 	compare_cost = lambda a,b: expected_cost[a] < expected_cost[b]
-	heap = LabeledHeap(local_minima, is_less_than=compare_cost)
+	heap = make_heap(local_minima, compare_cost, stats)
+
+	start_phase(stats, 'sweep')
 
 	while heap:
 		accepted_node = heap.pop()
@@ -33,6 +55,9 @@ def rt_double(graph, cost1, cost2, p, edgelist=False):
 			# succssors won't affect the value of this node
 			node_incoming_neighbor_sets[successor_node].remove(accepted_node)
 
+		if stats is not None:
+			stats.record_relaxations(len(node_incoming_neighbor_sets[accepted_node]))
+
 		# update the value function on any of the accepted node's predecessors
 		for neighbor_node in node_incoming_neighbor_sets[accepted_node]:
 			
@@ -49,11 +74,15 @@ def rt_double(graph, cost1, cost2, p, edgelist=False):
 				heap.reheap_from_decrease_at_item(neighbor_node)
 				next_node[neighbor_node] = accepted_node
 
+	start_phase(stats, None)
 	return expected_cost, edgelist, stationary_node_list
 
-def random_termination_single_cost_edgelist(graph, cost, p):
+@stops_phases
+def random_termination_single_cost_edgelist(graph, cost, p, stats=None):
+	start_phase(stats, 'predecessor_sets')
 	node_incoming_neighbor_sets = { node: set(graph.predecessors(node)) for node in graph.nodes() }
 	
+	start_phase(stats, 'local_minima')
 	local_minima = graph_utilities.find_local_minima(graph, cost, multiple_costs=False)
 	far_nodes = set(
 		filter(lambda node: node not in local_minima, graph.nodes()))
@@ -64,7 +93,9 @@ def random_termination_single_cost_edgelist(graph, cost, p):
 	edgelist = []
 
 	compare_cost = lambda a,b: expected_cost[a] < expected_cost[b]
-	heap = LabeledHeap(local_minima, is_less_than=compare_cost)
+	heap = make_heap(local_minima, compare_cost, stats)
+
+	start_phase(stats, 'sweep')
 
 
 	while heap:
@@ -83,10 +114,15 @@ def random_termination_single_cost_edgelist(graph, cost, p):
 #			print(node_outgoing_neighbor_sets[predecessor_node])
 			node_incoming_neighbor_sets[successor_node].remove(accepted_node)
 
+		if stats is not None:
+			stats.record_relaxations(len(node_incoming_neighbor_sets[accepted_node]))
+
 		for neighbor_node in node_incoming_neighbor_sets[accepted_node]:
 #			assert neighbor_node not in accepted_nodes
 			
-			expected_cost_assuming_motion = p*cost[accepted_node] + (1-p)*expected_cost[accepted_node] if cost[accepted_node] != expected_cost[accepted_node] else cost[accepted_node]
+			# clamped as in random_termination_arrays, so that rounding never
+			# takes a move below the value it leads to
+			expected_cost_assuming_motion = max(p*cost[accepted_node] + (1-p)*expected_cost[accepted_node], expected_cost[accepted_node]) if cost[accepted_node] != expected_cost[accepted_node] else cost[accepted_node]
 
 #			print("")
 #			print(sorted(heap.item_index_dict.values()))
@@ -109,13 +145,17 @@ def random_termination_single_cost_edgelist(graph, cost, p):
 #				print("No improvement on node %s" % (str(neighbor_node)))
 
 #			print(sorted(heap.item_index_dict.values()))
+	start_phase(stats, None)
 	return expected_cost, edgelist
 
 
 
-def random_termination_single_cost_edgelist_continuous_call_probability(graph, cost, p_call_per_unit_time):
+@stops_phases
+def random_termination_single_cost_edgelist_continuous_call_probability(graph, cost, p_call_per_unit_time, stats=None):
+	start_phase(stats, 'predecessor_sets')
 	node_incoming_neighbor_sets = { node: set(graph.predecessors(node)) for node in graph.nodes() }
 	
+	start_phase(stats, 'local_minima')
 	local_minima = graph_utilities.find_local_minima(graph, cost, multiple_costs=False)
 	far_nodes = set(
 		filter(lambda node: node not in local_minima, graph.nodes()))
@@ -126,7 +166,9 @@ def random_termination_single_cost_edgelist_continuous_call_probability(graph, c
 	edgelist = []
 
 	compare_cost = lambda a,b: expected_cost[a] < expected_cost[b]
-	heap = LabeledHeap(local_minima, is_less_than=compare_cost)
+	heap = make_heap(local_minima, compare_cost, stats)
+
+	start_phase(stats, 'sweep')
 
 
 	while heap:
@@ -145,11 +187,16 @@ def random_termination_single_cost_edgelist_continuous_call_probability(graph, c
 #			print(node_outgoing_neighbor_sets[predecessor_node])
 			node_incoming_neighbor_sets[successor_node].remove(accepted_node)
 
+		if stats is not None:
+			stats.record_relaxations(len(node_incoming_neighbor_sets[accepted_node]))
+
 		for neighbor_node in node_incoming_neighbor_sets[accepted_node]:
 #			assert neighbor_node not in accepted_nodes
 			
 			p = p_call_per_unit_time*graph[neighbor_node][accepted_node]['weight']	
-			expected_cost_assuming_motion = p*cost[accepted_node] + (1-p)*expected_cost[accepted_node] if cost[accepted_node] != expected_cost[accepted_node] else cost[accepted_node]
+			# clamped as in random_termination_arrays, so that rounding never
+			# takes a move below the value it leads to
+			expected_cost_assuming_motion = max(p*cost[accepted_node] + (1-p)*expected_cost[accepted_node], expected_cost[accepted_node]) if cost[accepted_node] != expected_cost[accepted_node] else cost[accepted_node]
 
 #			print("")
 #			print(sorted(heap.item_index_dict.values()))
@@ -172,12 +219,16 @@ def random_termination_single_cost_edgelist_continuous_call_probability(graph, c
 #				print("No improvement on node %s" % (str(neighbor_node)))
 
 #			print(sorted(heap.item_index_dict.values()))
+	start_phase(stats, None)
 	return expected_cost, edgelist
 
-def random_termination_double_cost_edgelist(graph, cost, cost2, p):
+@stops_phases
+def random_termination_double_cost_edgelist(graph, cost, cost2, p, stats=None):
+	start_phase(stats, 'predecessor_sets')
 	node_incoming_neighbor_sets = { node: set(graph.predecessors(node)) for node in graph.nodes() }
 	double_cost = {node:[cost[node], cost2[node]] for node in cost.keys()} 
 	
+	start_phase(stats, 'local_minima')
 	local_minima = graph_utilities.find_local_minima(graph, double_cost, multiple_costs=False)
 	far_nodes = set(
 		filter(lambda node: node not in local_minima, graph.nodes()))
@@ -188,7 +239,9 @@ def random_termination_double_cost_edgelist(graph, cost, cost2, p):
 	edgelist = []
 
 	compare_cost = lambda a,b: expected_cost[a] < expected_cost[b]
-	heap = LabeledHeap(local_minima, is_less_than=compare_cost)
+	heap = make_heap(local_minima, compare_cost, stats)
+
+	start_phase(stats, 'sweep')
 
 
 	while heap:
@@ -207,6 +260,9 @@ def random_termination_double_cost_edgelist(graph, cost, cost2, p):
 #			print(node_outgoing_neighbor_sets[predecessor_node])
 			node_incoming_neighbor_sets[successor_node].remove(accepted_node)
 
+		if stats is not None:
+			stats.record_relaxations(len(node_incoming_neighbor_sets[accepted_node]))
+
 		for neighbor_node in node_incoming_neighbor_sets[accepted_node]:
 #			assert neighbor_node not in accepted_nodes
 		
@@ -236,4 +292,1000 @@ def random_termination_double_cost_edgelist(graph, cost, cost2, p):
 #				print("No improvement on node %s" % (str(neighbor_node)))
 
 #			print(sorted(heap.item_index_dict.values()))
+	start_phase(stats, None)
 	return expected_cost, edgelist
+
+class _BoundaryNode(object):
+	""" A stand-in for a node outside of the component being solved, 
+		reached along the edge (node, successor).  One is made per 
+		crossing edge, because the continuous call probability solver
+		uses a different p on every edge. """
+	def __init__(self, node, successor):
+		self.node = node
+		self.successor = successor
+
+def _boundary_cost(solver, graph, cost, expected_cost, p, node, successor_node):
+	""" the value of moving from node onto successor_node, whose expected
+		cost has already been fixed by a downstream component """
+	if solver is random_termination_single_cost_edgelist_continuous_call_probability:
+		p = p*graph[node][successor_node]['weight']
+
+	if isinstance(cost, (tuple, list)):
+		return [ costi[successor_node] if costi[successor_node] == expected_cost[successor_node][i] 
+			else p*costi[successor_node] + (1-p)*expected_cost[successor_node][i] 
+			for i, costi in enumerate(cost) ]
+	elif cost[successor_node] == expected_cost[successor_node]:
+		return cost[successor_node]
+	else:
+		return max(p*cost[successor_node] + (1-p)*expected_cost[successor_node], expected_cost[successor_node])
+
+def _solve_component(job):
+	solver, component_graph, component_cost, p, stats = job
+	if isinstance(component_cost, tuple):
+		solution = solver(*((component_graph,) + component_cost + (p,)), stats=stats)
+	else:
+		solution = solver(component_graph, component_cost, p, stats=stats)
+	return solution[0], solution[1], stats
+
+def strongly_connected_component_levels(graph):
+	""" graph is a networkx graph
+
+		RETURNS
+		a list of levels, each of which is a list of strongly connected
+			components (lists of nodes).  Every edge leaving a component
+			points into a component of a lower level, so the components
+			of level 0 are the sinks of the condensation of graph, and
+			the components within a level can be solved independently
+			once all of the lower levels have been solved.
+	"""
+	components = [ list(component) for component in nx.strongly_connected_components(graph) ]
+	condensed = nx.condensation(graph, scc=components)
+
+	component_level = {}
+	for component_index in reversed(list(nx.topological_sort(condensed))):
+		successor_levels = [ component_level[s] for s in condensed.successors(component_index) ]
+		component_level[component_index] = 1 + max(successor_levels) if successor_levels else 0
+
+	levels = [ [] for _ in xrange(max(component_level.values()) + 1) ] if components else []
+	for component_index, level in component_level.items():
+		levels[level].append(components[component_index])
+	return levels
+
+@stops_phases
+def random_termination_by_components(graph, cost, p, 
+	solver=random_termination_single_cost_edgelist, processes=None, stats=None):
+	""" graph is a networkx graph
+		cost is a dict of node costs, or a tuple of such dicts for the
+			two-cost solver random_termination_double_cost_edgelist
+		p is passed through to solver
+		solver is one of random_termination_single_cost_edgelist,
+			random_termination_single_cost_edgelist_continuous_call_probability
+			or random_termination_double_cost_edgelist.  rt_double is not
+			supported: it picks its local minima criterion by criterion, so
+			the stand-ins below would change which nodes it seeds.
+
+		Solves the random termination problem on every strongly connected
+			component of graph separately.  The components are solved from
+			the sinks of the condensation upwards; the nodes just outside a
+			component are replaced by fixed-value stand-ins holding their
+			already-known expected cost, so each component sees exactly the
+			values it would see in a solve of the whole graph.
+		Components on the same level of the condensation do not depend on
+			each other, and are solved concurrently on a pool of processes
+			(processes=None uses every core, processes=1 uses none).
+		stats is an optional solver_stats.SolverStats.  The statistics of
+			every component solve are merged into it, alongside the times of
+			the 'decomposition', 'components' and 'output' phases here.
+
+		RETURNS
+		expected_cost, edgelist, as returned by random_termination_single_cost_edgelist
+	"""
+	if solver is rt_double:
+		raise ValueError("rt_double cannot be solved component by component")
+
+	start_phase(stats, 'decomposition')
+	levels = strongly_connected_component_levels(graph)
+
+	expected_cost = {}
+	edgelist = []
+	pool = None
+	if processes is None:
+		processes = multiprocessing.cpu_count()
+	if processes > 1 and any(len(level) > 1 for level in levels):
+		pool = multiprocessing.Pool(processes)
+
+	try:
+		for level in levels:
+			start_phase(stats, 'decomposition')
+			jobs = []
+			for component in level:
+				component_nodes = set(component)
+				component_graph = nx.DiGraph()
+				component_graph.add_nodes_from(component)
+				boundary_cost = {}
+
+				for node in component:
+					for successor_node in graph.successors(node):
+						if successor_node in component_nodes:
+							component_graph.add_edge(node, successor_node, **graph[node][successor_node])
+						else:
+							boundary_node = _BoundaryNode(node, successor_node)
+							component_graph.add_edge(node, boundary_node, **graph[node][successor_node])
+							boundary_cost[boundary_node] = _boundary_cost(solver, 
+								graph, cost, expected_cost, p, node, successor_node)
+
+				if isinstance(cost, (tuple, list)):
+					component_cost = tuple( dict([ (node, costi[node]) for node in component ] +
+						[ (b, bc[i]) for b, bc in boundary_cost.items() ]) 
+						for i, costi in enumerate(cost) )
+				else:
+					component_cost = { node: cost[node] for node in component }
+					component_cost.update(boundary_cost)
+
+				jobs.append((solver, component_graph, component_cost, p, 
+					None if stats is None else SolverStats()))
+
+			start_phase(stats, 'components')
+			if pool is not None and len(jobs) > 1:
+				solutions = pool.map(_solve_component, jobs, 
+					chunksize=max(1, len(jobs) // (4*processes)))
+			else:
+				solutions = [ _solve_component(job) for job in jobs ]
+
+			start_phase(stats, 'output')
+			for component_expected_cost, component_edgelist, component_stats in solutions:
+				if stats is not None:
+					stats.merge(component_stats)
+				for node, node_cost in component_expected_cost.items():
+					if not isinstance(node, _BoundaryNode):
+						expected_cost[node] = node_cost
+				for node, next_node in component_edgelist:
+					if isinstance(next_node, _BoundaryNode):
+						next_node = next_node.successor
+					edgelist.append((node, next_node))
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+
+	start_phase(stats, None)
+	return expected_cost, edgelist
+
+def edge_termination_probabilities(compiled_graph, rate, model='linear', out=None, profile=None):
+	""" compiled_graph is a compiled_graph.CompiledGraph whose edge weights
+			are travel times
+		rate is the rate of calls per unit time
+		model is 'linear', for a probability of rate*weight clipped to 1,
+			or 'exponential', for 1 - exp(-rate*weight), the probability of
+			a Poisson call during the move
+		out is an optional array to write the probabilities into
+		profile, if given, is the weight profile to take the travel times
+			from, or 'all' for an (n_edges, n_profiles) array with a column
+			for each, as random_termination_profiles takes
+
+		Computed once, the probabilities replace the weight lookup and the
+			product that random_termination_single_cost_edgelist_continuous_call_probability
+			does on every relaxation.  A new rate only needs this called
+			again (with out to reuse the array), not a new graph.
+
+		RETURNS
+		an array of the probability of a call during each edge, aligned
+			with compiled_graph.predecessor_indices, to pass as the p of
+			random_termination_arrays
+	"""
+	if profile is None:
+		weights = np.asarray(compiled_graph.predecessor_weights, dtype=np.float64)
+	else:
+		weights = compiled_graph.profile_edge_weights(profile, predecessor_order=True)
+	if out is None:
+		out = np.empty(weights.shape)
+	if model == 'linear':
+		np.multiply(weights, rate, out=out)
+		np.minimum(out, 1.0, out=out)
+	elif model == 'exponential':
+		np.multiply(weights, -rate, out=out)
+		np.expm1(out, out=out)
+		np.negative(out, out=out)
+	else:
+		raise ValueError("unknown termination probability model %r" % model)
+	return out
+
+@stops_phases
+def random_termination_arrays(compiled_graph, cost, p,
+	expected_cost=None, next_node=None, status=None, stats=None, sensitivity=False, compress_plateaus=True):
+	""" compiled_graph is a compiled_graph.CompiledGraph
+		cost is an array of node costs in node index order
+		p is the probability that the call arrives after each move, or an
+			array of that probability for every edge, aligned with
+			compiled_graph.predecessor_indices, as made by
+			edge_termination_probabilities
+
+		expected_cost, next_node and status are optional output arrays
+			of length compiled_graph.n_nodes (float, integer and int8).
+			Any of them may be np.memmap arrays, e.g. made with
+			compiled_graph.open_memmap, and they are written in place;
+			the ones left out are allocated in memory.
+		stats is an optional solver_stats.SolverStats to fill in
+		sensitivity, if True, also returns the derivative of the expected
+			cost with respect to p and the margin of every node's choice;
+			it needs a single p
+		compress_plateaus, if True, seeds each plateau of local minima
+			(see _plateaus) as a single node of the heap
+
+		Piecewise constant costs such as exceeding_distance have wide
+			plateaus of equal cost, every node of which is a local minimum;
+			pushing them one by one fills the heap with ties.  Compressed,
+			a plateau sits in the heap as one of its nodes, and when that
+			is popped the whole plateau is accepted at once.  A member whose
+			value is lowered before then leaves the plateau for the heap.
+			The values are the same either way.
+
+		For a float32 cost, expected_cost is float32 too unless given.
+			Each step of the recurrence is still computed in float64, and
+			only the stored values are rounded.
+
+		The same algorithm as random_termination_single_cost_edgelist, and
+			for a float64 cost the same values, but run on the CSR arrays
+			of compiled_graph, so that the adjacency, the costs and the
+			outputs can all be memory-mapped for graphs that do not fit in
+			memory.  Apart from the
+			sequential local minima scan, the arrays are touched only at
+			the nodes popped off the heap and at their predecessors, in
+			the order of the sweep, so only the pages around the current
+			front need to stay resident.
+
+		With sensitivity, the derivative follows the policy tree in the same
+			sweep: a node moving to y has V = p*c(y) + (1-p)*V(y), so
+
+			dV/dp = c(y) - V(y) + (1-p)*dV(y)/dp
+
+			which is known as soon as the node is accepted, y having been
+			accepted before it; nodes staying put have dV/dp = 0.  The margin
+			of a node is how much worse its second best choice (staying put,
+			or moving to another successor) is than its best one.  A node
+			with a margin near zero is near-tied, and its choice may flip
+			under a small change of p or of the costs.
+
+		RETURNS
+		expected_cost, an array of the expected cost of each node
+		next_node, an array of the index of the node each node moves to,
+			or -1 for the nodes which stay put
+		and with sensitivity also
+		derivative, an array of dV/dp at each node
+		margin, an array of the margin of each node's choice (inf for a
+			node with no other choice, nan where the expected cost is inf)
+	"""
+	start_phase(stats, 'initialization')
+	n_nodes = compiled_graph.n_nodes
+	per_edge_p = np.ndim(p) > 0
+	if per_edge_p and sensitivity:
+		raise ValueError("sensitivity needs a single p, not one per edge")
+	if expected_cost is None:
+		expected_cost = np.empty(n_nodes, dtype=np.float32 if cost.dtype == np.float32 else np.float64)
+	if next_node is None:
+		next_node = np.empty(n_nodes, dtype=np.int64)
+	if status is None:
+		status = np.empty(n_nodes, dtype=np.int8)
+	next_node.fill(-1)
+	status.fill(FAR)
+	if sensitivity:
+		derivative = np.zeros(n_nodes)
+		# the value of each node's second best choice so far
+		second_best = np.empty(n_nodes)
+		second_best.fill(np.inf)
+
+	predecessor_offsets = compiled_graph.predecessor_offsets
+	predecessor_indices = compiled_graph.predecessor_indices
+
+	start_phase(stats, 'local_minima')
+	local_minima = compiled_graph.local_minima(cost)
+	expected_cost[local_minima] = cost[local_minima]
+	plateau_of = None
+	if compress_plateaus:
+		seeds, plateau_of, plateau_members = _plateaus(compiled_graph, cost, local_minima)
+		status[local_minima] = PLATEAU
+		local_minima = seeds
+	status[local_minima] = CONSIDERED
+
+	compare_cost = lambda a,b: expected_cost[a] < expected_cost[b]
+	heap = make_heap(local_minima.tolist(), compare_cost, stats)
+
+	start_phase(stats, 'sweep')
+	while heap:
+		popped_node = heap.pop()
+		if plateau_of is not None and plateau_of[popped_node] >= 0:
+			members = plateau_members[plateau_of[popped_node]]
+			accepted_nodes = [popped_node] + members[status[members] == PLATEAU].tolist()
+			plateau_of[accepted_nodes] = -1
+		else:
+			accepted_nodes = [popped_node]
+		status[accepted_nodes] = ACCEPTED
+		for accepted_node in accepted_nodes:
+			# as python floats, so that float32 arrays are still summed in float64
+			accepted_cost = float(cost[accepted_node])
+			accepted_expected_cost = float(expected_cost[accepted_node])
+			# accepted predecessors are skipped, rather than removed from a set
+			edges = slice(predecessor_offsets[accepted_node], predecessor_offsets[accepted_node+1])
+			neighbor_nodes = predecessor_indices[edges].tolist()
+			if stats is not None:
+				stats.record_relaxations(len(neighbor_nodes))
+
+			# a move never costs less than the value it leads to, but rounding
+			# can take it an ulp below; clamping keeps the sweep monotone, so a
+			# node is never accepted before a neighbour that could still lower it
+			if not per_edge_p:
+				expected_cost_assuming_motion = max(p*accepted_cost + (1-p)*accepted_expected_cost, accepted_expected_cost) if accepted_cost != accepted_expected_cost else accepted_cost
+				motion_costs = itertools.repeat(expected_cost_assuming_motion)
+			elif accepted_cost != accepted_expected_cost:
+				motion_costs = [ max(edge_p*accepted_cost + (1-edge_p)*accepted_expected_cost, accepted_expected_cost) for edge_p in p[edges].tolist() ]
+			else:
+				motion_costs = itertools.repeat(accepted_cost)
+
+			if sensitivity:
+				successor_node = next_node[accepted_node]
+				if successor_node >= 0:
+					derivative[accepted_node] = float(cost[successor_node]) - float(expected_cost[successor_node]) \
+						+ (1-p)*derivative[successor_node]
+				_record_sensitivity_choices(neighbor_nodes, accepted_node, expected_cost_assuming_motion,
+					cost, expected_cost, status, second_best)
+
+			for neighbor_node, expected_cost_assuming_motion in zip(neighbor_nodes, motion_costs):
+				neighbor_status = status[neighbor_node]
+				if neighbor_status == FAR:
+					expected_cost[neighbor_node] = expected_cost_assuming_motion
+					status[neighbor_node] = CONSIDERED
+					heap.push(neighbor_node)
+					next_node[neighbor_node] = accepted_node
+				elif neighbor_status != ACCEPTED and expected_cost_assuming_motion < expected_cost[neighbor_node]:
+					expected_cost[neighbor_node] = expected_cost_assuming_motion
+					next_node[neighbor_node] = accepted_node
+					if plateau_of is None or plateau_of[neighbor_node] < 0:
+						heap.reheap_from_decrease_at_item(neighbor_node)
+					else:
+						_leave_plateau(neighbor_node, plateau_of, plateau_members, status, heap)
+
+	start_phase(stats, None)
+	if sensitivity:
+		with np.errstate(invalid='ignore'):
+			margin = second_best - expected_cost
+		return expected_cost, next_node, derivative, margin
+	return expected_cost, next_node
+
+def _plateaus(compiled_graph, cost, local_minima):
+	""" a plateau is a set of local minima of the same cost joined by edges
+		between them, ignoring their direction
+
+		RETURNS
+		the local minima to seed the heap with, one per plateau and those in
+			none, an array of the plateau of every node (-1 outside them), and
+			a list of the array of the members of each plateau, its seed first
+	"""
+	n_nodes = compiled_graph.n_nodes
+	plateau_of = np.empty(n_nodes, dtype=np.int64)
+	plateau_of.fill(-1)
+	successor_offsets = np.asarray(compiled_graph.successor_offsets)
+	edge_counts = successor_offsets[local_minima+1] - successor_offsets[local_minima]
+	tails = np.repeat(local_minima, edge_counts)
+	heads = np.asarray(compiled_graph.successor_indices)[np.repeat(successor_offsets[local_minima]
+		- np.cumsum(edge_counts) + edge_counts, edge_counts) + np.arange(edge_counts.sum())]
+	is_local_minimum = np.zeros(n_nodes, dtype=bool)
+	is_local_minimum[local_minima] = True
+	level = is_local_minimum[heads] & (cost[heads] == cost[tails]) & (heads != tails)
+	if not level.any():
+		return local_minima, plateau_of, []
+
+	from scipy.sparse import coo_matrix
+	from scipy.sparse.csgraph import connected_components
+	joins = coo_matrix((np.ones(level.sum()), (tails[level], heads[level])), shape=(n_nodes, n_nodes))
+	_, components = connected_components(joins.tocsr(), directed=False)
+	components = components[local_minima]
+	order = np.argsort(components, kind='mergesort')
+	starts = np.flatnonzero(np.r_[True, components[order][1:] != components[order][:-1]])
+	sizes = np.diff(np.r_[starts, len(order)])
+	plateau_members = [ local_minima[order[start:start+size]] for start, size in zip(starts.tolist(), sizes.tolist())
+		if size > 1 ]
+	for plateau, members in enumerate(plateau_members):
+		plateau_of[members] = plateau
+	seeds = local_minima[plateau_of[local_minima] < 0]
+	return np.sort(np.concatenate([seeds] + [ members[:1] for members in plateau_members ])), plateau_of, plateau_members
+
+def _leave_plateau(node, plateau_of, plateau_members, status, heap):
+	""" take a node whose value was just lowered out of its plateau: a
+		waiting member joins the heap on its own, and if node held the
+		plateau's place in the heap, a waiting member takes it over """
+	members = plateau_members[plateau_of[node]]
+	plateau_of[node] = -1
+	if status[node] == PLATEAU:
+		status[node] = CONSIDERED
+		heap.push(node)
+		return
+	heap.reheap_from_decrease_at_item(node)
+	waiting = members[status[members] == PLATEAU]
+	if len(waiting):
+		status[waiting[0]] = CONSIDERED
+		heap.push(int(waiting[0]))
+
+def _record_sensitivity_choices(neighbor_nodes, accepted_node, expected_cost_assuming_motion,
+	cost, expected_cost, status, second_best):
+	""" fold the choice of moving to accepted_node into the second best
+		choices of its predecessors, before the sweep relaxes them """
+	for neighbor_node in neighbor_nodes:
+		if neighbor_node == accepted_node:
+			continue
+		# the best choice so far: staying put, or the best move relaxed so
+		#    far, which can be a worse one until a better move comes along
+		best = float(cost[neighbor_node])
+		if status[neighbor_node] != FAR:
+			best = min(best, float(expected_cost[neighbor_node]))
+		if expected_cost_assuming_motion < best:
+			second_best[neighbor_node] = best
+		elif expected_cost_assuming_motion < second_best[neighbor_node]:
+			second_best[neighbor_node] = expected_cost_assuming_motion
+
+def _best_moves(compiled_graph, cost, expected_cost, p):
+	""" cost and expected_cost are arrays of n_nodes rows, one column per
+			scenario if 2-d
+		p is a scalar, or an array of n_edges probabilities in successor order,
+			or an (n_edges, S) array of them for 2-d costs
+
+		RETURNS
+		the expected cost of moving along every edge, in successor order,
+			and the lowest of them at every node (inf without successors)
+	"""
+	successor_offsets = np.asarray(compiled_graph.successor_offsets)
+	successor_indices = np.asarray(compiled_graph.successor_indices)
+	has_successors = successor_offsets[1:] > successor_offsets[:-1]
+
+	if np.ndim(p) == 0:
+		expected_cost_assuming_motion = np.where(cost != expected_cost,
+			np.maximum(p*cost + (1-p)*expected_cost, expected_cost), cost)
+		successor_motion = expected_cost_assuming_motion[successor_indices]
+	else:
+		successor_cost = cost[successor_indices]
+		successor_expected_cost = expected_cost[successor_indices]
+		if successor_cost.ndim == 2 and p.ndim == 1:
+			p = p[:,None]
+		successor_motion = np.where(successor_cost != successor_expected_cost,
+			np.maximum(p*successor_cost + (1-p)*successor_expected_cost, successor_expected_cost), successor_cost)
+
+	best_motion = np.empty(cost.shape)
+	best_motion.fill(np.inf)
+	if has_successors.any():
+		best_motion[has_successors] = np.minimum.reduceat(successor_motion,
+			successor_offsets[:-1][has_successors], axis=0)
+	return successor_motion, best_motion
+
+def _best_policy(compiled_graph, cost, expected_cost, p):
+	""" the next node array of the best moves, as _best_moves; where several
+		edges are equally good the first, lowest indexed one is taken """
+	successor_offsets = np.asarray(compiled_graph.successor_offsets)
+	successor_indices = np.asarray(compiled_graph.successor_indices)
+	has_successors = successor_offsets[1:] > successor_offsets[:-1]
+	n_edges = len(successor_indices)
+
+	successor_motion, best_motion = _best_moves(compiled_graph, cost, expected_cost, p)
+	tails = np.repeat(np.arange(len(cost)), np.diff(successor_offsets))
+	edge_ids = np.arange(n_edges)
+	if successor_motion.ndim == 2:
+		edge_ids = edge_ids[:,None]
+	edge_ids = np.where(successor_motion == best_motion[tails], edge_ids, n_edges)
+
+	next_node = np.empty(cost.shape, dtype=np.int64)
+	next_node.fill(-1)
+	if has_successors.any():
+		best_edge = np.minimum.reduceat(edge_ids, successor_offsets[:-1][has_successors], axis=0)
+		moving = best_motion[has_successors] < cost[has_successors]
+		next_node[has_successors] = np.where(moving, successor_indices[np.minimum(best_edge, n_edges - 1)], -1)
+	return next_node
+
+def _successor_order(compiled_graph, p):
+	""" per-edge probabilities, aligned with the predecessor CSR as the
+		heap solvers take them, reordered to the successor CSR for
+		_best_moves; a scalar p is returned as it is """
+	if np.ndim(p) == 0:
+		return p
+	p = np.asarray(p, dtype=np.float64)
+	successor_p = np.empty(p.shape)
+	successor_p[np.asarray(compiled_graph.predecessor_edges)] = p
+	return successor_p
+
+@stops_phases
+def random_termination_lockstep(compiled_graph, costs, p, stats=None):
+	""" compiled_graph is a compiled_graph.CompiledGraph
+		costs is an (n_nodes, S) array holding the node costs of S scenarios,
+			one column each, or an array of n_nodes costs for one scenario
+		p is the probability that the call arrives after each move, an
+			array of it for every edge as for random_termination_arrays, or
+			an (n_edges, S) array of those, one column per scenario
+		stats is an optional solver_stats.SolverStats to fill in
+
+		Solves all S scenarios at once by value iteration instead of a heap
+			sweep.  Starting from expected_cost = cost, every round relaxes
+			every edge of every scenario still changing with array operations,
+
+			V(x) = min(c(x), min over successors y of p*c(y) + (1-p)*V(y))
+
+			until no value changes.  This is the fixed point the heap sweep
+			of random_termination_arrays reaches, computed with the same
+			operations (the move clamped to at least V(y) as there), so the
+			values are identical.  Where a node has several equally good successors, the
+			one with the lowest index is chosen, which need not be the one
+			the heap sweep picked.
+
+		A round costs O(n_edges*S) and as many rounds are needed as the
+			longest policy path has moves, so this pays off for many
+			scenarios on graphs whose policy paths are short, such as road
+			graphs, rather than for large grids.
+
+		RETURNS
+		expected_cost, an (n_nodes, S) array (or n_nodes array, like costs)
+		next_node, the matching array of the index of the node each node
+			moves to, or -1 for the nodes which stay put
+	"""
+	start_phase(stats, 'initialization')
+	costs = np.asarray(costs, dtype=np.float64)
+	single_scenario = costs.ndim == 1
+	if single_scenario:
+		costs = costs[:,None]
+	n_nodes, n_scenarios = costs.shape
+	p = _successor_order(compiled_graph, p)
+	if np.ndim(p) == 2 and single_scenario:
+		p = p[:,0]
+
+	start_phase(stats, 'sweep')
+	expected_cost = costs.copy()
+	active = np.arange(n_scenarios)
+	while len(active):
+		cost = costs[:,active]
+		_, best_motion = _best_moves(compiled_graph, cost, expected_cost[:,active], p[:,active] if np.ndim(p) == 2 else p)
+		new_expected_cost = np.minimum(cost, best_motion)
+		changed = (new_expected_cost != expected_cost[:,active]).any(axis=0)
+		expected_cost[:,active] = new_expected_cost
+		active = active[changed]
+
+	start_phase(stats, 'policy')
+	next_node = _best_policy(compiled_graph, costs, expected_cost, p)
+
+	start_phase(stats, None)
+	if single_scenario:
+		return expected_cost[:,0], next_node[:,0]
+	return expected_cost, next_node
+
+@stops_phases
+def random_termination_refine(compiled_graph, cost, p, expected_cost, max_iterations=100, tolerance=0.0, stats=None):
+	""" compiled_graph is a compiled_graph.CompiledGraph
+		cost is an array of node costs in node index order
+		p is the probability that the call arrives after each move, or an
+			array of it for every edge as for random_termination_arrays
+		expected_cost is a warm start: an approximate expected cost of
+			every node, from a coarser solve say
+		max_iterations bounds the number of sweeps over all the edges
+		tolerance stops the sweeps once no value changes by more than it
+		stats is an optional solver_stats.SolverStats to fill in
+
+		Value iteration from a warm start, relaxing every edge at once per
+			sweep as random_termination_lockstep does.  A sweep shrinks the
+			distance to the exact expected cost by a factor of at least
+			1 - p, wherever it starts, so the last change bounds the
+			remaining error: it is at most change*(1 - p)/p, with the
+			smallest p for per-edge probabilities.
+
+		RETURNS
+		expected_cost, an array of the refined expected cost of each node
+		next_node, an array of the best move from each node given those
+			values, or -1 for the nodes which stay put
+		a dict of the 'iterations' run, the largest 'change' in the last
+			one and the 'error_bound' it gives
+	"""
+	start_phase(stats, 'initialization')
+	cost = np.asarray(cost, dtype=np.float64)
+	p = _successor_order(compiled_graph, p)
+	expected_cost = np.minimum(cost, expected_cost)
+	finite = np.isfinite(cost)
+
+	start_phase(stats, 'sweep')
+	iterations = 0
+	change = np.inf
+	while iterations < max_iterations and change > tolerance:
+		_, best_motion = _best_moves(compiled_graph, cost, expected_cost, p)
+		new_expected_cost = np.minimum(cost, best_motion)
+		change = np.abs(new_expected_cost[finite] - expected_cost[finite]).max() if finite.any() else 0.0
+		expected_cost = new_expected_cost
+		iterations += 1
+
+	start_phase(stats, 'policy')
+	next_node = _best_policy(compiled_graph, cost, expected_cost, p)
+	start_phase(stats, None)
+	p_min = np.min(p) if np.ndim(p) > 0 else p
+	return expected_cost, next_node, { 'iterations': iterations, 'change': float(change),
+		'error_bound': float(change*(1 - p_min)/p_min) if iterations else np.inf }
+
+def random_termination_profiles(compiled_graph, cost, rate, model='linear', stats=None):
+	""" compiled_graph is a compiled_graph.CompiledGraph with profile_weights
+		cost is an array of node costs, the same under every profile, or an
+			(n_nodes, n_profiles) array of them, one column per profile
+		rate and model are as for edge_termination_probabilities
+
+		Solves every weight profile in one random_termination_lockstep
+			call: the graph's topology is shared, and only the probabilities
+			of a call during each move change from profile to profile.
+
+		RETURNS
+		expected_cost and next_node, (n_nodes, n_profiles) arrays with a
+			column per profile
+	"""
+	p = edge_termination_probabilities(compiled_graph, rate, model, profile='all')
+	cost = np.asarray(cost, dtype=np.float64)
+	if cost.ndim == 1:
+		cost = np.repeat(cost[:,None], compiled_graph.n_profiles, axis=1)
+	return random_termination_lockstep(compiled_graph, cost, p, stats)
+
+def policy_upstream(next_node, nodes):
+	""" next_node is an array as returned by random_termination_arrays
+		nodes is an array of node indices
+
+		RETURNS
+		a sorted array of nodes and of every node whose policy path passes
+			through one of them
+	"""
+	next_node = np.asarray(next_node)
+	order = np.argsort(next_node, kind='mergesort')
+	sorted_next_node = next_node[order]
+	upstream = np.zeros(len(next_node), dtype=bool)
+	frontier = np.unique(np.asarray(nodes, dtype=np.int64))
+	upstream[frontier] = True
+	while len(frontier):
+		starts = np.searchsorted(sorted_next_node, frontier, side='left')
+		counts = np.searchsorted(sorted_next_node, frontier, side='right') - starts
+		positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+		frontier = order[positions]
+		frontier = frontier[~upstream[frontier]]
+		upstream[frontier] = True
+	return np.flatnonzero(upstream)
+
+@stops_phases
+def random_termination_incremental(compiled_graph, cost, p, expected_cost, next_node, changed_nodes, stats=None):
+	""" compiled_graph is a compiled_graph.CompiledGraph
+		cost is the new array of node costs in node index order
+		p is as for random_termination_arrays
+		expected_cost and next_node are the solution for the old costs
+		changed_nodes is an array of the nodes whose cost changed, as
+			returned by graph_utilities.CallerCost.update
+
+		Re-solves only around changed_nodes.  The nodes whose policy path
+			passes through a changed node (policy_upstream) lose their
+			values and are solved again by the sweep of
+			random_termination_arrays, seeded from the old values of the
+			nodes they can move to.  Every other node keeps its old value,
+			which its old policy still achieves, unless the sweep reaches
+			it with a lower one; it then joins the sweep.  The values are
+			those a full solve of the new costs gives, at the cost of
+			the nodes touched only.
+
+		RETURNS
+		expected_cost and next_node for the new costs, as new arrays
+		an array of the indices of the nodes whose expected cost or next
+			node changed
+	"""
+	start_phase(stats, 'initialization')
+	cost = np.asarray(cost)
+	per_edge_p = np.ndim(p) > 0
+	old_expected_cost, old_next_node = np.asarray(expected_cost), np.asarray(next_node)
+	expected_cost = np.array(expected_cost)
+	next_node = np.array(next_node, dtype=np.int64)
+	successor_offsets = np.asarray(compiled_graph.successor_offsets)
+	successor_indices = np.asarray(compiled_graph.successor_indices)
+	predecessor_offsets = compiled_graph.predecessor_offsets
+	predecessor_indices = compiled_graph.predecessor_indices
+
+	affected = policy_upstream(next_node, changed_nodes)
+	status = np.empty(compiled_graph.n_nodes, dtype=np.int8)
+	status.fill(KEPT)
+	status[affected] = FAR
+	expected_cost[affected] = np.inf
+	next_node[affected] = -1
+
+	start_phase(stats, 'local_minima')
+	edge_counts = successor_offsets[affected+1] - successor_offsets[affected]
+	successor_positions = np.repeat(successor_offsets[affected] - np.cumsum(edge_counts) + edge_counts,
+		edge_counts) + np.arange(edge_counts.sum())
+	successors = successor_indices[successor_positions]
+	min_successor_cost = np.empty(len(affected))
+	min_successor_cost.fill(np.inf)
+	has_successors = edge_counts > 0
+	if has_successors.any():
+		min_successor_cost[has_successors] = np.minimum.reduceat(cost[successors],
+			(np.cumsum(edge_counts) - edge_counts)[has_successors])
+	local_minima = affected[cost[affected] <= min_successor_cost]
+	expected_cost[local_minima] = cost[local_minima]
+	status[local_minima] = CONSIDERED
+	# the kept nodes the affected ones can move to seed the sweep with
+	# their old values
+	boundary = np.unique(successors[status[successors] == KEPT])
+	status[boundary] = CONSIDERED
+
+	compare_cost = lambda a,b: expected_cost[a] < expected_cost[b]
+	heap = make_heap(np.concatenate([local_minima, boundary]).tolist(), compare_cost, stats)
+	resolved = [affected, boundary]
+
+	start_phase(stats, 'sweep')
+	while heap:
+		accepted_node = heap.pop()
+		status[accepted_node] = ACCEPTED
+
+		accepted_cost = float(cost[accepted_node])
+		accepted_expected_cost = float(expected_cost[accepted_node])
+		edges = slice(predecessor_offsets[accepted_node], predecessor_offsets[accepted_node+1])
+		neighbor_nodes = predecessor_indices[edges].tolist()
+		if stats is not None:
+			stats.record_relaxations(len(neighbor_nodes))
+
+		# the same moves, clamp included, as random_termination_arrays
+		if not per_edge_p:
+			expected_cost_assuming_motion = max(p*accepted_cost + (1-p)*accepted_expected_cost, accepted_expected_cost) if accepted_cost != accepted_expected_cost else accepted_cost
+			motion_costs = itertools.repeat(expected_cost_assuming_motion)
+		elif accepted_cost != accepted_expected_cost:
+			motion_costs = [ max(edge_p*accepted_cost + (1-edge_p)*accepted_expected_cost, accepted_expected_cost) for edge_p in p[edges].tolist() ]
+		else:
+			motion_costs = itertools.repeat(accepted_cost)
+
+		for neighbor_node, expected_cost_assuming_motion in zip(neighbor_nodes, motion_costs):
+			neighbor_status = status[neighbor_node]
+			if neighbor_status == FAR:
+				expected_cost[neighbor_node] = expected_cost_assuming_motion
+				status[neighbor_node] = CONSIDERED
+				heap.push(neighbor_node)
+				next_node[neighbor_node] = accepted_node
+			elif neighbor_status != ACCEPTED and expected_cost_assuming_motion < expected_cost[neighbor_node]:
+				expected_cost[neighbor_node] = expected_cost_assuming_motion
+				next_node[neighbor_node] = accepted_node
+				if neighbor_status == KEPT:
+					status[neighbor_node] = CONSIDERED
+					heap.push(neighbor_node)
+					resolved.append(np.array([neighbor_node]))
+				else:
+					heap.reheap_from_decrease_at_item(neighbor_node)
+
+	# most of the nodes re-solved, and all of the boundary, end up where
+	# they were
+	resolved = np.unique(np.concatenate(resolved))
+	changed = (expected_cost[resolved] != old_expected_cost[resolved]) | \
+		(next_node[resolved] != old_next_node[resolved])
+	start_phase(stats, None)
+	return expected_cost, next_node, resolved[changed]
+
+@stops_phases
+def random_termination_anytime(compiled_graph, cost, p, epsilon, relative=False, time_budget=None, stats=None):
+	""" compiled_graph is a compiled_graph.CompiledGraph
+		cost is an array of node costs in node index order
+		p is as for random_termination_arrays
+		epsilon is the width of the value buckets: an absolute width, or
+			with relative a ratio, the bucket [v, v*(1 + epsilon)); relative
+			buckets need non-negative costs
+		time_budget, if given, is how many seconds the sweep may take
+		stats is an optional solver_stats.SolverStats to fill in
+
+		The sweep of random_termination_arrays with the heap replaced by
+			buckets of values epsilon wide.  The buckets are taken in order,
+			but the nodes within one are accepted first come first served,
+			so a node can be accepted with a value up to about a bucket above
+			its best.  No node is ever revisited, so the values found are
+			exactly those of the policy returned, and never below the exact
+			expected cost.
+
+		If time_budget runs out, the sweep stops where it is: the nodes not
+			yet accepted keep the better of their move so far, if any, and
+			staying put.  That is still a valid policy, whose value is
+			returned.
+
+		How far the result is from the exact expected cost is bounded
+			afterwards from its Bellman residual r, the largest change one
+			step of value iteration makes to it: as a step shrinks the error
+			by a factor of 1 - p, the error is at most r/p, with the
+			smallest p for per-edge probabilities.
+
+		RETURNS
+		expected_cost and next_node, as for random_termination_arrays
+		a dict of whether the sweep was 'complete', the number of nodes
+			'accepted', the 'seconds' taken, and the 'residual' and the
+			'error_bound' of expected_cost
+	"""
+	start_phase(stats, 'initialization')
+	start_time = default_timer()
+	deadline = np.inf if time_budget is None else start_time + time_budget
+	cost = np.asarray(cost)
+	n_nodes = compiled_graph.n_nodes
+	per_edge_p = np.ndim(p) > 0
+	if relative:
+		if (cost < 0).any():
+			raise ValueError("relative buckets need non-negative costs")
+		scale = 1.0/math.log1p(epsilon)
+		tiny = np.finfo(np.float64).tiny
+		bucket_of = lambda value: int(math.floor(math.log(max(value, tiny))*scale))
+	else:
+		bucket_of = lambda value: int(math.floor(value/epsilon))
+	expected_cost = np.empty(n_nodes, dtype=np.float32 if cost.dtype == np.float32 else np.float64)
+	expected_cost.fill(np.inf)
+	next_node = np.empty(n_nodes, dtype=np.int64)
+	next_node.fill(-1)
+	status = np.empty(n_nodes, dtype=np.int8)
+	status.fill(FAR)
+	predecessor_offsets = compiled_graph.predecessor_offsets
+	predecessor_indices = compiled_graph.predecessor_indices
+
+	start_phase(stats, 'local_minima')
+	local_minima = compiled_graph.local_minima(cost)
+	local_minima = local_minima[np.isfinite(cost[local_minima])]
+	expected_cost[local_minima] = cost[local_minima]
+	status[local_minima] = CONSIDERED
+	buckets = {}
+	for node, value in zip(local_minima.tolist(), cost[local_minima].tolist()):
+		buckets.setdefault(bucket_of(value), []).append(node)
+	keys = list(buckets)
+	heapq.heapify(keys)
+
+	start_phase(stats, 'sweep')
+	accepted = 0
+	complete = True
+	while keys and complete:
+		key = heapq.heappop(keys)
+		bucket = buckets.pop(key)
+		# the bucket grows as nodes are lowered into it
+		position = 0
+		while position < len(bucket):
+			accepted_node = bucket[position]
+			position += 1
+			# lowered nodes are filed again rather than moved, so skip the
+			# entries they left behind
+			if status[accepted_node] != CONSIDERED or bucket_of(expected_cost[accepted_node]) != key:
+				continue
+			# checked before the node is accepted, so that a node left behind
+			# is still one the policy cleanup below can settle
+			if accepted % 256 == 0 and default_timer() >= deadline:
+				complete = False
+				break
+			status[accepted_node] = ACCEPTED
+			accepted += 1
+			if expected_cost[accepted_node] > cost[accepted_node]:
+				# a wide bucket can accept a move worse than staying put
+				expected_cost[accepted_node] = cost[accepted_node]
+				next_node[accepted_node] = -1
+
+			accepted_cost = float(cost[accepted_node])
+			accepted_expected_cost = float(expected_cost[accepted_node])
+			edges = slice(predecessor_offsets[accepted_node], predecessor_offsets[accepted_node+1])
+			neighbor_nodes = predecessor_indices[edges].tolist()
+			if stats is not None:
+				stats.record_relaxations(len(neighbor_nodes))
+
+			# the same moves, clamp included, as random_termination_arrays
+			if not per_edge_p:
+				expected_cost_assuming_motion = max(p*accepted_cost + (1-p)*accepted_expected_cost, accepted_expected_cost) if accepted_cost != accepted_expected_cost else accepted_cost
+				motion_costs = itertools.repeat(expected_cost_assuming_motion)
+			elif accepted_cost != accepted_expected_cost:
+				motion_costs = [ max(edge_p*accepted_cost + (1-edge_p)*accepted_expected_cost, accepted_expected_cost) for edge_p in p[edges].tolist() ]
+			else:
+				motion_costs = itertools.repeat(accepted_cost)
+
+			for neighbor_node, expected_cost_assuming_motion in zip(neighbor_nodes, motion_costs):
+				neighbor_status = status[neighbor_node]
+				if neighbor_status == ACCEPTED or not expected_cost_assuming_motion < expected_cost[neighbor_node]:
+					continue
+				old_key = None if neighbor_status == FAR else bucket_of(expected_cost[neighbor_node])
+				expected_cost[neighbor_node] = expected_cost_assuming_motion
+				status[neighbor_node] = CONSIDERED
+				next_node[neighbor_node] = accepted_node
+				new_key = bucket_of(expected_cost[neighbor_node])
+				if new_key == old_key:
+					continue
+				if new_key == key:
+					bucket.append(neighbor_node)
+				elif new_key in buckets:
+					buckets[new_key].append(neighbor_node)
+				else:
+					buckets[new_key] = [neighbor_node]
+					heapq.heappush(keys, new_key)
+
+	start_phase(stats, 'policy')
+	# unfinished nodes take their move so far, or stay put if that is better
+	stay = (status != ACCEPTED) & ~(expected_cost < cost)
+	expected_cost[stay] = cost[stay]
+	next_node[stay] = -1
+
+	cost64 = cost.astype(np.float64)
+	expected_cost64 = expected_cost.astype(np.float64)
+	_, best_motion = _best_moves(compiled_graph, cost64, expected_cost64, _successor_order(compiled_graph, p))
+	finite = np.isfinite(expected_cost64)
+	residual = np.abs(expected_cost64[finite] - np.minimum(cost64, best_motion)[finite])
+	residual = float(residual.max()) if len(residual) else 0.0
+	p_min = float(np.min(p))
+	start_phase(stats, None)
+	return expected_cost, next_node, { 'complete': complete, 'accepted': accepted,
+		'seconds': default_timer() - start_time, 'residual': residual,
+		'error_bound': residual/p_min if p_min > 0 else np.inf }
+
+@stops_phases
+def random_termination_grid(cost, p, stats=None):
+	""" cost is an (n_rows, n_columns) array of node costs on the 8-neighbour
+			grid of graph_utilities.grid_graph, with cost[i_rows, i_columns]
+			the cost of the node (i_columns, i_rows)
+		p is the probability that the call arrives after each move
+		stats is an optional solver_stats.SolverStats to fill in
+
+		The same sweep as random_termination_arrays, specialised to regular
+			grids: the neighbours of a cell are found from the fixed offsets
+			in compiled_graph.GRID_OFFSETS, so no adjacency is stored at all
+			and only the cost, value, next node and status arrays take memory.
+
+		RETURNS
+		expected_cost, an (n_rows, n_columns) array
+		next_node, an (n_rows, n_columns) array of the flat index
+			i_rows*n_columns + i_columns of the cell each cell moves to,
+			or -1 for the cells which stay put
+	"""
+	start_phase(stats, 'initialization')
+	cost = np.asarray(cost)
+	n_rows, n_columns = cost.shape
+	expected_cost = np.empty(cost.shape)
+	next_node = np.empty(cost.shape, dtype=np.int64)
+	next_node.fill(-1)
+	status = np.zeros(cost.shape, dtype=np.int8)
+
+	start_phase(stats, 'local_minima')
+	padded_cost = np.empty((n_rows + 2, n_columns + 2))
+	padded_cost.fill(np.inf)
+	padded_cost[1:-1,1:-1] = cost
+	is_local_minimum = np.ones(cost.shape, dtype=bool)
+	for d_row, d_column in GRID_OFFSETS:
+		is_local_minimum &= cost <= padded_cost[1+d_row:1+d_row+n_rows, 1+d_column:1+d_column+n_columns]
+	del padded_cost
+
+	expected_cost[is_local_minimum] = cost[is_local_minimum]
+	status[is_local_minimum] = CONSIDERED
+
+	# work on flat views, indexed like compiled_graph.compiled_grid_graph
+	flat_cost = cost.ravel()
+	flat_expected_cost = expected_cost.ravel()
+	flat_next_node = next_node.ravel()
+	flat_status = status.ravel()
+
+	compare_cost = lambda a,b: flat_expected_cost[a] < flat_expected_cost[b]
+	heap = make_heap(np.flatnonzero(is_local_minimum).tolist(), compare_cost, stats)
+	del is_local_minimum
+
+	start_phase(stats, 'sweep')
+	while heap:
+		accepted_node = heap.pop()
+		flat_status[accepted_node] = ACCEPTED
+		accepted_row, accepted_column = divmod(accepted_node, n_columns)
+
+		accepted_cost = flat_cost[accepted_node]
+		accepted_expected_cost = flat_expected_cost[accepted_node]
+		# clamped as in random_termination_arrays
+		expected_cost_assuming_motion = max(p*accepted_cost + (1-p)*accepted_expected_cost, accepted_expected_cost) if accepted_cost != accepted_expected_cost else accepted_cost
+
+		relaxations = 0
+		for d_row, d_column in GRID_OFFSETS:
+			row = accepted_row + d_row
+			column = accepted_column + d_column
+			if row < 0 or row >= n_rows or column < 0 or column >= n_columns:
+				continue
+
+			neighbor_node = row*n_columns + column
+			neighbor_status = flat_status[neighbor_node]
+			relaxations += 1
+			if neighbor_status == FAR:
+				flat_expected_cost[neighbor_node] = expected_cost_assuming_motion
+				flat_status[neighbor_node] = CONSIDERED
+				heap.push(neighbor_node)
+				flat_next_node[neighbor_node] = accepted_node
+			elif neighbor_status == CONSIDERED and expected_cost_assuming_motion < flat_expected_cost[neighbor_node]:
+				flat_expected_cost[neighbor_node] = expected_cost_assuming_motion
+				heap.reheap_from_decrease_at_item(neighbor_node)
+				flat_next_node[neighbor_node] = accepted_node
+
+		if stats is not None:
+			stats.record_relaxations(relaxations)
+
+	start_phase(stats, None)
+	return expected_cost, next_node
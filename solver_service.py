@@ -0,0 +1,231 @@
+""" A local HTTP service answering "where should I stage from here, and at
+	what expected cost" for random termination scenarios.
+
+	python solver_service.py --port 8765
+	python solver_service.py --graph compiled_sf/ --unix-socket /tmp/rt.sock
+
+	POST /solve with a batch_worker scenario, optionally with a "node":
+
+	{"callers": [48525403, 308450481], "probabilities": [0.5, 0.5],
+	 "cost": "expected_value", "p": 0.06, "node": 48525403}
+
+	answers with the expected cost of "node", the staging node its policy
+	ends at and the path there; without "node" it answers with the best
+	staging node overall.  GET /stats reports the cache counters.
+
+	The solves run on a pool of processes.  Identical scenarios that are
+	in flight at the same time are solved once, and the value and policy
+	of the most recent scenarios are kept in an LRU cache, so repeated
+	questions about the same scenario are answered without solving.
+"""
+from __future__ import print_function
+from collections import OrderedDict
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+
+try:
+	from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+	from SocketServer import ThreadingMixIn, UnixStreamServer
+except ImportError:
+	from http.server import BaseHTTPRequestHandler, HTTPServer
+	from socketserver import ThreadingMixIn, UnixStreamServer
+
+import numpy as np
+
+import graph_utilities
+from batch_worker import ScenarioSolver, json_dumps
+from compiled_graph import compile_graph, load_compiled_graph
+from pipeline import policy_path
+
+logger = logging.getLogger(__name__)
+
+# set before the pool forks, so every worker shares the graph
+_scenario_solver = None
+
+def _solve(scenario):
+	solution = _scenario_solver.solve(scenario)
+	return solution.expected_cost, solution.next_node
+
+def scenario_key(scenario):
+	""" a string identifying the solution of a scenario, the same for
+		scenarios listing the same callers in a different order """
+	callers = sorted(zip([ json.dumps(caller) for caller in scenario['callers'] ],
+		[ float(probability) for probability in scenario['probabilities'] ]))
+	return json.dumps([callers, scenario['cost'], scenario.get('allowed_distance'), float(scenario['p'])])
+
+class SolverService(object):
+	"""
+Answers scenarios on one compiled graph, solving them on a process pool.
+
+	* `solution(scenario)` returns the (expected_cost, next_node) arrays of
+		a scenario, from the LRU cache, from a solve already in flight, or
+		from a new solve.
+	* `answer(request)` turns a solution into the json-able reply.
+"""
+	def __init__(self, compiled_graph, processes=None, cache_size=128, max_cached_columns=None):
+		global _scenario_solver
+		_scenario_solver = ScenarioSolver(compiled_graph, max_cached_columns)
+
+		self.compiled_graph = compiled_graph
+		self.pool = multiprocessing.Pool(processes)
+		self.cache_size = cache_size
+		self.cache = OrderedDict()
+		self.in_flight = {}
+		self.lock = threading.Lock()
+		self.counters = { 'solves': 0, 'cache_hits': 0, 'coalesced': 0 }
+
+	def close(self):
+		self.pool.close()
+		self.pool.join()
+
+	def solution(self, scenario):
+		key = scenario_key(scenario)
+		with self.lock:
+			if key in self.cache:
+				self.counters['cache_hits'] += 1
+				solution = self.cache.pop(key)
+				self.cache[key] = solution
+				return solution
+
+			pending = self.in_flight.get(key)
+			if pending is None:
+				self.counters['solves'] += 1
+				pending = self.pool.apply_async(_solve, (scenario,))
+				self.in_flight[key] = pending
+			else:
+				self.counters['coalesced'] += 1
+
+		try:
+			solution = pending.get()
+		finally:
+			# whichever waiter gets here first retires the solve
+			with self.lock:
+				if self.in_flight.get(key) is pending:
+					del self.in_flight[key]
+					if pending.successful():
+						self.cache[key] = pending.get()
+						while len(self.cache) > self.cache_size:
+							self.cache.popitem(last=False)
+		return solution
+
+	def answer(self, request):
+		expected_cost, next_node = self.solution(request)
+		compiled_graph = self.compiled_graph
+
+		if request.get('node') is None:
+			best = int(np.argmin(expected_cost))
+			return { 'staging_node': compiled_graph.node_id(best),
+				'expected_cost': float(expected_cost[best]) }
+
+		node = request['node']
+		index = compiled_graph.node_index[tuple(node) if isinstance(node, list) else node]
+		path = policy_path(next_node, index).tolist()
+		return { 'node': node,
+			'expected_cost': float(expected_cost[index]),
+			'staging_node': compiled_graph.node_id(path[-1]),
+			'path': [ compiled_graph.node_id(i) for i in path ] }
+
+class SolverRequestHandler(BaseHTTPRequestHandler):
+	def address_string(self):
+		# unix sockets have no client address
+		return str(self.client_address or 'local')
+
+	def _reply(self, status, body):
+		data = json_dumps(body).encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	def do_GET(self):
+		if self.path == '/stats':
+			service = self.server.service
+			with service.lock:
+				stats = dict(service.counters, cached=len(service.cache), in_flight=len(service.in_flight))
+			self._reply(200, stats)
+		else:
+			self._reply(404, { 'error': "unknown path %s" % self.path })
+
+	def do_POST(self):
+		if self.path != '/solve':
+			self._reply(404, { 'error': "unknown path %s" % self.path })
+			return
+		try:
+			length = int(self.headers.get('Content-Length', 0))
+			request = json.loads(self.rfile.read(length).decode('utf-8'))
+			self._reply(200, self.server.service.answer(request))
+		except (KeyError, ValueError, TypeError) as error:
+			self._reply(400, { 'error': "%s: %s" % (type(error).__name__, error) })
+		except Exception as error:
+			# a failed solve must not drop the connection without a reply
+			logger.exception("error answering %s", self.path)
+			self._reply(500, { 'error': "%s: %s" % (type(error).__name__, error) })
+
+	def log_message(self, format, *args):
+		if self.server.verbose:
+			BaseHTTPRequestHandler.log_message(self, format, *args)
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+	daemon_threads = True
+
+def make_server(service, address, verbose=False):
+	""" address is a (host, port) pair, or the path of a unix socket
+
+		RETURNS
+		a threaded server answering requests with service; call its
+			serve_forever() to start it
+	"""
+	if isinstance(address, tuple):
+		server = ThreadingHTTPServer(address, SolverRequestHandler)
+	else:
+		if os.path.exists(address):
+			os.remove(address)
+		server = ThreadingUnixHTTPServer(address, SolverRequestHandler)
+	server.service = service
+	server.verbose = verbose
+	return server
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Serve random termination solves on localhost.")
+	parser.add_argument('--graph', help="a directory written by CompiledGraph.save; the SF map if left out")
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8765)
+	parser.add_argument('--unix-socket', help="listen on this unix socket instead of a port")
+	parser.add_argument('--processes', type=int, default=None)
+	parser.add_argument('--cache-size', type=int, default=128,
+		help="the number of scenario solutions kept")
+	parser.add_argument('--max-cached-columns', type=int, default=None,
+		help="the most caller distance columns each worker keeps")
+	parser.add_argument('--verbose', action='store_true')
+	args = parser.parse_args(argv)
+	logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+	if args.graph:
+		compiled = load_compiled_graph(args.graph)
+	else:
+		compiled = compile_graph(graph_utilities.sf_map())
+
+	service = SolverService(compiled, args.processes, args.cache_size, args.max_cached_columns)
+	server = make_server(service, args.unix_socket or (args.host, args.port), args.verbose)
+	print("serving on %s" % (args.unix_socket or "http://%s:%d" % server.server_address[:2]))
+	sys.stdout.flush()
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		service.close()
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,113 @@
+from collections import OrderedDict
+import functools
+try:
+	from inspect import getfullargspec as getargspec
+except ImportError:
+	from inspect import getargspec
+from timeit import default_timer
+from labeled_heap import HeapStats, InstrumentedLabeledHeap, LabeledHeap
+
+class SolverStats(object):
+	"""
+Collects what a solver did while it ran.  Pass an instance as the `stats`
+	argument of any solver in random_termination; leaving `stats` as None
+	runs the solvers exactly as before.
+
+	* `heap`: a HeapStats with the pushes, pops, decrease-keys,
+		comparisons, swap depths and high-water mark of the solver's heap.
+	* `accepted`: the number of nodes popped off the heap.
+	* `relaxations`: the number of times the value of a node was
+		recomputed from an accepted successor, and `max_relaxations` the
+		most relaxations made from a single accepted node.
+	* `phase_times`: an ordered dict of seconds spent in each phase, 
+		'predecessor_sets', 'local_minima' and 'sweep' for the dict-based
+		solvers.  Solvers made of smaller solves merge in the phase times
+		of their parts next to their own phases.
+"""
+	def __init__(self):
+		self.heap = HeapStats()
+		self.accepted = 0
+		self.relaxations = 0
+		self.max_relaxations = 0
+		self.phase_times = OrderedDict()
+		self._phase = None
+		self._phase_start = None
+
+	def start_phase(self, phase):
+		""" stop timing the current phase, if any, and start timing phase """
+		now = default_timer()
+		if self._phase is not None:
+			self.phase_times[self._phase] = self.phase_times.get(self._phase, 0.0) + now - self._phase_start
+		self._phase = phase
+		self._phase_start = now
+
+	def stop(self):
+		""" stop timing the current phase """
+		self.start_phase(None)
+
+	def record_relaxations(self, relaxations):
+		self.accepted += 1
+		self.relaxations += relaxations
+		if relaxations > self.max_relaxations:
+			self.max_relaxations = relaxations
+
+	@property
+	def relaxations_per_node(self):
+		return float(self.relaxations) / self.accepted if self.accepted else 0.0
+
+	def merge(self, other):
+		""" add the counts and times of another SolverStats into this one """
+		self.heap.merge(other.heap)
+		self.accepted += other.accepted
+		self.relaxations += other.relaxations
+		self.max_relaxations = max(self.max_relaxations, other.max_relaxations)
+		for phase, seconds in other.phase_times.items():
+			self.phase_times[phase] = self.phase_times.get(phase, 0.0) + seconds
+
+	def as_dict(self):
+		return {
+			'heap': self.heap.as_dict(),
+			'accepted': self.accepted,
+			'relaxations': self.relaxations,
+			'max_relaxations': self.max_relaxations,
+			'relaxations_per_node': self.relaxations_per_node,
+			'phase_times': dict(self.phase_times) }
+
+	def __getstate__(self):
+		# the phase timer is only meaningful in the process that started it
+		state = self.__dict__.copy()
+		state['_phase'] = state['_phase_start'] = None
+		return state
+
+	def __repr__(self):
+		return "SolverStats(accepted=%d, relaxations=%d, %r, phase_times=%s)" % (
+			self.accepted, self.relaxations, self.heap,
+			", ".join("%s=%.3fs" % item for item in self.phase_times.items()))
+
+def start_phase(stats, phase):
+	""" stats.start_phase(phase), unless stats is None """
+	if stats is not None:
+		stats.start_phase(phase)
+
+def stops_phases(solver):
+	""" decorates a solver taking a `stats` argument so that the phase it
+		is timing is stopped however it returns.  A solver that raises
+		would otherwise leave its phase running, and the time until the
+		next start_phase on the same stats would be put down to it. """
+	stats_position = getargspec(solver).args.index('stats')
+
+	@functools.wraps(solver)
+	def solve(*args, **kwargs):
+		try:
+			return solver(*args, **kwargs)
+		finally:
+			start_phase(kwargs['stats'] if 'stats' in kwargs
+				else args[stats_position] if len(args) > stats_position else None, None)
+	return solve
+
+def make_heap(initial_elements, is_less_than, stats):
+	""" a LabeledHeap, or an InstrumentedLabeledHeap counting into
+		stats.heap when stats is not None """
+	if stats is None:
+		return LabeledHeap(initial_elements, is_less_than=is_less_than)
+	return InstrumentedLabeledHeap(initial_elements, is_less_than=is_less_than, stats=stats.heap)
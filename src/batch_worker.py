@@ -0,0 +1,164 @@
+""" Answers a stream of random termination scenarios, one JSON object per
+	line, without paying for loading the graph on every request.
+
+	python batch_worker.py < scenarios.jsonl > results.jsonl
+	python batch_worker.py --graph compiled_sf/ --processes 4 scenarios.jsonl
+	python batch_worker.py --results-directory out/ scenarios.jsonl
+
+	A scenario looks like
+
+	{"id": "a", "callers": [48525403, 308450481], "probabilities": [0.5, 0.5],
+	 "cost": "exceeding_distance", "allowed_distance": 350, "p": 0.06}
+
+	where "cost" is "expected_value" or "exceeding_distance" (the latter
+	needing "allowed_distance").  Each result line holds the scenario id,
+	the best staging node and its expected cost, and either the expected
+	cost and next node of every node, or, with --results-directory, the
+	path of a solver_results directory holding them as .npy columns.
+	An infinite expected cost, for a node from which no caller can be
+	reached, is written as null.  A scenario which cannot be solved gets an "error" instead.
+"""
+from __future__ import print_function
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import sys
+
+import graph_utilities
+from compiled_graph import DistanceColumnCache, compile_graph, load_compiled_graph
+from pipeline import random_termination_pipeline
+
+class ScenarioSolver(object):
+	"""
+Solves scenarios on one compiled graph, keeping the distance columns of
+	the callers it has seen in a DistanceColumnCache.
+"""
+	def __init__(self, compiled_graph, max_cached_columns=None):
+		self.compiled_graph = compiled_graph
+		self.distance_cache = DistanceColumnCache(compiled_graph, max_cached_columns)
+
+	def solve(self, scenario):
+		""" RETURNS
+			the pipeline.PipelineResult of a scenario
+		"""
+		cost_spec = { 'cost': scenario['cost'] }
+		if scenario['cost'] == 'exceeding_distance':
+			cost_spec['allowed_distance'] = scenario['allowed_distance']
+
+		caller_indices = self.compiled_graph.indices_of(scenario['callers'])
+		return random_termination_pipeline(self.compiled_graph, caller_indices,
+			scenario['probabilities'], cost_spec, scenario['p'], self.distance_cache)
+
+	def answer(self, scenario, results_directory=None):
+		""" RETURNS
+			the json-able result line for a scenario
+		"""
+		solution = self.solve(scenario)
+		best = solution.best_node()
+		result = { 'id': scenario.get('id'),
+			'best_node': self.compiled_graph.node_id(best),
+			'best_expected_cost': float(solution.expected_cost[best]) }
+
+		if results_directory is None:
+			result['expected_cost'] = [ [ self.compiled_graph.node_id(i), value ]
+				for i, value in enumerate(solution.expected_cost.tolist()) ]
+			result['edgelist'] = solution.edgelist()
+		else:
+			path = os.path.join(results_directory, str(scenario.get('id')))
+			solution.solver_result(callers=scenario['callers'],
+				probabilities=list(scenario['probabilities'])).save(path)
+			result['result'] = path
+		return result
+
+def json_dumps(value):
+	""" json.dumps, writing the non-finite floats in value (the expected
+		cost of a node that can reach no caller, say) as null rather than
+		as the Infinity and NaN that strict json parsers reject """
+	return json.dumps(_finite_or_none(value), allow_nan=False)
+
+def _finite_or_none(value):
+	if isinstance(value, float):
+		return None if math.isinf(value) or math.isnan(value) else value
+	if isinstance(value, dict):
+		return { key: _finite_or_none(item) for key, item in value.items() }
+	if isinstance(value, (list, tuple)):
+		return [ _finite_or_none(item) for item in value ]
+	return value
+
+# set in the parent before the pool forks, so every worker shares the graph
+_scenario_solver = None
+_results_directory = None
+
+def _answer_line(line):
+	try:
+		scenario = json.loads(line)
+	except ValueError as error:
+		return { 'id': None, 'error': "invalid json: %s" % error }
+	try:
+		return _scenario_solver.answer(scenario, _results_directory)
+	except (KeyError, ValueError, TypeError) as error:
+		return { 'id': scenario.get('id') if isinstance(scenario, dict) else None,
+			'error': "%s: %s" % (type(error).__name__, error) }
+
+def run(lines, output, processes=1, max_pending=64):
+	""" answer every non-blank line of lines, writing one json result per
+		line to output in the same order.  With more than one process, at
+		most max_pending scenarios are read ahead of the results written. """
+	lines = ( line for line in lines if line.strip() )
+	if processes == 1:
+		for line in lines:
+			output.write(json_dumps(_answer_line(line)) + '\n')
+			output.flush()
+		return
+
+	pool = multiprocessing.Pool(processes)
+	try:
+		while True:
+			batch = list(itertools.islice(lines, max_pending))
+			if not batch:
+				break
+			for result in pool.imap(_answer_line, batch):
+				output.write(json_dumps(result) + '\n')
+			output.flush()
+	finally:
+		pool.close()
+		pool.join()
+
+def main(argv=None):
+	global _scenario_solver, _results_directory
+
+	parser = argparse.ArgumentParser(description="Answer random termination scenarios given as JSON lines.")
+	parser.add_argument('input', nargs='?', help="scenario file, stdin if left out")
+	parser.add_argument('--output', help="result file, stdout if left out")
+	parser.add_argument('--graph', help="a directory written by CompiledGraph.save; the SF map if left out")
+	parser.add_argument('--processes', type=int, default=1)
+	parser.add_argument('--max-pending', type=int, default=64)
+	parser.add_argument('--max-cached-columns', type=int, default=None,
+		help="the most caller distance columns each worker keeps")
+	parser.add_argument('--results-directory',
+		help="write each result as a solver_results directory here instead of inline")
+	args = parser.parse_args(argv)
+
+	if args.graph:
+		compiled = load_compiled_graph(args.graph)
+	else:
+		compiled = compile_graph(graph_utilities.sf_map())
+	_scenario_solver = ScenarioSolver(compiled, args.max_cached_columns)
+	_results_directory = args.results_directory
+
+	input_file = open(args.input) if args.input else sys.stdin
+	output_file = open(args.output, 'w') if args.output else sys.stdout
+	try:
+		run(input_file, output_file, args.processes, args.max_pending)
+	finally:
+		if args.input:
+			input_file.close()
+		if args.output:
+			output_file.close()
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
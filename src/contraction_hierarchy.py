@@ -0,0 +1,235 @@
+import heapq
+import numpy as np
+
+from labeled_heap import LabeledHeap
+from compiled_graph import node_label, save_array_directory, load_array_directory
+
+class ContractionHierarchy(object):
+	"""
+A contraction hierarchy of a CompiledGraph, for answering one-to-many
+	shortest distance queries from callers that change all the time on a
+	road graph that does not.
+
+Every node has a `rank`, the order in which it was contracted.  The
+	hierarchy's edges are the original edges plus the shortcuts added
+	while contracting, split into
+
+	* upward edges, from a node to a higher ranked node, held in CSR form
+		in `up_offsets`, `up_indices` and `up_weights`, and
+	* downward edges, from a node to a lower ranked node, held as
+		`down_tails`, `down_heads` and `down_weights`, sorted by the
+		`down_levels` of their heads, then by head.  A node's level is one
+		more than the highest level of the nodes with a downward edge into
+		it, so the nodes of one level only depend on lower levels.
+
+A query from a source (PHAST) runs Dijkstra on the small upward graph,
+	then sweeps the downward edges level by level with array operations,
+	for all the sources of the query at once.  The distances are the
+	shortest distances, but they can differ from a Dijkstra search of the
+	original graph in the last bits, since a shortcut's weight is summed
+	before the rest of its path.  That is fine for the cost columns of a
+	DistanceColumnCache, but not where distances are compared exactly, as
+	graph_utilities.summed_pdf does when it buckets them, so those still
+	use Dijkstra.
+"""
+	array_names = ['node_ids', 'rank', 'up_offsets', 'up_indices', 'up_weights',
+		'down_tails', 'down_heads', 'down_weights', 'down_levels']
+
+	def __init__(self, node_ids, rank, up_offsets, up_indices, up_weights,
+		down_tails, down_heads, down_weights, down_levels):
+
+		self.node_ids = node_ids
+		self.rank = rank
+		self.up_offsets = up_offsets
+		self.up_indices = up_indices
+		self.up_weights = up_weights
+		self.down_tails = down_tails
+		self.down_heads = down_heads
+		self.down_weights = down_weights
+		self.down_levels = down_levels
+		self._sweep = None
+		self._node_index = None
+
+	@property
+	def n_nodes(self):
+		return len(self.rank)
+
+	@property
+	def node_index(self):
+		if self._node_index is None:
+			self._node_index = { node_label(self.node_ids, i): i for i in xrange(self.n_nodes) }
+		return self._node_index
+
+	def _downward_sweep(self):
+		# per level: the edges, and where each head's run of edges starts
+		if self._sweep is None:
+			down_levels = np.asarray(self.down_levels)
+			down_heads = np.asarray(self.down_heads)
+			level_starts = np.flatnonzero(np.r_[True, down_levels[1:] != down_levels[:-1]])
+			level_stops = np.r_[level_starts[1:], len(down_levels)]
+			self._sweep = []
+			for start, stop in zip(level_starts, level_stops):
+				heads = down_heads[start:stop]
+				head_starts = np.flatnonzero(np.r_[True, heads[1:] != heads[:-1]])
+				self._sweep.append((
+					np.asarray(self.down_tails[start:stop]),
+					np.asarray(self.down_weights[start:stop])[:,None],
+					head_starts, heads[head_starts]))
+		return self._sweep
+
+	def distances_from(self, sources):
+		""" sources is a list or array of node indices
+
+			RETURNS
+			an (n_nodes, len(sources)) array of the distances from each source
+				to every node, as CompiledGraph.distances_from returns them
+		"""
+		from scipy.sparse import csr_matrix
+		from scipy.sparse.csgraph import dijkstra
+
+		upward = csr_matrix(
+			(np.asarray(self.up_weights), np.asarray(self.up_indices), np.asarray(self.up_offsets)),
+			shape=(self.n_nodes, self.n_nodes))
+		distances = np.ascontiguousarray(
+			dijkstra(upward, directed=True, indices=np.asarray(sources, dtype=np.int64)).T)
+
+		for tails, weights, head_starts, heads in self._downward_sweep():
+			candidates = np.minimum.reduceat(distances[tails] + weights, head_starts, axis=0)
+			distances[heads] = np.minimum(distances[heads], candidates)
+		return distances
+
+	def save(self, directory):
+		save_array_directory(directory, { name: getattr(self, name) for name in self.array_names })
+
+def load_contraction_hierarchy(directory, mmap_mode='r'):
+	""" open a hierarchy written by ContractionHierarchy.save """
+	arrays, _ = load_array_directory(directory, mmap_mode)
+	return ContractionHierarchy(**{ name: arrays[name] for name in ContractionHierarchy.array_names })
+
+def _witness_distances(out_edges, source, skipped_node, max_distance, settle_limit):
+	""" distances from source in the remaining graph, avoiding skipped_node,
+		searched no further than max_distance or settle_limit nodes """
+	distances = { source: 0.0 }
+	queue = [(0.0, source)]
+	settled = 0
+	while queue and settled < settle_limit:
+		distance, node = heapq.heappop(queue)
+		if distance > distances[node]:
+			continue
+		if distance > max_distance:
+			break
+		settled += 1
+		for neighbor_node, weight in out_edges[node].items():
+			if neighbor_node == skipped_node:
+				continue
+			new_distance = distance + weight
+			if new_distance < distances.get(neighbor_node, np.inf):
+				distances[neighbor_node] = new_distance
+				heapq.heappush(queue, (new_distance, neighbor_node))
+	return distances
+
+def _shortcuts(out_edges, in_edges, node, settle_limit):
+	""" the shortcuts (tail, head, weight) needed to contract node """
+	shortcuts = []
+	for tail, in_weight in in_edges[node].items():
+		targets = [ (head, in_weight + out_weight) for head, out_weight in out_edges[node].items() if head != tail ]
+		if not targets:
+			continue
+		witness = _witness_distances(out_edges, tail, node, max(w for _, w in targets), settle_limit)
+		for head, weight in targets:
+			if witness.get(head, np.inf) > weight:
+				shortcuts.append((tail, head, weight))
+	return shortcuts
+
+def build_contraction_hierarchy(compiled_graph, settle_limit=64):
+	""" compiled_graph is a compiled_graph.CompiledGraph
+		settle_limit bounds the witness searches: a larger limit finds more
+			witnesses and adds fewer shortcuts, at a higher preprocessing cost
+
+		Contracts the nodes one at a time in order of their edge difference
+			(shortcuts added less edges removed, plus the number of already
+			contracted neighbours), keeping the priorities up to date lazily.
+
+		RETURNS
+		a ContractionHierarchy
+	"""
+	n_nodes = compiled_graph.n_nodes
+	out_edges = [ {} for _ in xrange(n_nodes) ]
+	in_edges = [ {} for _ in xrange(n_nodes) ]
+	offsets = np.asarray(compiled_graph.successor_offsets)
+	indices = np.asarray(compiled_graph.successor_indices)
+	weights = np.asarray(compiled_graph.successor_weights)
+	for tail in xrange(n_nodes):
+		for head, weight in zip(indices[offsets[tail]:offsets[tail+1]].tolist(), weights[offsets[tail]:offsets[tail+1]].tolist()):
+			if head != tail and weight < out_edges[tail].get(head, np.inf):
+				out_edges[tail][head] = weight
+				in_edges[head][tail] = weight
+
+	# every edge of the hierarchy, keeping the lightest of parallel edges
+	hierarchy_edges = {}
+	for tail in xrange(n_nodes):
+		for head, weight in out_edges[tail].items():
+			hierarchy_edges[(tail, head)] = weight
+
+	contracted_neighbors = np.zeros(n_nodes, dtype=np.int64)
+	def edge_difference(node):
+		return len(_shortcuts(out_edges, in_edges, node, settle_limit)) \
+			- len(in_edges[node]) - len(out_edges[node]) + contracted_neighbors[node]
+
+	priority = [ edge_difference(node) for node in xrange(n_nodes) ]
+	heap = LabeledHeap(xrange(n_nodes), is_less_than=lambda a,b: (priority[a], a) < (priority[b], b))
+
+	rank = np.empty(n_nodes, dtype=np.int64)
+	next_rank = 0
+	while heap:
+		node = heap.pop()
+		# priorities go stale as the graph changes; recheck before contracting
+		priority[node] = edge_difference(node)
+		if heap and (priority[node], node) > (priority[heap.heap[0]], heap.heap[0]):
+			heap.push(node)
+			continue
+
+		rank[node] = next_rank
+		next_rank += 1
+		for tail, head, weight in _shortcuts(out_edges, in_edges, node, settle_limit):
+			if weight < out_edges[tail].get(head, np.inf):
+				out_edges[tail][head] = weight
+				in_edges[head][tail] = weight
+			if weight < hierarchy_edges.get((tail, head), np.inf):
+				hierarchy_edges[(tail, head)] = weight
+
+		for neighbor_node in set(in_edges[node]) | set(out_edges[node]):
+			out_edges[neighbor_node].pop(node, None)
+			in_edges[neighbor_node].pop(node, None)
+			contracted_neighbors[neighbor_node] += 1
+		out_edges[node] = {}
+		in_edges[node] = {}
+
+	edge_list = list(hierarchy_edges.items())
+	tails = np.array([ tail for (tail, _), _ in edge_list ], dtype=np.int64)
+	heads = np.array([ head for (_, head), _ in edge_list ], dtype=np.int64)
+	weights = np.array([ weight for _, weight in edge_list ], dtype=np.float64)
+
+	upward = rank[tails] < rank[heads]
+	up_order = np.lexsort((heads[upward], tails[upward]))
+	up_offsets = np.zeros(n_nodes + 1, dtype=np.int64)
+	np.cumsum(np.bincount(tails[upward], minlength=n_nodes), out=up_offsets[1:])
+
+	down_tails = tails[~upward]
+	down_heads = heads[~upward]
+	down_weights = weights[~upward]
+	# levels, working down from the highest ranked node
+	node_level = np.zeros(n_nodes, dtype=np.int64)
+	down_into = [ [] for _ in xrange(n_nodes) ]
+	for tail, head in zip(down_tails.tolist(), down_heads.tolist()):
+		down_into[head].append(tail)
+	for node in np.argsort(-rank).tolist():
+		if down_into[node]:
+			node_level[node] = 1 + max(node_level[tail] for tail in down_into[node])
+	down_levels = node_level[down_heads]
+	down_order = np.lexsort((down_heads, down_levels))
+
+	return ContractionHierarchy(np.asarray(compiled_graph.node_ids), rank,
+		up_offsets, heads[upward][up_order], weights[upward][up_order],
+		down_tails[down_order], down_heads[down_order], down_weights[down_order],
+		down_levels[down_order])
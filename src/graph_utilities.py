@@ -1,8 +1,12 @@
 from collections import defaultdict
+import os
 import numpy as np
 import networkx as nx
 import json
 
+# the SF road network, next to this module rather than in the working directory
+SF_NETWORK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "SF network.json")
+
 def grid_graph(n_columns, n_rows):
 
 	graph = nx.DiGraph()
@@ -111,15 +115,123 @@ def make_exceeding_distance_cost(allowed_distance):
 
 	return exceeding_distance_cost
 
+def distance_matrix_cost(distances, caller_relative_probabilities, cost_spec):
+	""" distances is an (n_nodes, n_callers) array, as returned by
+			compiled_graph.CompiledGraph.distances_from
+		caller_relative_probabilities is an array of n_callers probabilities
+		cost_spec is a dict naming the cost function, either
+			{'cost': 'expected_value'} or
+			{'cost': 'exceeding_distance', 'allowed_distance': d}
+
+		RETURNS
+		an array of the cost of every node: graph_cost with expected_value or
+			make_exceeding_distance_cost(d), for all nodes at once.  For
+			float32 distances the cost is float32 too, but it is summed in
+			float64 one caller at a time, without a float64 copy of distances.
+	"""
+	caller_relative_probabilities = np.asarray(caller_relative_probabilities, dtype=np.float64)
+	if cost_spec['cost'] not in ('expected_value', 'exceeding_distance'):
+		raise ValueError("unknown cost %r" % cost_spec['cost'])
+
+	if distances.dtype != np.float32:
+		if cost_spec['cost'] == 'expected_value':
+			return np.dot(distances, caller_relative_probabilities)
+		return np.dot(distances > cost_spec['allowed_distance'], caller_relative_probabilities)
+
+	cost = np.zeros(len(distances))
+	for i, probability in enumerate(caller_relative_probabilities.tolist()):
+		if cost_spec['cost'] == 'expected_value':
+			cost += probability*distances[:,i]
+		else:
+			cost[distances[:,i] > cost_spec['allowed_distance']] += probability
+	return cost.astype(np.float32)
+
+class CallerCost(object):
+	"""
+The cost of every node for one set of callers, kept up to date as their
+	probabilities drift.
+
+Both costs of distance_matrix_cost are linear in the caller probabilities:
+	`distances @ probabilities` for expected_value, and
+	`(distances > allowed_distance) @ probabilities` for exceeding_distance.
+	So when a few callers' probabilities change, `update` adds the matching
+	few columns times the changes to the cost, in O(n_nodes) per caller
+	rather than the O(n_nodes*n_callers) of computing it again, and returns
+	the nodes whose cost changed, for random_termination.random_termination_incremental.
+
+The cost is kept in float64 whatever the dtype of the distances; `cost`
+	hands it out in the dtype distance_matrix_cost would.  Rounding builds
+	up over very many updates, so `refresh` computes it again from scratch.
+"""
+	def __init__(self, distances, caller_relative_probabilities, cost_spec, cost=None):
+		self.distances = distances
+		self.caller_relative_probabilities = np.array(caller_relative_probabilities, dtype=np.float64)
+		self.cost_spec = cost_spec
+		if cost is None:
+			self.refresh()
+		else:
+			self._cost = np.array(cost, dtype=np.float64)
+
+	@property
+	def cost(self):
+		if self.distances.dtype == np.float32:
+			return self._cost.astype(np.float32)
+		return self._cost
+
+	def refresh(self):
+		""" compute the cost of every node again from the distances """
+		self._cost = np.asarray(distance_matrix_cost(self.distances, self.caller_relative_probabilities,
+			self.cost_spec), dtype=np.float64)
+
+	def update(self, callers, caller_relative_probabilities):
+		""" callers is an array of caller positions, columns of distances
+			caller_relative_probabilities is an array of their new
+				probabilities
+
+			The other callers' probabilities are left as they are, so the
+				total is only kept at 1 if the changes balance out.  A caller
+				given more than once takes the last of its probabilities.
+
+			RETURNS
+			an array of the indices of the nodes whose cost changed
+		"""
+		callers, last = np.unique(np.asarray(callers, dtype=np.int64)[::-1], return_index=True)
+		caller_relative_probabilities = np.asarray(caller_relative_probabilities, dtype=np.float64)[::-1][last]
+		delta = caller_relative_probabilities - self.caller_relative_probabilities[callers]
+		self.caller_relative_probabilities[callers] += delta
+		moved = delta != 0
+		callers, delta = callers[moved], delta[moved]
+		if len(callers) == 0:
+			return np.zeros(0, dtype=np.int64)
+
+		columns = self.distances[:,callers].astype(np.float64)
+		if self.cost_spec['cost'] == 'exceeding_distance':
+			columns = columns > self.cost_spec['allowed_distance']
+		change = np.dot(columns, delta)
+		changed = np.flatnonzero(change != 0)
+		self._cost[changed] += change[changed]
+
+		# an unreachable caller makes the cost inf, which no change can undo
+		nonfinite = changed[~np.isfinite(self._cost[changed])]
+		if len(nonfinite):
+			self._cost[nonfinite] = distance_matrix_cost(self.distances[nonfinite],
+				self.caller_relative_probabilities, self.cost_spec)
+		return changed
+
 def find_local_minima(graph, cost, multiple_costs=False):
 	local_minima = []
 
 	if not multiple_costs:
 		for node in graph.nodes():
-			if cost[node] <= min([ cost[nn] for nn in graph.successors(node)]):
+			successor_costs = [ cost[nn] for nn in graph.successors(node) ]
+			# nodes without successors cannot move, so they are always minima
+			if not successor_costs or cost[node] <= min(successor_costs):
 				local_minima.append(node)
 	else:
 		for node in graph.nodes():
+			if not list(graph.successors(node)):
+				local_minima.append(node)
+				continue
 			for i in xrange(len(cost[node])):
 				if cost[node][i] <= min([cost[nn][i] for nn in graph.successors(node)]):
 					if cost[node][i] < min([cost[nn][i] for nn in graph.successors(node)]):
@@ -133,8 +245,8 @@ def find_local_minima(graph, cost, multiple_costs=False):
 					break	
 	return local_minima
 
-def sf_map():
-	network_file = open("SF network.json")
+def sf_map(path=SF_NETWORK_PATH):
+	network_file = open(path)
 	roads = []
 	for line in network_file:
 		roads += [json.loads(line)]
@@ -149,8 +261,8 @@ def sf_map():
 		g.add_edge(
 			roads[i]['startNodeId']['primary'], 
 			roads[i]['endNodeId']['primary'],
-			roads[i],
-			weight=roads[i]['length']/roads[i]['speedLimit'])
+			weight=roads[i]['length']/roads[i]['speedLimit'],
+			**roads[i])
 
 		roads_starting_at_node[roads[i]['startNodeId']['primary']].append((roads[i]['id']['primary'], roads[i]['id']['secondary'], i))
 		roads_ending_at_node[roads[i]['endNodeId']['primary']].append((roads[i]['id']['primary'], roads[i]['id']['secondary'], i))
@@ -163,7 +275,10 @@ def sf_map():
 		position_data = np.array(map(lambda a: [a['lon'],a['lat']], position_data_dicts))
 		mean_lon, mean_lat = np.mean(position_data, axis=0)
 		node_coordinates[node] = (mean_lon, mean_lat)
-	nx.set_node_attributes(g, 'pos', node_coordinates)
+	# add_node merges attributes under every networkx version, unlike
+	# set_node_attributes, whose arguments changed order in 2.0
+	for node, pos in node_coordinates.items():
+		g.add_node(node, pos=pos)
 	return g
 
 def make_direction_subgraph(graph, edgelist):
@@ -176,8 +291,8 @@ def make_direction_subgraph(graph, edgelist):
 
 def make_path(direction_subgraph, start_node):
 	path = [start_node]
-	while direction_subgraph.neighbors(path[-1]):
-		path.append(direction_subgraph.neighbors(path[-1])[0])
+	while list(direction_subgraph.neighbors(path[-1])):
+		path.append(list(direction_subgraph.neighbors(path[-1]))[0])
 	return path
 
 def make_path_edgelist(path):
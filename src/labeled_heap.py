@@ -191,3 +191,88 @@ To push an element onto the heap, it is placed at the end of the
 
 	def __nonzero__(self):
 		return bool(self.heap)
+
+
+class HeapStats(object):
+	""" Counters filled in by an InstrumentedLabeledHeap """
+	fields = ['pushes', 'pops', 'decrease_keys', 'comparisons',
+		'swaps', 'max_swap_depth', 'max_size']
+
+	def __init__(self):
+		for field in self.fields:
+			setattr(self, field, 0)
+
+	def merge(self, other):
+		""" add the counts of another HeapStats into this one """
+		for field in self.fields:
+			if field.startswith('max_'):
+				setattr(self, field, max(getattr(self, field), getattr(other, field)))
+			else:
+				setattr(self, field, getattr(self, field) + getattr(other, field))
+
+	def as_dict(self):
+		return { field: getattr(self, field) for field in self.fields }
+
+	def __repr__(self):
+		return "HeapStats(%s)" % ", ".join("%s=%d" % (field, getattr(self, field)) for field in self.fields)
+
+
+def _depth(index):
+	# the level of index within the implicit binary tree
+	return (index + 1).bit_length() - 1
+
+
+class InstrumentedLabeledHeap(LabeledHeap):
+	"""
+A LabeledHeap which counts its operations into a HeapStats object:
+	pushes, pops, decrease-keys, calls to the comparison function,
+	the total number of levels elements were moved by (`swaps`), the
+	largest such move in a single reheap (`max_swap_depth`) and the
+	largest number of elements held at once (`max_size`).
+
+It is a separate class so that the plain LabeledHeap pays nothing for
+	the counting when no statistics are wanted.
+"""
+	def __init__(self,
+		initial_elements,
+		is_less_than = lambda a,b: a<b,
+		stats = None):
+
+		self.stats = HeapStats() if stats is None else stats
+
+		def counting_is_less_than(a, b):
+			self.stats.comparisons += 1
+			return is_less_than(a, b)
+
+		LabeledHeap.__init__(self, initial_elements, is_less_than=counting_is_less_than)
+
+	def _record_swaps(self, depth):
+		self.stats.swaps += depth
+		if depth > self.stats.max_swap_depth:
+			self.stats.max_swap_depth = depth
+
+	def _reheap_up(self, index_of_increase, item):
+		LabeledHeap._reheap_up(self, index_of_increase, item)
+		self._record_swaps(_depth(self.item_index_dict[item]) - _depth(index_of_increase))
+
+	def _reheap_down(self, index_of_decrease, item):
+		LabeledHeap._reheap_down(self, index_of_decrease, item)
+		self._record_swaps(_depth(index_of_decrease) - _depth(self.item_index_dict[item]))
+
+	def reheap_from_decrease_at_index(self, index_of_decrease):
+		self.stats.decrease_keys += 1
+		LabeledHeap.reheap_from_decrease_at_index(self, index_of_decrease)
+
+	def reheap_from_decrease_at_item(self, item):
+		self.stats.decrease_keys += 1
+		LabeledHeap.reheap_from_decrease_at_item(self, item)
+
+	def push(self, item):
+		self.stats.pushes += 1
+		LabeledHeap.push(self, item)
+		if len(self.heap) > self.stats.max_size:
+			self.stats.max_size = len(self.heap)
+
+	def pop(self):
+		self.stats.pops += 1
+		return LabeledHeap.pop(self)
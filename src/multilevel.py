@@ -0,0 +1,139 @@
+from collections import OrderedDict
+from timeit import default_timer
+import numpy as np
+
+from compiled_graph import compiled_graph_from_edges
+from random_termination import random_termination_arrays, random_termination_refine
+
+def coarsen_by_cells(compiled_graph, cell_size):
+	""" compiled_graph is a compiled_graph.CompiledGraph with a pos array
+		cell_size is the side of the square cells nodes are merged in, in
+			the units of pos
+
+		Every node is merged with the others in its cell, at the mean of
+			their positions.  Two merged nodes are joined by an edge when
+			any of their members are, with the lightest of those weights.
+
+		RETURNS
+		the coarse CompiledGraph, whose node ids are its node indices, and
+			an array of the coarse node index of every node
+	"""
+	if compiled_graph.pos is None:
+		raise ValueError("the graph has no node positions to coarsen by")
+	pos = np.asarray(compiled_graph.pos, dtype=np.float64)
+	cells = np.floor(pos/cell_size).astype(np.int64)
+	cells -= cells.min(axis=0)
+	_, cluster = np.unique(cells[:,0]*(cells[:,1].max() + 1) + cells[:,1], return_inverse=True)
+	cluster = cluster.ravel()
+	n_clusters = cluster.max() + 1
+	members = np.bincount(cluster).astype(np.float64)
+	coarse_pos = np.column_stack([ np.bincount(cluster, pos[:,k])/members for k in (0, 1) ])
+
+	successor_offsets = np.asarray(compiled_graph.successor_offsets)
+	tails = cluster[np.repeat(np.arange(compiled_graph.n_nodes), np.diff(successor_offsets))]
+	heads = cluster[np.asarray(compiled_graph.successor_indices)]
+	weights = np.asarray(compiled_graph.successor_weights, dtype=np.float64)
+	between = tails != heads
+	tails, heads, weights = tails[between], heads[between], weights[between]
+	# the lightest edge of every pair of clusters
+	order = np.lexsort((weights, heads, tails))
+	tails, heads, weights = tails[order], heads[order], weights[order]
+	first = np.r_[True, (tails[1:] != tails[:-1]) | (heads[1:] != heads[:-1])]
+	coarse_graph = compiled_graph_from_edges(np.arange(n_clusters), tails[first], heads[first],
+		weights[first], coarse_pos)
+	return coarse_graph, cluster
+
+def coarse_probabilities(fine_graph, coarse_graph, p):
+	""" the probability of a call during each move of coarse_graph, aligned
+		with its predecessor CSR: a coarse move covers about as many fine
+		moves as the distance between the merged nodes is a multiple of the
+		mean fine edge length, and the call comes during any of them with
+		probability 1 - (1 - p)**moves """
+	fine_pos = np.asarray(fine_graph.pos, dtype=np.float64)
+	fine_tails = np.repeat(np.arange(fine_graph.n_nodes), np.diff(np.asarray(fine_graph.successor_offsets)))
+	fine_length = np.sqrt(((fine_pos[np.asarray(fine_graph.successor_indices)] - fine_pos[fine_tails])**2).sum(axis=1))
+	mean_fine_length = fine_length.mean() if len(fine_length) else 1.0
+
+	coarse_pos = np.asarray(coarse_graph.pos)
+	heads = np.repeat(np.arange(coarse_graph.n_nodes), np.diff(np.asarray(coarse_graph.predecessor_offsets)))
+	tails = np.asarray(coarse_graph.predecessor_indices)
+	length = np.sqrt(((coarse_pos[heads] - coarse_pos[tails])**2).sum(axis=1))
+	moves = np.maximum(1.0, length/mean_fine_length)
+	return -np.expm1(moves*np.log1p(-p))
+
+def random_termination_multilevel(compiled_graph, cost, p, cell_sizes, refinement_iterations=50,
+	tolerance=0.0, exact=False):
+	""" compiled_graph is a compiled_graph.CompiledGraph with a pos array
+		cost is an array of node costs in node index order
+		p is the probability that the call arrives after each move
+		cell_sizes is a list of cell sizes in the units of pos, largest
+			first, one per coarse level
+		refinement_iterations bounds the value iteration sweeps at every
+			level but the coarsest, and tolerance stops them early, as for
+			random_termination.random_termination_refine
+		exact, if True, also runs random_termination_arrays on the full
+			graph and reports the error against it
+
+		A fast approximate answer for graphs too big to solve exactly
+			often.  The coarsest level (nodes merged by coarsen_by_cells,
+			costs averaged over the merged nodes, coarse_probabilities for
+			p) is solved exactly; its values are then projected onto the
+			next finer level as a warm start and refined, and so on down to
+			the full graph.
+
+		RETURNS
+		expected_cost and next_node of the full graph, as for
+			random_termination_arrays
+		a report: an ordered dict with a list of 'levels', each with its
+			cell_size, node and edge counts, 'coarsen_seconds',
+			'solve_seconds' and refinement iterations and error bound,
+			then 'total_seconds' and, if exact, 'exact_seconds',
+			'max_abs_error', 'max_relative_error' and 'policy_agreement'
+	"""
+	cost = np.asarray(cost, dtype=np.float64)
+	report = OrderedDict(levels=[])
+	total_start = default_timer()
+
+	expected_cost = None
+	previous_cluster = None
+	for cell_size in list(cell_sizes) + [None]:
+		start = default_timer()
+		if cell_size is None:
+			graph, cluster, level_p = compiled_graph, np.arange(compiled_graph.n_nodes), p
+		else:
+			graph, cluster = coarsen_by_cells(compiled_graph, cell_size)
+			level_p = coarse_probabilities(compiled_graph, graph, p)
+		members = np.bincount(cluster).astype(np.float64)
+		level_cost = np.bincount(cluster, cost)/members
+		coarsen_seconds = default_timer() - start
+
+		start = default_timer()
+		level_report = OrderedDict([('cell_size', cell_size), ('n_nodes', graph.n_nodes),
+			('n_edges', graph.n_edges), ('coarsen_seconds', coarsen_seconds)])
+		if expected_cost is None:
+			expected_cost, next_node = random_termination_arrays(graph, level_cost, level_p)
+		else:
+			# a node of this level takes the value of the coarser node holding
+			# any one of its members
+			member = np.empty(graph.n_nodes, dtype=np.int64)
+			member[cluster] = np.arange(len(cluster))
+			warm_start = expected_cost[previous_cluster[member]]
+			expected_cost, next_node, refinement = random_termination_refine(graph, level_cost, level_p,
+				warm_start, refinement_iterations, tolerance)
+			level_report.update(refinement)
+		level_report['solve_seconds'] = default_timer() - start
+		report['levels'].append(level_report)
+		previous_cluster = cluster
+	report['total_seconds'] = default_timer() - total_start
+
+	if exact:
+		start = default_timer()
+		exact_expected_cost, exact_next_node = random_termination_arrays(compiled_graph, cost, p)
+		report['exact_seconds'] = default_timer() - start
+		finite = np.isfinite(exact_expected_cost)
+		error = np.abs(expected_cost[finite] - exact_expected_cost[finite])
+		report['max_abs_error'] = float(error.max()) if len(error) else 0.0
+		report['max_relative_error'] = float((error/np.maximum(np.abs(exact_expected_cost[finite]),
+			np.finfo(np.float64).tiny)).max()) if len(error) else 0.0
+		report['policy_agreement'] = float(np.mean(next_node == exact_next_node))
+	return expected_cost, next_node, report
@@ -0,0 +1,94 @@
+import numpy as np
+from compiled_graph import node_label, save_array_directory, load_array_directory
+
+# bumped whenever the layout written by SolverResult.save changes
+FORMAT_VERSION = 1
+
+class SolverResult(object):
+	"""
+The output of a random termination solve, held as columns:
+
+	* `node_ids`: the node labels, in the same layout as
+		`CompiledGraph.node_ids`.
+	* `expected_cost`: an (n_nodes,) array, or an (n_nodes, K) array for
+		solvers with K criteria such as
+		random_termination.random_termination_double_cost_edgelist.
+	* `next_node`: the index of the node each node moves to, or -1 for
+		the nodes which stay put.
+	* `metadata`: a json-able dict holding at least `p`, `cost_spec` and
+		`graph_fingerprint`.
+
+`save(directory)` writes one .npy file per column next to a
+	metadata.json, and `load_solver_result` memory-maps them back, so
+	opening even a very large result reads nothing but the metadata.
+"""
+	def __init__(self, node_ids, expected_cost, next_node, metadata):
+		self.node_ids = node_ids
+		self.expected_cost = expected_cost
+		self.next_node = next_node
+		self.metadata = metadata
+
+	@property
+	def n_nodes(self):
+		return len(self.next_node)
+
+	def node_id(self, index):
+		return node_label(self.node_ids, index)
+
+	def expected_cost_dict(self):
+		""" the expected cost keyed by node label, as returned by the
+			dict-based solvers """
+		return { self.node_id(i): self.expected_cost[i].tolist() for i in xrange(self.n_nodes) }
+
+	def edgelist(self):
+		""" the (node, next node) label pairs, as returned by the dict-based
+			solvers """
+		moving_nodes = np.flatnonzero(np.asarray(self.next_node) >= 0)
+		return [ (self.node_id(i), self.node_id(self.next_node[i])) for i in moving_nodes ]
+
+	def save(self, directory):
+		save_array_directory(directory, 
+			{ 'node_ids': self.node_ids,
+				'expected_cost': self.expected_cost,
+				'next_node': self.next_node },
+			dict(self.metadata, format_version=FORMAT_VERSION))
+
+def solver_result_from_arrays(compiled_graph, expected_cost, next_node, p, cost_spec, **metadata):
+	""" compiled_graph is the compiled_graph.CompiledGraph that was solved
+		expected_cost, next_node are as returned by
+			random_termination.random_termination_arrays
+		p is the probability (or rate) the solver was run with
+		cost_spec is a json-able description of the cost, for example
+			{'cost': 'exceeding_distance', 'allowed_distance': 350}
+		any further keyword arguments are stored with the metadata
+
+		RETURNS
+		a SolverResult
+	"""
+	metadata.update(p=p, cost_spec=cost_spec,
+		graph_fingerprint=compiled_graph.fingerprint())
+	return SolverResult(compiled_graph.node_ids, expected_cost, next_node, metadata)
+
+def solver_result_from_dicts(compiled_graph, expected_cost, edgelist, p, cost_spec, **metadata):
+	""" as solver_result_from_arrays, but taking the expected_cost dict and
+		edgelist returned by the dict-based solvers in random_termination """
+	node_index = compiled_graph.node_index
+	expected_cost_array = np.array([ expected_cost[compiled_graph.node_id(i)] 
+		for i in xrange(compiled_graph.n_nodes) ], dtype=np.float64)
+	next_node = np.empty(compiled_graph.n_nodes, dtype=np.int64)
+	next_node.fill(-1)
+	for node, neighbor_node in edgelist:
+		next_node[node_index[node]] = node_index[neighbor_node]
+	return solver_result_from_arrays(compiled_graph, expected_cost_array, next_node, 
+		p, cost_spec, **metadata)
+
+def load_solver_result(directory, mmap_mode='r', compiled_graph=None):
+	""" open a result written by SolverResult.save, memory-mapping its
+		columns unless mmap_mode is None.  If compiled_graph is given, 
+		raise a ValueError unless the result was solved on that graph. """
+	arrays, metadata = load_array_directory(directory, mmap_mode)
+	if metadata.get('format_version') != FORMAT_VERSION:
+		raise ValueError("unsupported solver result format %r" % metadata.get('format_version'))
+	if compiled_graph is not None and compiled_graph.fingerprint() != metadata['graph_fingerprint']:
+		raise ValueError("solver result in %s was not solved on this graph" % directory)
+	return SolverResult(arrays['node_ids'], arrays['expected_cost'], arrays['next_node'], metadata)
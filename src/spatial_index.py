@@ -0,0 +1,137 @@
+import numpy as np
+
+from compiled_graph import save_array_directory, load_array_directory
+
+EARTH_RADIUS = 6371008.8
+
+class NodeLocator(object):
+	"""
+Snaps points to the nearest node of a CompiledGraph with a k-d tree over
+	the node coordinates.
+
+For geographic graphs such as `sf_map`, whose `pos` is (lon, lat), the
+	coordinates are projected equirectangularly about `reference_latitude`
+	into metres, which is accurate to well under a metre at the scale of a
+	city; snapping distances are then in metres.  For other graphs (the
+	`grid_graph` positions, say) pass geographic=False and `pos` is used
+	as it is.
+
+`projected` holds the (n_nodes, 2) projected coordinates.  They are what
+	`save` writes, and the tree is built from them again when the locator
+	is loaded, which takes well under a second even for a large map.
+"""
+	def __init__(self, projected, reference_latitude=None):
+		from scipy.spatial import cKDTree
+
+		self.projected = projected
+		self.reference_latitude = reference_latitude
+		self.tree = cKDTree(np.asarray(projected))
+
+	@property
+	def geographic(self):
+		return self.reference_latitude is not None
+
+	@property
+	def n_nodes(self):
+		return len(self.projected)
+
+	def project(self, x, y):
+		return project(x, y, self.reference_latitude)
+
+	def snap(self, x, y, max_distance=np.inf, chunk_size=1<<20):
+		""" x and y are arrays of longitudes and latitudes (or of plain
+				coordinates), of any length
+			max_distance is how far a point may be from its node, in metres
+				for a geographic locator; points further away are not snapped
+			chunk_size points are queried at a time, to bound the memory used
+
+			RETURNS
+			an array of the index of the nearest node to every point, -1 for
+				points further than max_distance from every node, and an
+				array of the distance to it
+		"""
+		points = self.project(x, y)
+		nodes = np.empty(len(points), dtype=np.int64)
+		distances = np.empty(len(points))
+		for start in xrange(0, len(points), chunk_size):
+			stop = start + chunk_size
+			distances[start:stop], nodes[start:stop] = self.tree.query(points[start:stop],
+				distance_upper_bound=max_distance)
+		# the tree answers points beyond max_distance with n_nodes
+		nodes[nodes == self.n_nodes] = -1
+		return nodes, distances
+
+	def callers(self, x, y, weights=None, max_distance=np.inf):
+		""" x and y are as for snap
+			weights, if given, is the number of calls each point stands for
+
+			Snaps the points and sums them up by node, dropping those not
+				snapped.
+
+			RETURNS
+			an array of caller node indices, and their
+				caller_relative_probabilities
+		"""
+		nodes, _ = self.snap(x, y, max_distance)
+		return aggregate_callers(nodes, weights, self.n_nodes)
+
+	def save(self, directory):
+		""" write the locator into directory, beside its graph say, so that
+			it can be opened again with load_node_locator """
+		save_array_directory(directory, { 'projected': self.projected },
+			{ 'reference_latitude': self.reference_latitude })
+
+def project(x, y, reference_latitude=None):
+	""" x and y are arrays of longitudes and latitudes, or of plain
+			coordinates when reference_latitude is None
+
+		RETURNS
+		an (n_points, 2) array of the points projected equirectangularly
+			about reference_latitude, in metres, or of the plain coordinates
+	"""
+	x = np.asarray(x, dtype=np.float64)
+	y = np.asarray(y, dtype=np.float64)
+	if reference_latitude is not None:
+		x = np.radians(x)*np.cos(np.radians(reference_latitude))*EARTH_RADIUS
+		y = np.radians(y)*EARTH_RADIUS
+	return np.column_stack((x.ravel(), y.ravel()))
+
+def aggregate_callers(nodes, weights=None, n_nodes=None):
+	""" nodes is an array of node indices, -1 for points to leave out
+		weights, if given, is an array of the weight of each point
+
+		RETURNS
+		the distinct node indices with a positive total weight, and the
+			fraction of the total weight at each, as caller_locations and
+			caller_relative_probabilities for graph_cost once turned into
+			node ids
+	"""
+	nodes = np.asarray(nodes, dtype=np.int64)
+	kept = nodes >= 0
+	weights = None if weights is None else np.asarray(weights, dtype=np.float64)[kept]
+	totals = np.bincount(nodes[kept], weights=weights,
+		minlength=0 if n_nodes is None else n_nodes)
+	caller_indices = np.flatnonzero(totals > 0)
+	if len(caller_indices) == 0:
+		raise ValueError("no points were snapped to the graph")
+	return caller_indices, totals[caller_indices]/totals[caller_indices].sum()
+
+def build_node_locator(compiled_graph, geographic=True):
+	""" compiled_graph is a compiled_graph.CompiledGraph with a pos array
+
+		RETURNS
+		a NodeLocator for its nodes, projected about their mean latitude
+			when geographic
+	"""
+	if compiled_graph.pos is None:
+		raise ValueError("the graph has no node positions")
+	pos = np.asarray(compiled_graph.pos, dtype=np.float64)
+	if not geographic:
+		return NodeLocator(pos.copy())
+	reference_latitude = float(pos[:,1].mean())
+	return NodeLocator(project(pos[:,0], pos[:,1], reference_latitude), reference_latitude)
+
+def load_node_locator(directory, mmap_mode='r'):
+	""" open a locator written by NodeLocator.save """
+	arrays, metadata = load_array_directory(directory, mmap_mode)
+	return NodeLocator(arrays['projected'], metadata['reference_latitude'])
@@ -0,0 +1,53 @@
+""" small random graphs for the solver tests, each one kept small enough
+	that the dict solvers, and brute force where a test needs it, stay fast """
+import random
+
+import networkx as nx
+import numpy as np
+
+from compiled_graph import compile_graph
+
+def random_graph(n_nodes, n_edges, seed, weight_range=(0.5, 2.0)):
+	""" RETURNS
+		a networkx DiGraph on nodes 0 ... n_nodes-1 with n_edges random
+			edges (no self loops), a 'weight' on every edge and a 'pos'
+			on every node.  Sparse ones fall apart into several strongly
+			connected components.
+	"""
+	rng = random.Random(seed)
+	graph = nx.DiGraph()
+	for node in range(n_nodes):
+		graph.add_node(node, pos=(rng.uniform(0, 10), rng.uniform(0, 10)))
+	while graph.number_of_edges() < n_edges:
+		tail, head = rng.randrange(n_nodes), rng.randrange(n_nodes)
+		if tail != head:
+			graph.add_edge(tail, head, weight=rng.uniform(*weight_range))
+	return graph
+
+def random_cost(graph, seed, levels=None):
+	""" RETURNS
+		a dict of random node costs, drawn from range(levels) when levels
+			is given, so that there are plateaus of equal cost
+	"""
+	rng = random.Random(seed)
+	if levels is None:
+		return { node: rng.uniform(0, 10) for node in graph.nodes() }
+	return { node: float(rng.randrange(levels)) for node in graph.nodes() }
+
+def compiled_problem(graph, cost):
+	""" RETURNS
+		the CompiledGraph of graph and cost as an array in its node order
+	"""
+	compiled_graph = compile_graph(graph)
+	return compiled_graph, compiled_graph.cost_array(cost)
+
+def next_node_dict(compiled_graph, next_node):
+	""" a dict from node label to the label of its next node, or None """
+	return { compiled_graph.node_id(i): None if next_node[i] < 0 else compiled_graph.node_id(next_node[i])
+		for i in range(compiled_graph.n_nodes) }
+
+def edgelist_dict(graph, edgelist):
+	""" the dict solvers' edgelist as a next node dict like next_node_dict """
+	next_node = { node: None for node in graph.nodes() }
+	next_node.update(edgelist)
+	return next_node
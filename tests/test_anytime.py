@@ -0,0 +1,67 @@
+import unittest
+
+import numpy as np
+
+from random_termination import edge_termination_probabilities, random_termination_anytime, \
+	random_termination_arrays
+from small_graphs import compiled_problem, random_cost, random_graph
+
+class AnytimeSolverTest(unittest.TestCase):
+
+	def assertPolicyValues(self, compiled_graph, cost, p, expected_cost, next_node):
+		""" the values returned are those of following next_node """
+		for node in range(compiled_graph.n_nodes):
+			move = next_node[node]
+			if move < 0:
+				self.assertEqual(expected_cost[node], cost[node])
+			else:
+				self.assertEqual(expected_cost[node],
+					max(p*cost[move] + (1-p)*expected_cost[move], expected_cost[move])
+					if cost[move] != expected_cost[move] else cost[move])
+
+	def test_bounded_by_exact_solution(self):
+		for seed in range(5):
+			graph = random_graph(60, 180, seed)
+			compiled_graph, cost = compiled_problem(graph, random_cost(graph, seed))
+			exact_expected_cost, _ = random_termination_arrays(compiled_graph, cost, 0.2)
+			finite = np.isfinite(exact_expected_cost)
+			for epsilon, relative in ((0.5, False), (0.1, True)):
+				expected_cost, next_node, report = random_termination_anytime(compiled_graph, cost, 0.2, epsilon,
+					relative=relative)
+				self.assertTrue(report['complete'])
+				self.assertEqual(np.isfinite(expected_cost).tolist(), finite.tolist())
+				error = expected_cost[finite] - exact_expected_cost[finite]
+				self.assertTrue((error >= -1e-12).all())
+				self.assertTrue((error <= report['error_bound'] + 1e-12).all())
+				self.assertPolicyValues(compiled_graph, cost, 0.2, expected_cost, next_node)
+
+	def test_narrow_buckets_are_exact(self):
+		graph = random_graph(60, 180, seed=8)
+		compiled_graph, cost = compiled_problem(graph, random_cost(graph, seed=8))
+		exact_expected_cost, _ = random_termination_arrays(compiled_graph, cost, 0.2)
+		expected_cost, _, report = random_termination_anytime(compiled_graph, cost, 0.2, 1e-9)
+		self.assertEqual(expected_cost.tolist(), exact_expected_cost.tolist())
+		self.assertEqual(report['residual'], 0.0)
+
+	def test_per_edge_probabilities(self):
+		graph = random_graph(60, 180, seed=9)
+		compiled_graph, cost = compiled_problem(graph, random_cost(graph, seed=9))
+		p = edge_termination_probabilities(compiled_graph, 0.1)
+		exact_expected_cost, _ = random_termination_arrays(compiled_graph, cost, p)
+		expected_cost, _, report = random_termination_anytime(compiled_graph, cost, p, 0.5)
+		finite = np.isfinite(exact_expected_cost)
+		error = expected_cost[finite] - exact_expected_cost[finite]
+		self.assertTrue((error >= -1e-12).all())
+		self.assertTrue((error <= report['error_bound'] + 1e-12).all())
+
+	def test_no_time_never_worse_than_staying(self):
+		graph = random_graph(60, 180, seed=10)
+		compiled_graph, cost = compiled_problem(graph, random_cost(graph, seed=10))
+		expected_cost, next_node, report = random_termination_anytime(compiled_graph, cost, 0.2, 0.5, time_budget=0)
+		self.assertFalse(report['complete'])
+		self.assertEqual(report['accepted'], 0)
+		self.assertTrue((expected_cost <= cost).all())
+		self.assertPolicyValues(compiled_graph, cost, 0.2, expected_cost, next_node)
+
+if __name__ == '__main__':
+	unittest.main()
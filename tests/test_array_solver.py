@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import networkx as nx
+import numpy as np
+
+from compiled_graph import open_memmap
+from random_termination import edge_termination_probabilities, random_termination_arrays, \
+	random_termination_single_cost_edgelist, random_termination_single_cost_edgelist_continuous_call_probability
+from small_graphs import random_graph, random_cost, compiled_problem, next_node_dict, edgelist_dict
+
+class ArraySolverTest(unittest.TestCase):
+
+	def assertSameSolution(self, graph, compiled_graph, expected_cost, next_node, dict_expected_cost, edgelist):
+		self.assertEqual(compiled_graph.to_node_dict(expected_cost), dict_expected_cost)
+		self.assertEqual(next_node_dict(compiled_graph, next_node), edgelist_dict(graph, edgelist))
+
+	def test_matches_dict_solver(self):
+		for seed in range(10):
+			graph = random_graph(60, 180, seed)
+			cost = random_cost(graph, seed, levels=None if seed % 2 else 8)
+			compiled_graph, cost_array = compiled_problem(graph, cost)
+			dict_expected_cost, edgelist = random_termination_single_cost_edgelist(graph, cost, 0.1)
+			for compress_plateaus in (True, False):
+				expected_cost, next_node = random_termination_arrays(compiled_graph, cost_array, 0.1,
+					compress_plateaus=compress_plateaus)
+				self.assertEqual(compiled_graph.to_node_dict(expected_cost), dict_expected_cost)
+				# with levelled costs, equally good moves may be chosen either way
+				if seed % 2:
+					self.assertSameSolution(graph, compiled_graph, expected_cost, next_node, dict_expected_cost, edgelist)
+
+	def test_move_clamped_at_its_value(self):
+		# p*c(y) + (1-p)*V(y) rounds to an ulp below V(y) here, and both
+		#    solvers clamp the move from x at V(y)
+		graph = nx.DiGraph([('x', 'y'), ('y', 'w')])
+		cost = { 'x': 5.0, 'y': 3.6375277212759975, 'w': 3.637527721275997 }
+		self.assertLess(0.3*cost['y'] + 0.7*cost['w'], cost['w'])
+		compiled_graph, cost_array = compiled_problem(graph, cost)
+		dict_expected_cost, edgelist = random_termination_single_cost_edgelist(graph, cost, 0.3)
+		expected_cost, next_node = random_termination_arrays(compiled_graph, cost_array, 0.3)
+		self.assertEqual(dict_expected_cost['x'], cost['w'])
+		self.assertSameSolution(graph, compiled_graph, expected_cost, next_node, dict_expected_cost, edgelist)
+
+	def test_matches_continuous_dict_solver(self):
+		for seed in range(10):
+			graph = random_graph(60, 180, seed)
+			cost = random_cost(graph, seed)
+			compiled_graph, cost_array = compiled_problem(graph, cost)
+			dict_expected_cost, edgelist = random_termination_single_cost_edgelist_continuous_call_probability(
+				graph, cost, 0.2)
+			p = edge_termination_probabilities(compiled_graph, 0.2)
+			expected_cost, next_node = random_termination_arrays(compiled_graph, cost_array, p)
+			self.assertSameSolution(graph, compiled_graph, expected_cost, next_node, dict_expected_cost, edgelist)
+
+	def test_memmap_outputs(self):
+		graph = random_graph(60, 180, seed=1)
+		compiled_graph, cost = compiled_problem(graph, random_cost(graph, seed=1))
+		directory = tempfile.mkdtemp()
+		try:
+			outputs = [ open_memmap(os.path.join(directory, name + '.npy'), (compiled_graph.n_nodes,), dtype)
+				for name, dtype in [('expected_cost', np.float64), ('next_node', np.int64), ('status', np.int8)] ]
+			expected_cost, next_node = random_termination_arrays(compiled_graph, cost, 0.1, *outputs)
+			self.assertIs(expected_cost, outputs[0])
+			in_memory = random_termination_arrays(compiled_graph, cost, 0.1)
+			self.assertEqual(expected_cost.tolist(), in_memory[0].tolist())
+			self.assertEqual(next_node.tolist(), in_memory[1].tolist())
+		finally:
+			shutil.rmtree(directory)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,67 @@
+import json
+import unittest
+
+import networkx as nx
+
+import batch_worker
+from batch_worker import ScenarioSolver, json_dumps
+from compiled_graph import compile_graph
+from small_graphs import random_graph
+
+class Output(list):
+	""" collects what run writes """
+	def write(self, text):
+		self.append(text)
+
+	def flush(self):
+		pass
+
+class BatchWorkerTest(unittest.TestCase):
+
+	def tearDown(self):
+		batch_worker._scenario_solver = None
+
+	def test_json_dumps_writes_non_finite_as_null(self):
+		value = { 'a': float('inf'), 'b': [1.5, float('nan'), (float('-inf'), 2)], 'c': 'text' }
+		self.assertEqual(json.loads(json_dumps(value)), { 'a': None, 'b': [1.5, None, [None, 2]], 'c': 'text' })
+
+	def test_unreachable_nodes_written_as_null(self):
+		# nodes 3 and 4 are cut off from the caller at node 0
+		graph = nx.DiGraph()
+		graph.add_weighted_edges_from([(0, 1, 1.0), (1, 0, 1.0), (1, 2, 1.0), (2, 1, 1.0), (3, 4, 1.0), (4, 3, 1.0)])
+		batch_worker._scenario_solver = ScenarioSolver(compile_graph(graph))
+		output = Output()
+		scenario = { 'id': 'a', 'callers': [0], 'probabilities': [1.0], 'cost': 'expected_value', 'p': 0.5 }
+		batch_worker.run([json.dumps(scenario)], output)
+		result = json.loads(''.join(output), parse_constant=self.fail)
+		self.assertEqual(dict(result['expected_cost'])[3], None)
+		self.assertEqual(result['best_node'], 0)
+
+	def test_processes_keep_order(self):
+		compiled_graph = compile_graph(random_graph(40, 160, seed=3))
+		batch_worker._scenario_solver = ScenarioSolver(compiled_graph)
+		scenarios = [ { 'id': i, 'callers': [i, (7*i) % 40, (3*i + 1) % 40], 'probabilities': [0.5, 0.25, 0.25],
+			'cost': 'exceeding_distance' if i % 2 else 'expected_value', 'allowed_distance': 2.0, 'p': 0.1 + 0.02*i }
+			for i in range(9) ]
+		lines = [ json.dumps(scenario) for scenario in scenarios ]
+		# a blank line is skipped, and bad lines get an error in their place
+		lines[3:3] = ['', 'not json', json.dumps({ 'id': 'bad', 'callers': ['nowhere'], 'probabilities': [1.0],
+			'cost': 'expected_value', 'p': 0.1 })]
+
+		single_process = Output()
+		batch_worker.run(lines, single_process)
+		self.assertEqual(len(single_process), 11)
+		results = [ json.loads(line) for line in single_process ]
+		self.assertEqual([ result['id'] for result in results ], [0, 1, 2, None, 'bad'] + list(range(3, 9)))
+		self.assertIn('error', results[3])
+		self.assertIn('error', results[4])
+		solved = [ result for result in results if 'error' not in result ]
+		for scenario, result in zip(scenarios, solved):
+			self.assertEqual(result, json.loads(json_dumps(batch_worker._scenario_solver.answer(scenario))))
+
+		two_processes = Output()
+		batch_worker.run(lines, two_processes, processes=2, max_pending=4)
+		self.assertEqual(list(two_processes), list(single_process))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import networkx as nx
+import numpy as np
+
+from compiled_graph import ORDERINGS, CompiledGraph, DistanceColumnCache, compile_graph, compiled_graph_from_edges, \
+	load_compiled_graph, node_ordering
+from random_termination import random_termination_arrays, random_termination_single_cost_edgelist
+from small_graphs import compiled_problem, next_node_dict, random_cost, random_graph
+
+class CompiledGraphTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def assertSameGraph(self, graph, other):
+		for name in CompiledGraph.array_names:
+			array, other_array = getattr(graph, name), getattr(other, name)
+			if array is None:
+				self.assertIsNone(other_array)
+			else:
+				self.assertEqual(np.asarray(array).tolist(), np.asarray(other_array).tolist())
+		self.assertEqual(graph.node_index, other.node_index)
+		self.assertEqual(graph.fingerprint(), other.fingerprint())
+
+	def test_save_load_round_trip(self):
+		graph = random_graph(30, 80, seed=2)
+		for u, v, data in graph.edges(data=True):
+			data['evening'] = 2*data['weight']
+		compiled_graph = compile_graph(graph, profiles=['weight', 'evening'])
+		compiled_graph.save(self.directory)
+		loaded = load_compiled_graph(self.directory)
+		self.assertIsInstance(loaded.successor_indices, np.memmap)
+		self.assertSameGraph(compiled_graph, loaded)
+
+	def test_save_load_object_labels(self):
+		# labels of mixed types make an object array, which np.save can
+		#    only pickle
+		node_ids = np.empty(4, dtype=object)
+		node_ids[:] = ['a', 7, ('b', 2), None]
+		compiled_graph = compiled_graph_from_edges(node_ids, [0, 1, 2], [1, 2, 3], [1.0, 2.0, 3.0])
+		compiled_graph.save(self.directory)
+		self.assertFalse(os.path.exists(os.path.join(self.directory, 'node_ids.npy')))
+		loaded = load_compiled_graph(self.directory)
+		self.assertEqual([ loaded.node_id(i) for i in range(4) ], ['a', 7, ('b', 2), None])
+		self.assertSameGraph(compiled_graph, loaded)
+
+	def test_fingerprint_hashes_label_values(self):
+		def labels():
+			node_ids = np.empty(3, dtype=object)
+			node_ids[:] = [ 'node %d' % i for i in range(3) ]
+			return node_ids
+		graph = compiled_graph_from_edges(labels(), [0, 1], [1, 2], [1.0, 1.0])
+		same_graph = compiled_graph_from_edges(labels(), [0, 1], [1, 2], [1.0, 1.0])
+		self.assertEqual(graph.fingerprint(), same_graph.fingerprint())
+		other_weights = compiled_graph_from_edges(labels(), [0, 1], [1, 2], [1.0, 2.0])
+		self.assertNotEqual(graph.fingerprint(), other_weights.fingerprint())
+
+	def test_reordered_round_trip(self):
+		graph = random_graph(30, 80, seed=5)
+		compiled_graph, cost = compiled_problem(graph, random_cost(graph, seed=5))
+		expected_cost, next_node = random_termination_arrays(compiled_graph, cost, 0.2)
+		for method in ORDERINGS:
+			order = node_ordering(compiled_graph, method)
+			self.assertEqual(sorted(order.tolist()), list(range(compiled_graph.n_nodes)))
+			reordered = compiled_graph.reordered(order)
+			self.assertEqual([ reordered.node_id(i) for i in range(len(order)) ],
+				[ compiled_graph.node_id(i) for i in order ])
+			self.assertSameGraph(compiled_graph, reordered.reordered(np.argsort(order)))
+
+			# the solution moves with the nodes
+			reordered_expected_cost, reordered_next_node = random_termination_arrays(reordered, cost[order], 0.2)
+			self.assertEqual(reordered_expected_cost[np.argsort(order)].tolist(), expected_cost.tolist())
+			self.assertEqual(reordered.to_node_dict(reordered_expected_cost), compiled_graph.to_node_dict(expected_cost))
+			self.assertEqual(next_node_dict(reordered, reordered_next_node), next_node_dict(compiled_graph, next_node))
+
+	def labelled_edges(self, compiled_graph, profile=None):
+		weights = compiled_graph.successor_weights if profile is None else compiled_graph.profile_edge_weights(profile)
+		tails = np.repeat(np.arange(compiled_graph.n_nodes), np.diff(np.asarray(compiled_graph.successor_offsets)))
+		return sorted((compiled_graph.node_id(tail), compiled_graph.node_id(head), weight) for tail, head, weight in
+			zip(tails.tolist(), np.asarray(compiled_graph.successor_indices).tolist(), np.asarray(weights).tolist()))
+
+	def test_induced_subgraph_round_trip(self):
+		graph = random_graph(40, 120, seed=6)
+		for u, v, data in graph.edges(data=True):
+			data['evening'] = 2*data['weight']
+		compiled_graph = compile_graph(graph, profiles=['weight', 'evening'])
+		cost = random_cost(graph, seed=6)
+		for nodes in (compiled_graph.nodes_in_box(2, 2, 8, 8), np.arange(0, compiled_graph.n_nodes, 3)):
+			subgraph, parent_indices = compiled_graph.induced_subgraph(nodes)
+			labels = [ compiled_graph.node_id(i) for i in parent_indices ]
+			self.assertEqual([ subgraph.node_id(i) for i in range(subgraph.n_nodes) ], labels)
+			self.assertEqual(np.asarray(subgraph.pos).tolist(), np.asarray(compiled_graph.pos)[parent_indices].tolist())
+
+			expected = compile_graph(graph.subgraph(labels), profiles=['weight', 'evening'])
+			self.assertEqual(self.labelled_edges(subgraph), self.labelled_edges(expected))
+			self.assertEqual(self.labelled_edges(subgraph, 1), self.labelled_edges(expected, 1))
+
+			expected_cost, _ = random_termination_arrays(subgraph, subgraph.cost_array(cost), 0.2)
+			dict_expected_cost, _ = random_termination_single_cost_edgelist(nx.DiGraph(graph.subgraph(labels)),
+				{ node: cost[node] for node in labels }, 0.2)
+			self.assertEqual(subgraph.to_node_dict(expected_cost), dict_expected_cost)
+
+	def test_distance_cache_counts(self):
+		compiled_graph = compile_graph(random_graph(30, 80, seed=4))
+		cache = DistanceColumnCache(compiled_graph)
+		cache.warm([1, 2, 2, 3])
+		self.assertEqual((cache.hits, cache.misses), (0, 3))
+		distances = cache.columns([3, 1, 4])
+		self.assertEqual((cache.hits, cache.misses), (2, 4))
+		self.assertEqual(distances.tolist(), compiled_graph.distances_from([3, 1, 4]).tolist())
+
+	def test_distance_cache_max_columns(self):
+		compiled_graph = compile_graph(random_graph(30, 80, seed=4))
+		cache = DistanceColumnCache(compiled_graph, max_columns=2)
+		cache.warm([1, 2, 3])
+		self.assertEqual(list(cache.cache), [2, 3])
+		distances = cache.columns([4, 5, 2])
+		self.assertEqual(list(cache.cache), [5, 2])
+		self.assertEqual(distances.tolist(), compiled_graph.distances_from([4, 5, 2]).tolist())
+		self.assertEqual((cache.hits, cache.misses), (1, 4))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+
+from random_termination import random_termination_by_components, \
+	random_termination_single_cost_edgelist, strongly_connected_component_levels
+from small_graphs import random_graph, random_cost, edgelist_dict
+
+class ComponentSolverTest(unittest.TestCase):
+
+	def test_component_levels_cover_graph_downstream_first(self):
+		graph = random_graph(60, 90, seed=1)
+		levels = strongly_connected_component_levels(graph)
+		level_of = {}
+		for level, components in enumerate(levels):
+			for component in components:
+				for node in component:
+					level_of[node] = level
+		self.assertEqual(sorted(level_of), sorted(graph.nodes()))
+		for tail, head in graph.edges():
+			self.assertGreaterEqual(level_of[tail], level_of[head])
+
+	def test_matches_whole_graph_solve(self):
+		for seed in range(5):
+			graph = random_graph(60, 90, seed)
+			cost = random_cost(graph, seed)
+			expected_cost, edgelist = random_termination_single_cost_edgelist(graph, cost, 0.3)
+			for processes in (None, 2):
+				component_expected_cost, component_edgelist = random_termination_by_components(
+					graph, cost, 0.3, processes=processes)
+				self.assertEqual(component_expected_cost, expected_cost)
+				self.assertEqual(edgelist_dict(graph, component_edgelist), edgelist_dict(graph, edgelist))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,70 @@
+import shutil
+import tempfile
+import unittest
+
+import networkx as nx
+import numpy as np
+
+import graph_utilities
+from compiled_graph import compile_graph
+from contraction_hierarchy import build_contraction_hierarchy, load_contraction_hierarchy
+from small_graphs import random_graph
+
+def networkx_distances(graph, compiled_graph, sources):
+	""" the distance columns of sources, from networkx's Dijkstra """
+	distances = np.empty((compiled_graph.n_nodes, len(sources)))
+	distances.fill(np.inf)
+	for j, source in enumerate(sources):
+		lengths = nx.single_source_dijkstra_path_length(graph, compiled_graph.node_id(source))
+		for node, length in lengths.items():
+			distances[compiled_graph.node_index[node], j] = length
+	return distances
+
+class ContractionHierarchyTest(unittest.TestCase):
+
+	def graphs(self):
+		yield random_graph(80, 240, seed=6)
+		# many paths of equal length, summed in different orders
+		yield graph_utilities.grid_graph(12, 12)
+
+	def test_compiled_distances_match_networkx(self):
+		for graph in self.graphs():
+			compiled_graph = compile_graph(graph)
+			sources = np.arange(0, compiled_graph.n_nodes, 7)
+			self.assertEqual(compiled_graph.distances_from(sources).tolist(),
+				networkx_distances(graph, compiled_graph, sources).tolist())
+
+	def test_hierarchy_distances_match_networkx(self):
+		for graph in self.graphs():
+			compiled_graph = compile_graph(graph)
+			hierarchy = build_contraction_hierarchy(compiled_graph)
+			sources = np.arange(0, compiled_graph.n_nodes, 7)
+			expected = networkx_distances(graph, compiled_graph, sources)
+			distances = hierarchy.distances_from(sources)
+			self.assertEqual(np.isinf(distances).tolist(), np.isinf(expected).tolist())
+			finite = np.isfinite(expected)
+			self.assertTrue(np.allclose(distances[finite], expected[finite], rtol=1e-12, atol=0))
+
+	def test_save_load_round_trip(self):
+		compiled_graph = compile_graph(random_graph(40, 120, seed=7))
+		hierarchy = build_contraction_hierarchy(compiled_graph)
+		directory = tempfile.mkdtemp()
+		try:
+			hierarchy.save(directory)
+			loaded = load_contraction_hierarchy(directory)
+			sources = [0, 5, 17]
+			self.assertEqual(loaded.distances_from(sources).tolist(), hierarchy.distances_from(sources).tolist())
+		finally:
+			shutil.rmtree(directory)
+
+	def test_distances_by_location_match_networkx(self):
+		graph = graph_utilities.grid_graph(12, 12)
+		compiled_graph = compile_graph(graph)
+		callers = [(0, 0), (5, 7), (11, 3)]
+		distances = graph_utilities.distances_by_location(graph, callers)
+		expected = networkx_distances(graph, compiled_graph, compiled_graph.indices_of(callers))
+		for node, row in distances.items():
+			self.assertEqual(row, expected[compiled_graph.node_index[node]].tolist())
+
+if __name__ == '__main__':
+	unittest.main()
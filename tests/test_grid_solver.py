@@ -0,0 +1,72 @@
+import random
+import unittest
+
+import numpy as np
+
+from compiled_graph import compile_graph, compiled_grid_graph
+from graph_utilities import grid_graph
+from random_termination import random_termination_arrays, random_termination_grid, \
+	random_termination_single_cost_edgelist
+from solver_stats import SolverStats
+
+class GridSolverTest(unittest.TestCase):
+
+	def grid_cost(self, n_columns, n_rows, seed, levels=None):
+		rng = random.Random(seed)
+		draw = (lambda: rng.uniform(0, 10)) if levels is None else (lambda: float(rng.randrange(levels)))
+		return np.array([ [ draw() for _ in range(n_columns) ] for _ in range(n_rows) ])
+
+	def untied(self, compiled_graph, cost, expected_cost, p):
+		""" a mask of the nodes with a single best choice: one move strictly
+			better than every other and than staying, or staying strictly
+			better than every move """
+		untied = np.zeros(compiled_graph.n_nodes, dtype=bool)
+		offsets = np.asarray(compiled_graph.successor_offsets)
+		for node in range(compiled_graph.n_nodes):
+			successors = np.asarray(compiled_graph.successor_indices)[offsets[node]:offsets[node+1]]
+			choices = [ cost[node] ] + [ max(p*cost[k] + (1-p)*expected_cost[k], expected_cost[k])
+				if cost[k] != expected_cost[k] else cost[k] for k in successors.tolist() ]
+			untied[node] = choices.count(min(choices)) == 1
+		return untied
+
+	def test_compiled_grid_matches_networkx_grid(self):
+		compiled_graph = compiled_grid_graph(7, 5)
+		expected = compile_graph(grid_graph(7, 5))
+		self.assertEqual([ compiled_graph.node_id(i) for i in range(compiled_graph.n_nodes) ],
+			[ (i_columns, i_rows) for i_rows in range(5) for i_columns in range(7) ])
+		def labelled_edges(graph):
+			tails = np.repeat(np.arange(graph.n_nodes), np.diff(np.asarray(graph.successor_offsets)))
+			return sorted((graph.node_id(tail), graph.node_id(head), weight) for tail, head, weight in
+				zip(tails.tolist(), np.asarray(graph.successor_indices).tolist(),
+					np.asarray(graph.successor_weights).tolist()))
+		self.assertEqual(labelled_edges(compiled_graph), labelled_edges(expected))
+
+	def test_matches_array_and_dict_solvers(self):
+		n_columns, n_rows = 12, 9
+		compiled_graph = compiled_grid_graph(n_columns, n_rows)
+		graph = grid_graph(n_columns, n_rows)
+		for seed, levels in ((0, None), (1, None), (2, 4), (3, 2)):
+			cost = self.grid_cost(n_columns, n_rows, seed, levels)
+			stats = SolverStats()
+			expected_cost, next_node = random_termination_grid(cost, 0.2, stats=stats)
+			self.assertEqual(expected_cost.shape, (n_rows, n_columns))
+			self.assertEqual(stats.accepted, n_rows*n_columns)
+
+			array_expected_cost, array_next_node = random_termination_arrays(compiled_graph, cost.ravel(), 0.2)
+			self.assertEqual(expected_cost.ravel().tolist(), array_expected_cost.tolist())
+
+			cost_dict = { (i_columns, i_rows): cost[i_rows, i_columns]
+				for i_rows in range(n_rows) for i_columns in range(n_columns) }
+			dict_expected_cost, edgelist = random_termination_single_cost_edgelist(graph, cost_dict, 0.2)
+			self.assertEqual(compiled_graph.to_node_dict(expected_cost.ravel()), dict_expected_cost)
+
+			dict_next_node = -np.ones(compiled_graph.n_nodes, dtype=np.int64)
+			for node, neighbor_node in edgelist:
+				dict_next_node[compiled_graph.node_index[node]] = compiled_graph.node_index[neighbor_node]
+			untied = self.untied(compiled_graph, cost.ravel(), array_expected_cost, 0.2)
+			self.assertTrue(untied.any())
+			self.assertEqual(next_node.ravel()[untied].tolist(), array_next_node[untied].tolist())
+			self.assertEqual(next_node.ravel()[untied].tolist(), dict_next_node[untied].tolist())
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+import numpy as np
+
+import graph_utilities
+from pipeline import random_termination_pipeline
+from random_termination import edge_termination_probabilities, random_termination_arrays, \
+	random_termination_incremental
+from small_graphs import random_graph, random_cost, compiled_problem
+
+class IncrementalSolverTest(unittest.TestCase):
+
+	def check_incremental(self, compiled_graph, old_cost, cost, p, changed_nodes):
+		old_expected_cost, old_next_node = random_termination_arrays(compiled_graph, old_cost, p)
+		expected_cost, next_node = random_termination_arrays(compiled_graph, cost, p)
+		incremental_expected_cost, incremental_next_node, changed = random_termination_incremental(compiled_graph,
+			cost, p, old_expected_cost, old_next_node, changed_nodes)
+		self.assertEqual(incremental_expected_cost.tolist(), expected_cost.tolist())
+		finite = np.isfinite(expected_cost)
+		self.assertEqual(incremental_next_node[finite].tolist(), next_node[finite].tolist())
+		# exactly the nodes whose solution moved are reported
+		moved = (incremental_expected_cost != old_expected_cost) | (incremental_next_node != old_next_node)
+		self.assertEqual(changed.tolist(), np.flatnonzero(moved).tolist())
+		return changed
+
+	def test_matches_full_solve(self):
+		for seed in range(10):
+			graph = random_graph(60, 180, seed)
+			compiled_graph, old_cost = compiled_problem(graph, random_cost(graph, seed))
+			random_state = np.random.RandomState(seed)
+			changed_nodes = np.unique(random_state.randint(0, compiled_graph.n_nodes, 3))
+			cost = old_cost.copy()
+			cost[changed_nodes] = random_state.uniform(0, 10, len(changed_nodes))
+			for p in (0.2, edge_termination_probabilities(compiled_graph, 0.2)):
+				self.check_incremental(compiled_graph, old_cost, cost, p, changed_nodes)
+
+	def test_unchanged_cost_changes_nothing(self):
+		graph = random_graph(60, 180, seed=3)
+		compiled_graph, cost = compiled_problem(graph, random_cost(graph, seed=3))
+		changed = self.check_incremental(compiled_graph, cost, cost, 0.2, np.arange(0, 60, 5))
+		self.assertEqual(len(changed), 0)
+
+	def test_caller_probability_drift(self):
+		graph = random_graph(60, 240, seed=4)
+		compiled_graph, _ = compiled_problem(graph, random_cost(graph, seed=4))
+		callers = np.arange(0, 60, 6)
+		probabilities = np.ones(len(callers))/len(callers)
+		cost_spec = { 'cost': 'exceeding_distance', 'allowed_distance': 2.0 }
+		distances = compiled_graph.distances_from(callers)
+		caller_cost = graph_utilities.CallerCost(distances, probabilities, cost_spec)
+		old_cost = caller_cost.cost.copy()
+		changed_nodes = caller_cost.update([1, 4], [0.3, 0.02])
+		self.check_incremental(compiled_graph, old_cost, caller_cost.cost, 0.2, changed_nodes)
+
+		result = random_termination_pipeline(compiled_graph, callers, probabilities, cost_spec, 0.2)
+		reweighted = result.reweight([1, 4], [0.3, 0.02])
+		self.assertEqual(reweighted.expected_cost.tolist(),
+			random_termination_arrays(compiled_graph, caller_cost.cost, 0.2)[0].tolist())
+
+if __name__ == '__main__':
+	unittest.main()
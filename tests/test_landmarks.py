@@ -0,0 +1,65 @@
+import unittest
+
+import numpy as np
+
+from compiled_graph import compile_graph, compiled_grid_graph
+from graph_utilities import distance_matrix_cost
+from landmarks import build_landmarks, landmark_cost
+from small_graphs import random_graph
+
+class LandmarkCostTest(unittest.TestCase):
+
+	def setUp(self):
+		self.compiled_graph = compiled_grid_graph(30, 30)
+		self.landmarks = build_landmarks(self.compiled_graph, 8, seed=0)
+		random_state = np.random.RandomState(0)
+		self.callers = random_state.randint(0, self.compiled_graph.n_nodes, 100)
+		self.probabilities = random_state.random_sample(100)
+		self.probabilities /= self.probabilities.sum()
+		self.distances = self.compiled_graph.distances_from(self.callers)
+
+	def test_bounds_hold(self):
+		lower, upper = self.landmarks.bounds(self.callers)
+		self.assertTrue((lower <= self.distances*(1 + 1e-12)).all())
+		self.assertTrue((upper >= self.distances*(1 - 1e-12)).all())
+
+	def test_exceeding_distance_is_exact(self):
+		cost_spec = { 'cost': 'exceeding_distance', 'allowed_distance': 8.0 }
+		cost, cost_error, exact_callers = landmark_cost(self.landmarks, self.callers, self.probabilities,
+			cost_spec, chunk_size=16)
+		exact_cost = distance_matrix_cost(self.distances, self.probabilities, cost_spec)
+		self.assertTrue(np.allclose(cost, exact_cost, rtol=0, atol=1e-12))
+		self.assertEqual(cost_error.max(), 0.0)
+
+	def test_expected_value_within_tolerance(self):
+		cost_spec = { 'cost': 'expected_value' }
+		exact_cost = distance_matrix_cost(self.distances, self.probabilities, cost_spec)
+		searched_fractions = []
+		for tolerance in (0.0, 0.05, 0.2):
+			cost, cost_error, exact_callers = landmark_cost(self.landmarks, self.callers, self.probabilities,
+				cost_spec, tolerance, chunk_size=16)
+			error = np.abs(cost - exact_cost)
+			self.assertTrue((error <= cost_error + 1e-9).all())
+			self.assertTrue((cost_error <= tolerance*cost*(1 + 1e-9) + 1e-9).all())
+			searched_fractions.append(len(exact_callers)/float(len(self.callers)))
+		# the fraction of callers searched at all: 0.97, 0.69 and 0.02 here
+		self.assertTrue(searched_fractions[0] >= searched_fractions[1] >= searched_fractions[2])
+		self.assertLess(searched_fractions[1], 0.8)
+		self.assertLess(searched_fractions[2], 0.1)
+
+	def test_unreachable_pairs(self):
+		compiled_graph = compile_graph(random_graph(40, 120, seed=5))
+		landmarks = build_landmarks(compiled_graph, 4, seed=0)
+		callers = np.arange(0, 40, 4)
+		probabilities = np.ones(len(callers))/len(callers)
+		distances = compiled_graph.distances_from(callers)
+		cost, cost_error, _ = landmark_cost(landmarks, callers, probabilities, { 'cost': 'expected_value' })
+		exact_cost = distance_matrix_cost(distances, probabilities, { 'cost': 'expected_value' })
+		# a few nodes here cannot reach every caller
+		self.assertTrue(0 < np.isinf(exact_cost).sum() < len(exact_cost))
+		self.assertEqual(np.isinf(cost).tolist(), np.isinf(exact_cost).tolist())
+		finite = np.isfinite(exact_cost)
+		self.assertTrue((np.abs(cost[finite] - exact_cost[finite]) <= cost_error[finite] + 1e-9).all())
+
+if __name__ == '__main__':
+	unittest.main()
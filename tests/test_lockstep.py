@@ -0,0 +1,49 @@
+import unittest
+
+import numpy as np
+
+from random_termination import edge_termination_probabilities, random_termination_arrays, \
+	random_termination_lockstep, random_termination_single_cost_edgelist
+from small_graphs import random_graph, random_cost, compiled_problem
+
+class LockstepSolverTest(unittest.TestCase):
+
+	def scenarios(self, seed, n_scenarios=4):
+		graph = random_graph(60, 180, seed)
+		costs = [ random_cost(graph, 100*seed + i) for i in range(n_scenarios) ]
+		compiled_graph, _ = compiled_problem(graph, costs[0])
+		cost_arrays = np.column_stack([ compiled_graph.cost_array(cost) for cost in costs ])
+		return graph, costs, compiled_graph, cost_arrays
+
+	def test_matches_heap_solvers(self):
+		for seed in range(5):
+			graph, costs, compiled_graph, cost_arrays = self.scenarios(seed)
+			expected_cost, next_node = random_termination_lockstep(compiled_graph, cost_arrays, 0.15)
+			for i, cost in enumerate(costs):
+				heap_expected_cost, heap_next_node = random_termination_arrays(compiled_graph, cost_arrays[:,i], 0.15)
+				self.assertEqual(expected_cost[:,i].tolist(), heap_expected_cost.tolist())
+				finite = np.isfinite(heap_expected_cost)
+				self.assertEqual(next_node[finite,i].tolist(), heap_next_node[finite].tolist())
+				dict_expected_cost, _ = random_termination_single_cost_edgelist(graph, cost, 0.15)
+				self.assertEqual(compiled_graph.to_node_dict(expected_cost[:,i]), dict_expected_cost)
+
+	def test_single_scenario(self):
+		graph, costs, compiled_graph, cost_arrays = self.scenarios(seed=1, n_scenarios=1)
+		expected_cost, next_node = random_termination_lockstep(compiled_graph, cost_arrays[:,0], 0.15)
+		self.assertEqual(expected_cost.shape, (compiled_graph.n_nodes,))
+		self.assertEqual(expected_cost.tolist(), random_termination_arrays(compiled_graph, cost_arrays[:,0], 0.15)[0].tolist())
+
+	def test_per_edge_and_per_scenario_probabilities(self):
+		graph, costs, compiled_graph, cost_arrays = self.scenarios(seed=2, n_scenarios=3)
+		rates = [0.05, 0.1, 0.3]
+		p = np.column_stack([ edge_termination_probabilities(compiled_graph, rate) for rate in rates ])
+		expected_cost, _ = random_termination_lockstep(compiled_graph, cost_arrays, p)
+		shared_p_expected_cost, _ = random_termination_lockstep(compiled_graph, cost_arrays, p[:,0])
+		for i, rate in enumerate(rates):
+			heap_expected_cost, _ = random_termination_arrays(compiled_graph, cost_arrays[:,i], p[:,i])
+			self.assertEqual(expected_cost[:,i].tolist(), heap_expected_cost.tolist())
+			heap_expected_cost, _ = random_termination_arrays(compiled_graph, cost_arrays[:,i], p[:,0])
+			self.assertEqual(shared_p_expected_cost[:,i].tolist(), heap_expected_cost.tolist())
+
+if __name__ == '__main__':
+	unittest.main()
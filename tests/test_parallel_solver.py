@@ -0,0 +1,45 @@
+import unittest
+
+import numpy as np
+
+import parallel_solver
+from parallel_solver import random_termination_parallel
+from random_termination import edge_termination_probabilities, random_termination_arrays, \
+	random_termination_single_cost_edgelist
+from small_graphs import random_graph, random_cost, compiled_problem
+
+class ParallelSolverTest(unittest.TestCase):
+
+	def setUp(self):
+		# send even these small frontiers to the pool
+		self.min_parallel_edges = parallel_solver.MIN_PARALLEL_EDGES
+		parallel_solver.MIN_PARALLEL_EDGES = 0
+
+	def tearDown(self):
+		parallel_solver.MIN_PARALLEL_EDGES = self.min_parallel_edges
+
+	def test_matches_array_and_dict_solvers(self):
+		for seed in range(6):
+			graph = random_graph(80, 320, seed)
+			cost = random_cost(graph, seed)
+			compiled_graph, cost_array = compiled_problem(graph, cost)
+			expected_cost, next_node = random_termination_arrays(compiled_graph, cost_array, 0.2)
+			dict_expected_cost, _ = random_termination_single_cost_edgelist(graph, cost, 0.2)
+			for processes, delta in [(1, None), (2, None), (2, 0.5), (1, 1e-3)]:
+				parallel_expected_cost, parallel_next_node = random_termination_parallel(compiled_graph, cost_array,
+					0.2, processes, delta)
+				self.assertEqual(parallel_expected_cost.tolist(), expected_cost.tolist())
+				self.assertEqual(compiled_graph.to_node_dict(parallel_expected_cost), dict_expected_cost)
+				finite = np.isfinite(expected_cost)
+				self.assertEqual(parallel_next_node[finite].tolist(), next_node[finite].tolist())
+
+	def test_per_edge_probabilities(self):
+		graph = random_graph(80, 320, seed=3)
+		compiled_graph, cost = compiled_problem(graph, random_cost(graph, seed=3))
+		p = edge_termination_probabilities(compiled_graph, 0.1)
+		expected_cost, next_node = random_termination_arrays(compiled_graph, cost, p)
+		parallel_expected_cost, parallel_next_node = random_termination_parallel(compiled_graph, cost, p, 2)
+		self.assertEqual(parallel_expected_cost.tolist(), expected_cost.tolist())
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+import networkx as nx
+import numpy as np
+
+from random_termination import _plateaus, edge_termination_probabilities, random_termination_arrays, \
+	random_termination_single_cost_edgelist
+from small_graphs import compiled_problem, random_graph
+from solver_stats import SolverStats
+
+class PlateauTest(unittest.TestCase):
+
+	def stepped_grid(self, size, step):
+		""" a grid with a cost that rises in steps with the distance from its
+			middle, as exceeding_distance does from a caller """
+		graph = nx.grid_2d_graph(size, size).to_directed()
+		for u, v, data in graph.edges(data=True):
+			data['weight'] = 1.0
+		middle = (size - 1)/2.0
+		cost = { node: float(np.floor(np.hypot(node[0] - middle, node[1] - middle)/step)) for node in graph.nodes() }
+		return graph, cost
+
+	def test_plateaus_group_equal_local_minima(self):
+		graph = random_graph(80, 200, seed=3)
+		cost = { node: float(node % 3) for node in graph.nodes() }
+		compiled_graph, cost_array = compiled_problem(graph, cost)
+		local_minima = compiled_graph.local_minima(cost_array)
+		seeds, plateau_of, plateau_members = _plateaus(compiled_graph, cost_array, local_minima)
+		self.assertTrue(plateau_members)
+		for plateau, members in enumerate(plateau_members):
+			self.assertGreater(len(members), 1)
+			self.assertEqual(len(set(cost_array[members].tolist())), 1)
+			self.assertEqual(plateau_of[members].tolist(), [plateau]*len(members))
+			self.assertIn(members[0], seeds)
+			self.assertEqual(len(set(members.tolist()) & set(seeds.tolist())), 1)
+		# every local minimum is a seed or in a plateau, and nothing else is
+		in_plateau = set(np.flatnonzero(plateau_of >= 0).tolist())
+		self.assertEqual(in_plateau | set(seeds.tolist()), set(local_minima.tolist()))
+
+	def test_compressed_matches_uncompressed(self):
+		graph, cost = self.stepped_grid(25, 3.0)
+		compiled_graph, cost_array = compiled_problem(graph, cost)
+		dict_expected_cost, _ = random_termination_single_cost_edgelist(graph, cost, 0.1)
+		solutions = []
+		for compress_plateaus in (True, False):
+			stats = SolverStats()
+			expected_cost, next_node = random_termination_arrays(compiled_graph, cost_array, 0.1, stats=stats,
+				compress_plateaus=compress_plateaus)
+			self.assertEqual(compiled_graph.to_node_dict(expected_cost), dict_expected_cost)
+			self.assertEqual(stats.accepted, compiled_graph.n_nodes)
+			solutions.append((expected_cost, stats.heap.pushes))
+		(compressed, compressed_pushes), (uncompressed, uncompressed_pushes) = solutions
+		self.assertEqual(compressed.tolist(), uncompressed.tolist())
+		self.assertLess(compressed_pushes, uncompressed_pushes)
+
+	def test_per_edge_probabilities(self):
+		graph, cost = self.stepped_grid(15, 2.0)
+		for u, v, data in graph.edges(data=True):
+			data['weight'] = 1.0 + 0.1*((u[0] + v[1]) % 4)
+		compiled_graph, cost_array = compiled_problem(graph, cost)
+		p = edge_termination_probabilities(compiled_graph, 0.1)
+		compressed, _ = random_termination_arrays(compiled_graph, cost_array, p)
+		uncompressed, _ = random_termination_arrays(compiled_graph, cost_array, p, compress_plateaus=False)
+		self.assertEqual(compressed.tolist(), uncompressed.tolist())
+
+	def test_member_lowered_before_its_plateau(self):
+		# a and b are a plateau of cost 5, but b moves through y down to z,
+		#    so it is lowered and leaves the plateau before 5 is reached
+		graph = nx.DiGraph([('a', 'b'), ('b', 'a'), ('b', 'y'), ('y', 'z')])
+		cost = { 'a': 5.0, 'b': 5.0, 'y': 6.0, 'z': 0.0 }
+		compiled_graph, cost_array = compiled_problem(graph, cost)
+		_, _, plateau_members = _plateaus(compiled_graph, cost_array, compiled_graph.local_minima(cost_array))
+		self.assertEqual(len(plateau_members), 1)
+		dict_expected_cost, _ = random_termination_single_cost_edgelist(graph, cost, 0.1)
+		self.assertLess(dict_expected_cost['b'], 5.0)
+		self.assertLess(dict_expected_cost['a'], 5.0)
+		for compress_plateaus in (True, False):
+			expected_cost, next_node = random_termination_arrays(compiled_graph, cost_array, 0.1,
+				compress_plateaus=compress_plateaus)
+			self.assertEqual(compiled_graph.to_node_dict(expected_cost), dict_expected_cost)
+			self.assertEqual(compiled_graph.node_id(next_node[compiled_graph.node_index['a']]), 'b')
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+import networkx as nx
+import numpy as np
+
+from compiled_graph import compile_graph
+from random_termination import edge_termination_probabilities, random_termination_arrays, \
+	random_termination_profiles, random_termination_single_cost_edgelist_continuous_call_probability
+from small_graphs import random_graph, random_cost
+
+PROFILES = ['weight', 'evening', 'night']
+
+class ProfilesSolverTest(unittest.TestCase):
+
+	def profiled_graph(self, seed):
+		graph = random_graph(50, 150, seed)
+		for u, v, data in graph.edges(data=True):
+			data['evening'] = 2*data['weight']
+			data['night'] = 0.5*data['weight'] + 0.25*((u + v) % 3)
+		return graph, compile_graph(graph, profiles=PROFILES)
+
+	def test_matches_single_profile_solvers(self):
+		rate = 0.1
+		for seed in range(4):
+			graph, compiled_graph = self.profiled_graph(seed)
+			cost = random_cost(graph, seed)
+			cost_array = compiled_graph.cost_array(cost)
+			expected_cost, next_node = random_termination_profiles(compiled_graph, cost_array, rate)
+			self.assertEqual(expected_cost.shape, (compiled_graph.n_nodes, len(PROFILES)))
+			for k, profile in enumerate(PROFILES):
+				profile_graph = compiled_graph.with_profile(k)
+				p = edge_termination_probabilities(profile_graph, rate)
+				profile_expected_cost, profile_next_node = random_termination_arrays(profile_graph, cost_array, p)
+				self.assertEqual(expected_cost[:,k].tolist(), profile_expected_cost.tolist())
+				finite = np.isfinite(profile_expected_cost)
+				self.assertEqual(next_node[finite,k].tolist(), profile_next_node[finite].tolist())
+
+				weighted_graph = nx.DiGraph()
+				weighted_graph.add_nodes_from(graph.nodes())
+				weighted_graph.add_weighted_edges_from((u, v, data[profile]) for u, v, data in graph.edges(data=True))
+				dict_expected_cost, _ = random_termination_single_cost_edgelist_continuous_call_probability(
+					weighted_graph, cost, rate)
+				self.assertEqual(compiled_graph.to_node_dict(expected_cost[:,k]), dict_expected_cost)
+
+	def test_cost_per_profile(self):
+		graph, compiled_graph = self.profiled_graph(7)
+		costs = np.column_stack([ compiled_graph.cost_array(random_cost(graph, 70 + k)) for k in range(len(PROFILES)) ])
+		expected_cost, _ = random_termination_profiles(compiled_graph, costs, 0.2, model='exponential')
+		for k in range(len(PROFILES)):
+			profile_graph = compiled_graph.with_profile(k)
+			p = edge_termination_probabilities(profile_graph, 0.2, model='exponential')
+			profile_expected_cost, _ = random_termination_arrays(profile_graph, costs[:,k], p)
+			self.assertEqual(expected_cost[:,k].tolist(), profile_expected_cost.tolist())
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+import numpy as np
+
+from compiled_graph import compiled_grid_graph
+from multilevel import coarsen_by_cells, random_termination_multilevel
+from random_termination import edge_termination_probabilities, random_termination_arrays, random_termination_refine
+from small_graphs import random_graph, random_cost, compiled_problem
+
+def grid_cost(n, seed):
+	""" a smooth cost on an n by n grid: the mean distance to a few random
+		points, so that coarse cells hold nodes of about the same cost """
+	random_state = np.random.RandomState(seed)
+	points = random_state.uniform(0, n, size=(4, 2))
+	rows, columns = np.divmod(np.arange(n*n), n)
+	return np.sqrt((columns[:,None] - points[:,0])**2 + (rows[:,None] - points[:,1])**2).mean(axis=1)
+
+class RefineTest(unittest.TestCase):
+
+	def test_converges_to_exact_values(self):
+		for seed in range(5):
+			graph = random_graph(60, 180, seed)
+			compiled_graph, cost = compiled_problem(graph, random_cost(graph, seed))
+			exact_expected_cost, exact_next_node = random_termination_arrays(compiled_graph, cost, 0.2)
+			random_state = np.random.RandomState(seed)
+			for warm_start in (cost, exact_expected_cost + random_state.uniform(0, 1, len(cost))):
+				expected_cost, next_node, report = random_termination_refine(compiled_graph, cost, 0.2, warm_start,
+					max_iterations=1000)
+				self.assertEqual(report['change'], 0.0)
+				self.assertEqual(expected_cost.tolist(), exact_expected_cost.tolist())
+				finite = np.isfinite(exact_expected_cost)
+				self.assertEqual(next_node[finite].tolist(), exact_next_node[finite].tolist())
+
+	def test_error_bound_holds(self):
+		graph = random_graph(60, 180, seed=2)
+		compiled_graph, cost = compiled_problem(graph, random_cost(graph, seed=2))
+		p = edge_termination_probabilities(compiled_graph, 0.3)
+		exact_expected_cost, _ = random_termination_arrays(compiled_graph, cost, p)
+		finite = np.isfinite(exact_expected_cost)
+		for max_iterations in (1, 2, 4, 8):
+			expected_cost, _, report = random_termination_refine(compiled_graph, cost, p, cost, max_iterations)
+			self.assertLessEqual(report['iterations'], max_iterations)
+			error = np.abs(expected_cost[finite] - exact_expected_cost[finite]).max()
+			self.assertLessEqual(error, report['error_bound'] + 1e-12)
+
+class MultilevelTest(unittest.TestCase):
+
+	def test_coarsen_by_cells(self):
+		compiled_graph = compiled_grid_graph(8, 8)
+		coarse_graph, cluster = coarsen_by_cells(compiled_graph, 2.0)
+		self.assertEqual(coarse_graph.n_nodes, 16)
+		# each coarse node is joined to its eight neighbouring cells
+		self.assertEqual(coarse_graph.n_edges, compiled_grid_graph(4, 4).n_edges)
+		self.assertEqual(np.bincount(cluster).tolist(), [4]*16)
+
+	def test_matches_exact_solve(self):
+		compiled_graph = compiled_grid_graph(40, 40)
+		cost = grid_cost(40, seed=0)
+		exact_expected_cost, _ = random_termination_arrays(compiled_graph, cost, 0.1)
+		expected_cost, next_node, report = random_termination_multilevel(compiled_graph, cost, 0.1, [8.0, 4.0],
+			refinement_iterations=2000, exact=True)
+		self.assertEqual([ level['n_nodes'] for level in report['levels'] ], [25, 100, 1600])
+		self.assertEqual(report['levels'][-1]['change'], 0.0)
+		self.assertEqual(expected_cost.tolist(), exact_expected_cost.tolist())
+		self.assertEqual(report['max_abs_error'], 0.0)
+
+	def test_reports_error_within_bound(self):
+		compiled_graph = compiled_grid_graph(40, 40)
+		cost = grid_cost(40, seed=1)
+		expected_cost, next_node, report = random_termination_multilevel(compiled_graph, cost, 0.1, [8.0],
+			refinement_iterations=5, exact=True)
+		self.assertLessEqual(report['max_abs_error'], report['levels'][-1]['error_bound'] + 1e-12)
+		self.assertGreater(report['policy_agreement'], 0.5)
+
+if __name__ == '__main__':
+	unittest.main()
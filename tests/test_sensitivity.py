@@ -0,0 +1,71 @@
+import unittest
+
+import networkx as nx
+import numpy as np
+
+from random_termination import random_termination_arrays
+from small_graphs import random_graph, random_cost, compiled_problem
+
+def motion_cost(cost, expected_cost, p):
+	""" the expected cost of moving to a node, as the solvers compute it """
+	if cost == expected_cost:
+		return cost
+	return max(p*cost + (1-p)*expected_cost, expected_cost)
+
+def brute_force_margin(compiled_graph, cost, expected_cost, p):
+	""" the margin of every node, from all of its choices: staying put, or
+		moving to any one of its successors """
+	margin = np.empty(compiled_graph.n_nodes)
+	for node in range(compiled_graph.n_nodes):
+		choices = sorted([ float(cost[node]) ] + [ motion_cost(float(cost[successor]), float(expected_cost[successor]), p)
+			for successor in compiled_graph.successors(node).tolist() ])
+		if np.isinf(expected_cost[node]):
+			margin[node] = np.nan
+		elif len(choices) == 1:
+			margin[node] = np.inf
+		else:
+			margin[node] = choices[1] - choices[0]
+	return margin
+
+class SensitivityTest(unittest.TestCase):
+
+	def test_runner_up_kept_when_a_worse_move_comes_first(self):
+		# x first hears of moving to y (expected cost 5, worse than staying
+		#    at 3), then of moving to z (2): its runner-up is staying, not y
+		graph = nx.DiGraph([('y', 'w'), ('x', 'y'), ('x', 'z')])
+		cost = { 'w': 0.0, 'y': 10.0, 'z': 2.0, 'x': 3.0 }
+		compiled_graph, cost_array = compiled_problem(graph, cost)
+		expected_cost, next_node, derivative, margin = random_termination_arrays(compiled_graph, cost_array, 0.5,
+			sensitivity=True)
+		x = compiled_graph.node_index['x']
+		self.assertEqual(expected_cost[x], 2.0)
+		self.assertEqual(margin[x], 1.0)
+		np.testing.assert_array_equal(margin, brute_force_margin(compiled_graph, cost_array, expected_cost, 0.5))
+
+	def test_margin_matches_brute_force(self):
+		for seed in range(10):
+			graph = random_graph(50, 150, seed)
+			compiled_graph, cost = compiled_problem(graph, random_cost(graph, seed, levels=None if seed % 2 else 6))
+			for compress_plateaus in (True, False):
+				expected_cost, next_node, derivative, margin = random_termination_arrays(compiled_graph, cost, 0.3,
+					sensitivity=True, compress_plateaus=compress_plateaus)
+				np.testing.assert_array_equal(margin, brute_force_margin(compiled_graph, cost, expected_cost, 0.3))
+
+	def test_derivative_matches_finite_difference(self):
+		p, step = 0.3, 1e-6
+		for seed in range(5):
+			graph = random_graph(50, 150, seed)
+			compiled_graph, cost = compiled_problem(graph, random_cost(graph, seed))
+			expected_cost, next_node, derivative, margin = random_termination_arrays(compiled_graph, cost, p,
+				sensitivity=True)
+			above, above_next_node = random_termination_arrays(compiled_graph, cost, p + step)
+			below, below_next_node = random_termination_arrays(compiled_graph, cost, p - step)
+			# where the policy is the same on both sides, V is linear in p
+			#    along it up to the curvature of (1-p)**k
+			same_policy = np.isfinite(expected_cost) & (above_next_node == next_node) & (below_next_node == next_node)
+			self.assertGreater(same_policy.sum(), 0)
+			finite_difference = (above - below)/(2*step)
+			self.assertTrue(np.allclose(derivative[same_policy], finite_difference[same_policy], rtol=1e-5, atol=1e-6))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import networkx as nx
+import numpy as np
+
+from compiled_graph import compile_graph
+from random_termination import random_termination_arrays, random_termination_single_cost_edgelist
+from small_graphs import compiled_problem, edgelist_dict, random_cost, random_graph
+from solver_results import load_solver_result, solver_result_from_arrays, solver_result_from_dicts
+
+class SolverResultTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_save_load_round_trip(self):
+		graph = random_graph(40, 120, seed=1)
+		compiled_graph, cost = compiled_problem(graph, random_cost(graph, seed=1))
+		expected_cost, next_node = random_termination_arrays(compiled_graph, cost, 0.2)
+		spec = {'cost': 'exceeding_distance', 'allowed_distance': 3.5}
+		result = solver_result_from_arrays(compiled_graph, expected_cost, next_node, 0.2, spec, label='test')
+		result.save(self.directory)
+
+		loaded = load_solver_result(self.directory, compiled_graph=compiled_graph)
+		self.assertIsInstance(loaded.expected_cost, np.memmap)
+		self.assertIsInstance(loaded.next_node, np.memmap)
+		self.assertEqual(loaded.expected_cost.tolist(), expected_cost.tolist())
+		self.assertEqual(loaded.next_node.tolist(), next_node.tolist())
+		self.assertEqual(loaded.metadata['cost_spec'], spec)
+		self.assertEqual(loaded.metadata['label'], 'test')
+		self.assertEqual(loaded.metadata['graph_fingerprint'], compiled_graph.fingerprint())
+
+		in_memory = load_solver_result(self.directory, mmap_mode=None)
+		self.assertNotIsInstance(in_memory.expected_cost, np.memmap)
+		self.assertEqual(in_memory.expected_cost_dict(), compiled_graph.to_node_dict(expected_cost))
+
+	def test_dict_solver_object_labels(self):
+		# string and tuple labels make an object node_ids array, which is
+		#    stored as json rather than pickled
+		graph = nx.DiGraph()
+		graph.add_weighted_edges_from([('a', ('b', 1), 1.0), (('b', 1), 'c', 1.0), ('c', 'a', 2.0), ('d', 'c', 1.0)])
+		cost = { 'a': 3.0, ('b', 1): 2.0, 'c': 0.5, 'd': 4.0 }
+		compiled_graph = compile_graph(graph)
+		self.assertEqual(np.asarray(compiled_graph.node_ids).dtype, object)
+		expected_cost, edgelist = random_termination_single_cost_edgelist(graph, cost, 0.3)
+		result = solver_result_from_dicts(compiled_graph, expected_cost, edgelist, 0.3, {'cost': 'given'})
+		result.save(self.directory)
+		self.assertFalse(os.path.exists(os.path.join(self.directory, 'node_ids.npy')))
+
+		loaded = load_solver_result(self.directory, compiled_graph=compiled_graph)
+		self.assertEqual(loaded.expected_cost_dict(), expected_cost)
+		self.assertEqual(dict(loaded.edgelist()), dict(edgelist))
+		self.assertEqual(edgelist_dict(graph, loaded.edgelist()), edgelist_dict(graph, edgelist))
+
+	def test_multiple_criteria(self):
+		graph = random_graph(20, 60, seed=2)
+		compiled_graph = compile_graph(graph)
+		expected_cost = np.arange(2.0*compiled_graph.n_nodes).reshape(-1, 2)
+		next_node = -np.ones(compiled_graph.n_nodes, dtype=np.int64)
+		solver_result_from_arrays(compiled_graph, expected_cost, next_node, 0.1, {'cost': 'double'}).save(self.directory)
+		loaded = load_solver_result(self.directory)
+		self.assertEqual(loaded.expected_cost.shape, (compiled_graph.n_nodes, 2))
+		self.assertEqual(loaded.expected_cost.tolist(), expected_cost.tolist())
+		self.assertEqual(loaded.edgelist(), [])
+
+	def test_other_graph_refused(self):
+		graph = random_graph(20, 60, seed=3)
+		compiled_graph, cost = compiled_problem(graph, random_cost(graph, seed=3))
+		expected_cost, next_node = random_termination_arrays(compiled_graph, cost, 0.2)
+		solver_result_from_arrays(compiled_graph, expected_cost, next_node, 0.2, {'cost': 'given'}).save(self.directory)
+		other_graph = random_graph(20, 60, seed=4)
+		with self.assertRaises(ValueError):
+			load_solver_result(self.directory, compiled_graph=compile_graph(other_graph))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,131 @@
+import json
+import threading
+import time
+import unittest
+try:
+	from urllib2 import Request, HTTPError, urlopen
+except ImportError:
+	from urllib.request import Request, urlopen
+	from urllib.error import HTTPError
+
+import numpy as np
+
+import solver_service
+from batch_worker import ScenarioSolver
+from compiled_graph import compile_graph
+from small_graphs import random_graph
+from solver_service import SolverService, make_server, scenario_key
+
+class FailingService(object):
+	""" stands in for a SolverService whose solves fail """
+	def __init__(self, error):
+		self.error = error
+
+	def answer(self, request):
+		raise self.error
+
+class SolverServiceTest(unittest.TestCase):
+
+	def setUp(self):
+		solver_service.logger.disabled = True
+
+	def tearDown(self):
+		solver_service.logger.disabled = False
+
+	def scenario(self, i):
+		return { 'callers': [i, i + 10], 'probabilities': [0.5, 0.5], 'cost': 'expected_value', 'p': 0.2 }
+
+	def service(self, cache_size=128):
+		compiled_graph = compile_graph(random_graph(30, 120, seed=5))
+		service = SolverService(compiled_graph, processes=1, cache_size=cache_size)
+		self.addCleanup(service.close)
+		return service
+
+	def post(self, service, body, path='/solve'):
+		server = make_server(service, ('127.0.0.1', 0))
+		thread = threading.Thread(target=server.serve_forever)
+		thread.start()
+		try:
+			url = "http://127.0.0.1:%d%s" % (server.server_address[1], path)
+			request = Request(url) if body is None else Request(url, json.dumps(body).encode('utf-8'),
+				{ 'Content-Type': 'application/json' })
+			try:
+				response = urlopen(request)
+				return response.getcode(), json.loads(response.read().decode('utf-8'))
+			except HTTPError as error:
+				return error.code, json.loads(error.read().decode('utf-8'))
+		finally:
+			server.shutdown()
+			server.server_close()
+			thread.join()
+
+	def test_bad_request(self):
+		status, body = self.post(FailingService(KeyError('callers')), {})
+		self.assertEqual(status, 400)
+		self.assertIn('KeyError', body['error'])
+
+	def test_failed_solve_answers_500(self):
+		status, body = self.post(FailingService(RuntimeError('worker died')), {})
+		self.assertEqual(status, 500)
+		self.assertEqual(body['error'], "RuntimeError: worker died")
+
+	def test_scenario_key_ignores_caller_order(self):
+		scenario = { 'callers': [3, 1], 'probabilities': [0.25, 0.75], 'cost': 'expected_value', 'p': 0.2 }
+		reordered = { 'callers': [1, 3], 'probabilities': [0.75, 0.25], 'cost': 'expected_value', 'p': 0.2 }
+		self.assertEqual(scenario_key(scenario), scenario_key(reordered))
+		self.assertNotEqual(scenario_key(scenario), scenario_key(dict(scenario, p=0.3)))
+
+	def test_concurrent_requests_coalesced(self):
+		service = self.service()
+		# the one worker is kept busy while the requests come in, so they
+		#    all find the first one's solve still in flight
+		busy = service.pool.apply_async(time.sleep, (1.0,))
+		solutions = [None]*6
+		def ask(i):
+			solutions[i] = service.solution(self.scenario(1))
+		threads = [ threading.Thread(target=ask, args=(i,)) for i in range(len(solutions)) ]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		busy.get()
+		self.assertEqual(service.counters, { 'solves': 1, 'cache_hits': 0, 'coalesced': 5 })
+		self.assertEqual(service.in_flight, {})
+
+		expected = ScenarioSolver(service.compiled_graph).solve(self.scenario(1))
+		for expected_cost, next_node in solutions:
+			self.assertEqual(expected_cost.tolist(), expected.expected_cost.tolist())
+			self.assertEqual(next_node.tolist(), expected.next_node.tolist())
+
+		service.solution(self.scenario(1))
+		self.assertEqual(service.counters, { 'solves': 1, 'cache_hits': 1, 'coalesced': 5 })
+
+	def test_cache_evicts_least_recently_used(self):
+		service = self.service(cache_size=2)
+		for i in (1, 2, 3):
+			service.solution(self.scenario(i))
+		self.assertEqual(list(service.cache), [ scenario_key(self.scenario(i)) for i in (2, 3) ])
+		service.solution(self.scenario(2))
+		service.solution(self.scenario(4))
+		self.assertEqual(list(service.cache), [ scenario_key(self.scenario(i)) for i in (2, 4) ])
+		service.solution(self.scenario(3))
+		self.assertEqual(service.counters, { 'solves': 5, 'cache_hits': 1, 'coalesced': 0 })
+
+	def test_answer_and_stats(self):
+		service = self.service()
+		status, body = self.post(service, dict(self.scenario(1), node=5))
+		self.assertEqual(status, 200)
+		expected = ScenarioSolver(service.compiled_graph).solve(self.scenario(1))
+		self.assertEqual(body['expected_cost'], float(expected.expected_cost[5]))
+		self.assertEqual(body['path'][0], 5)
+		self.assertEqual(body['staging_node'], body['path'][-1])
+		self.assertEqual(expected.next_node[body['staging_node']], -1)
+
+		status, body = self.post(service, self.scenario(1))
+		self.assertEqual(body['staging_node'], int(np.argmin(expected.expected_cost)))
+		status, stats = self.post(service, None, '/stats')
+		self.assertEqual(status, 200)
+		self.assertEqual(stats, { 'solves': 1, 'cache_hits': 1, 'coalesced': 0, 'cached': 1, 'in_flight': 0 })
+
+if __name__ == '__main__':
+	unittest.main()
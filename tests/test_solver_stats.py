@@ -0,0 +1,35 @@
+import unittest
+
+import numpy as np
+
+from random_termination import random_termination_arrays, random_termination_single_cost_edgelist
+from solver_stats import SolverStats
+from small_graphs import random_graph, random_cost, compiled_problem
+
+class SolverStatsTest(unittest.TestCase):
+
+	def test_phases_stopped_after_solve(self):
+		graph = random_graph(40, 100, seed=3)
+		cost = random_cost(graph, seed=3)
+		stats = SolverStats()
+		random_termination_single_cost_edgelist(graph, cost, 0.2, stats=stats)
+		self.assertIsNone(stats._phase)
+		self.assertEqual(list(stats.phase_times), ['predecessor_sets', 'local_minima', 'sweep'])
+		self.assertEqual(stats.accepted, graph.number_of_nodes())
+
+	def test_phase_stopped_when_solver_raises(self):
+		graph = random_graph(40, 100, seed=3)
+		cost = random_cost(graph, seed=3)
+		del cost[0]
+		stats = SolverStats()
+		self.assertRaises(KeyError, random_termination_single_cost_edgelist, graph, cost, 0.2, stats)
+		self.assertIsNone(stats._phase)
+
+		compiled_graph, _ = compiled_problem(graph, random_cost(graph, seed=3))
+		stats = SolverStats()
+		with self.assertRaises(IndexError):
+			random_termination_arrays(compiled_graph, np.zeros(5), 0.2, stats=stats)
+		self.assertIsNone(stats._phase)
+
+if __name__ == '__main__':
+	unittest.main()